@@ -7,7 +7,7 @@ from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     OrgProfile, ChatLog, Document, Chunk, 
-    AuditLog, UserSettings
+    AuditLog, UserSettings, EmbeddingCacheEntry
 )
 
 
@@ -78,7 +78,7 @@ class DocumentAdmin(admin.ModelAdmin):
 @admin.register(Chunk)
 class ChunkAdmin(admin.ModelAdmin):
     list_display = ['id', 'document', 'ord', 'heading', 'text_preview', 'has_embedding']
-    list_filter = ['document__doctype', 'created_at']
+    list_filter = ['document__doctype', 'embedding_model', 'created_at']
     search_fields = ['text', 'heading', 'document__title']
     readonly_fields = ['created_at']
     
@@ -87,11 +87,18 @@ class ChunkAdmin(admin.ModelAdmin):
     text_preview.short_description = 'Text Preview'
     
     def has_embedding(self, obj):
-        return obj.embedding_json is not None
+        return obj.embedding is not None
     has_embedding.boolean = True
     has_embedding.short_description = 'Embedded'
 
 
+@admin.register(EmbeddingCacheEntry)
+class EmbeddingCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'key', 'last_used_at']
+    search_fields = ['key']
+    readonly_fields = ['key', 'last_used_at']
+
+
 @admin.register(AuditLog)
 class AuditLogAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'action', 'ip_address', 'created_at']
@@ -0,0 +1,602 @@
+# api/inference/batch_engine.py
+import codecs
+import hashlib
+import queue
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Iterator, Sequence
+import numpy as np
+import llama_cpp
+from llama_cpp import Llama
+
+logger = logging.getLogger(__name__)
+
+
+# Prompt prefixes kept resident as their own KV sequences
+MAX_RESIDENT_PREFIXES = 8
+
+# Recent tokens penalised by repeat_penalty (llama-cpp-python's default)
+REPEAT_LAST_N = 64
+
+
+class _Sequence:
+    """One request decoded as a llama.cpp sequence of the shared context"""
+    
+    def __init__(self, tokens: List[int], max_tokens: int, stop: List[str], params: Dict):
+        self.tokens = tokens            # Prompt, then generated tokens
+        self.n_prompt = len(tokens)
+        self.max_tokens = max_tokens
+        self.stop = stop
+        self.params = params
+        self.prefix_ends = []           # Prompt prefixes worth keeping resident
+        self.seq_id = None
+        self.n_past = 0                 # Tokens already in the KV cache
+        self.reserved = 0               # KV cells held for this request
+        self.prefix = None              # Resident prefix it was started from
+        self.text = ''
+        self.sent = 0                   # Characters already streamed
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self.events = queue.Queue()
+        self.cancelled = False
+        self.started_at = time.time()
+        self.rng = np.random.default_rng()
+    
+    @property
+    def n_generated(self) -> int:
+        return len(self.tokens) - self.n_prompt
+
+
+class _ResidentPrefix:
+    """An evaluated prompt prefix held in the KV cache under its own sequence id"""
+    
+    def __init__(self, seq_id: int, tokens: np.ndarray):
+        self.seq_id = seq_id
+        self.tokens = tokens
+        self.users = 0                  # Running requests sharing its cells
+
+
+class BatchedLLMEngine:
+    """
+    LLM engine that decodes concurrent requests together (continuous batching)
+    
+    One background thread owns a Llama context whose KV cache is shared by
+    up to parallel_sequences llama.cpp sequences. Each step packs the next
+    token of every generating request, plus prompt chunks of newly admitted
+    ones, into a single llama_decode batch, so concurrent users share each
+    forward pass instead of taking turns. Requests join and leave between
+    steps, and their tokens are streamed back through a queue per request.
+    
+    A request is admitted once the KV cells it may need (prompt plus
+    max_tokens) are free. Prefixes named in cache_prefixes are kept
+    resident as their own sequences once requested repeatedly, and new
+    requests share their cells through llama_kv_cache_seq_cp instead of
+    evaluating them again.
+    """
+    
+    def __init__(self):
+        self._llm = None
+        self._load_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._active = {}               # seq_id -> _Sequence (decode thread only)
+        self._free_ids = []
+        self._prefixes = OrderedDict()  # token digest -> _ResidentPrefix
+        self._prefix_uses = OrderedDict()
+        self._free_prefix_ids = []
+        self._cells_used = 0
+        self.steps = 0
+        self.tokens_decoded = 0
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+    
+    def load_model(self):
+        """Load the model into a context sized for all sequences and start decoding"""
+        with self._load_lock:
+            if self._llm is not None:
+                return
+            
+            from django.conf import settings
+            
+            model_config = settings.MODEL_CONFIG
+            model_path = model_config.get('model_path')
+            if not model_path:
+                raise ValueError("MODEL_PATH not configured in settings")
+            
+            self.slots = max(1, model_config.get('parallel_sequences', 1))
+            # Each request keeps the single-request context limit
+            self.n_ctx_seq = model_config.get('n_ctx', 4096)
+            self.n_ctx = max(
+                model_config.get('batch_n_ctx') or self.n_ctx_seq * self.slots,
+                self.n_ctx_seq
+            )
+            
+            logger.info(
+                f"Loading model from {model_path} for {self.slots} parallel "
+                f"sequences ({self.n_ctx} KV cells)..."
+            )
+            start_time = time.time()
+            
+            llm = Llama(
+                model_path=model_path,
+                n_ctx=self.n_ctx,
+                n_threads=model_config.get('n_threads', 8),
+                n_gpu_layers=0,
+                verbose=False,
+            )
+            
+            self._n_batch = llm.n_batch
+            self._n_vocab = llm.n_vocab()
+            self._eos = llm.token_eos()
+            self._batch = llama_cpp.llama_batch_init(self._n_batch, 0, 1)
+            self._free_ids = list(range(self.slots - 1, -1, -1))
+            self._free_prefix_ids = list(range(
+                self.slots + MAX_RESIDENT_PREFIXES - 1, self.slots - 1, -1
+            ))
+            self._min_prefix_uses = model_config.get('prefix_cache_min_uses', 2)
+            self._prefix_cache_enabled = model_config.get('prefix_cache_mb', 1024) > 0
+            self._llm = llm
+            
+            threading.Thread(
+                target=self._run, name='llm-batch-decode', daemon=True
+            ).start()
+            
+            logger.info(f"Model loaded successfully in {time.time() - start_time:.2f}s")
+    
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 256,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 50,
+        stop: Optional[list] = None,
+        cache_prefixes: Sequence[str] = (),
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Generate text from prompt (same result as LLMEngine.generate)"""
+        seq = self._submit(prompt, max_tokens, temperature, top_p, top_k, stop, cache_prefixes)
+        
+        while True:
+            kind, value = seq.events.get()
+            if kind == 'done':
+                return value
+            if kind == 'error':
+                raise value
+    
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 256,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 50,
+        stop: Optional[list] = None,
+        cache_prefixes: Sequence[str] = (),
+        **kwargs
+    ) -> Iterator[str]:
+        """Stream generation token by token; closing the iterator frees the sequence"""
+        seq = self._submit(prompt, max_tokens, temperature, top_p, top_k, stop, cache_prefixes)
+        
+        finished = False
+        try:
+            while True:
+                kind, value = seq.events.get()
+                if kind == 'token':
+                    yield value
+                elif kind == 'done':
+                    finished = True
+                    return
+                else:
+                    finished = True
+                    raise value
+        finally:
+            if not finished:
+                seq.cancelled = True
+                with self._cond:
+                    self._cond.notify_all()
+    
+    def _submit(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        top_k: int,
+        stop: Optional[list],
+        cache_prefixes: Sequence[str]
+    ) -> _Sequence:
+        """Tokenize a request and queue it for the decode thread"""
+        self._ensure_loaded()
+        
+        llm = self._llm
+        tokens = llm.tokenize(prompt.encode('utf-8'), special=True)
+        if len(tokens) >= self.n_ctx_seq:
+            raise ValueError(
+                f"Requested tokens ({len(tokens)}) exceed context window of {self.n_ctx_seq}"
+            )
+        
+        if max_tokens is None or max_tokens <= 0 or len(tokens) + max_tokens > self.n_ctx_seq:
+            max_tokens = self.n_ctx_seq - len(tokens)
+        
+        seq = _Sequence(
+            tokens=tokens,
+            max_tokens=max_tokens,
+            stop=[s for s in (stop or []) if s],
+            params={
+                'temperature': temperature,
+                'top_p': top_p,
+                'top_k': top_k,
+                'min_p': 0.05,
+                'repeat_penalty': 1.1,
+            },
+        )
+        
+        if self._prefix_cache_enabled:
+            # The last prompt token is always evaluated, for its logits
+            usable = tokens[:-1]
+            seq.prefix_ends = sorted(set(
+                Llama.longest_token_prefix(
+                    llm.tokenize(prefix.encode('utf-8'), special=True), usable
+                )
+                for prefix in cache_prefixes
+            ) - {0})
+        
+        with self._cond:
+            self._pending.append(seq)
+            self._cond.notify_all()
+        return seq
+    
+    def _ensure_loaded(self):
+        if self._llm is None:
+            self.load_model()
+    
+    def _run(self):
+        """Decode loop: admit waiting requests, then run one batch step"""
+        while True:
+            with self._cond:
+                while not self._active and not self._pending:
+                    self._cond.wait()
+                self._admit()
+                if not self._active:
+                    # Waiting requests were all cancelled, or wait for cells
+                    self._cond.wait(0.05)
+                    continue
+            
+            try:
+                self._step()
+            except Exception as e:
+                logger.error(f"Batch decode error: {e}", exc_info=True)
+                for seq in list(self._active.values()):
+                    self._finish(seq, error=e)
+    
+    def _admit(self):
+        """Start waiting requests, in order, while sequences and KV cells are free (lock held)"""
+        while self._pending and self._free_ids:
+            seq = self._pending[0]
+            if seq.cancelled:
+                self._pending.popleft()
+                continue
+            
+            prefix, matched = self._match_prefix(seq.tokens[:-1])
+            needed = seq.n_prompt - matched + seq.max_tokens
+            
+            while self._cells_used + needed > self.n_ctx and self._evict_prefix(keep=prefix):
+                pass
+            if self._cells_used + needed > self.n_ctx:
+                break
+            
+            self._pending.popleft()
+            seq.seq_id = self._free_ids.pop()
+            seq.reserved = needed
+            self._cells_used += needed
+            
+            if prefix is not None:
+                llama_cpp.llama_kv_cache_seq_cp(
+                    self._llm.ctx, prefix.seq_id, seq.seq_id, 0, matched
+                )
+                prefix.users += 1
+                seq.prefix = prefix
+                seq.n_past = matched
+            
+            self._count_prefix_uses(seq)
+            self._active[seq.seq_id] = seq
+    
+    def _step(self):
+        """Decode one batch: a token per generating request, then prompt chunks"""
+        for seq in list(self._active.values()):
+            if seq.cancelled:
+                self._finish(seq, 'cancelled', notify=False)
+        if not self._active:
+            return
+        
+        # Generating requests first (one pending token each), oldest first
+        ordered = sorted(
+            self._active.values(),
+            key=lambda s: (len(s.tokens) - s.n_past > 1, s.started_at)
+        )
+        
+        rows = self._fill_batch(ordered, prefill=True)
+        result = llama_cpp.llama_decode(self._llm.ctx, self._batch)
+        
+        if result == 1 and any(n > 1 for _, n, _ in rows):
+            # No contiguous KV slot for the prompt chunks; decode without them
+            rows = self._fill_batch(ordered, prefill=False)
+            result = llama_cpp.llama_decode(self._llm.ctx, self._batch)
+        
+        if result == 1:
+            newest = max(self._active.values(), key=lambda s: s.started_at)
+            self._finish(newest, error=RuntimeError("KV cache is full"))
+            return
+        if result != 0:
+            raise RuntimeError(f"llama_decode returned {result}")
+        
+        self.steps += 1
+        self.tokens_decoded += sum(n for _, n, _ in rows)
+        
+        for seq, n_tokens, logits_index in rows:
+            seq.n_past += n_tokens
+            self._keep_prefixes(seq)
+            
+            if logits_index is not None:
+                logits = np.ctypeslib.as_array(
+                    llama_cpp.llama_get_logits_ith(self._llm.ctx, logits_index),
+                    shape=(self._n_vocab,)
+                )
+                self._append_token(seq, self._sample(seq, logits))
+    
+    def _fill_batch(self, ordered: List[_Sequence], prefill: bool) -> List:
+        """
+        Write pending tokens of the sequences into the llama_batch
+        
+        Returns:
+            (sequence, tokens added, batch index of its logits or None) rows
+        """
+        batch = self._batch
+        rows = []
+        n = 0
+        
+        for seq in ordered:
+            pending = len(seq.tokens) - seq.n_past
+            if pending > 1 and not prefill:
+                continue
+            
+            count = min(pending, self._n_batch - n)
+            if count <= 0:
+                break
+            
+            for j in range(count):
+                batch.token[n + j] = seq.tokens[seq.n_past + j]
+                batch.pos[n + j] = seq.n_past + j
+                batch.n_seq_id[n + j] = 1
+                batch.seq_id[n + j][0] = seq.seq_id
+                batch.logits[n + j] = False
+            
+            logits_index = None
+            if count == pending:
+                logits_index = n + count - 1
+                batch.logits[logits_index] = True
+            
+            rows.append((seq, count, logits_index))
+            n += count
+        
+        batch.n_tokens = n
+        return rows
+    
+    def _sample(self, seq: _Sequence, logits: np.ndarray) -> int:
+        """Sample the next token like Llama.sample (repeat penalty, top-k, top-p, min-p, temperature)"""
+        params = seq.params
+        logits = np.array(logits, dtype=np.float32)
+        
+        penalty = params['repeat_penalty']
+        if penalty != 1.0:
+            recent = seq.tokens[-REPEAT_LAST_N:]
+            # Llama pads a short window with token 0, which is penalised too
+            if len(recent) < REPEAT_LAST_N:
+                recent = recent + [0]
+            recent = np.unique(recent)
+            values = logits[recent]
+            logits[recent] = np.where(values > 0, values / penalty, values * penalty)
+        
+        temperature = params['temperature']
+        if temperature <= 0:
+            return int(np.argmax(logits))
+        
+        top_k = params['top_k']
+        k = top_k if 0 < top_k < self._n_vocab else self._n_vocab
+        ids = np.argpartition(-logits, k - 1)[:k]
+        ids = ids[np.argsort(-logits[ids], kind='stable')]
+        values = logits[ids]
+        
+        probs = np.exp(values - values[0])
+        probs /= probs.sum()
+        if params['top_p'] < 1.0:
+            keep = int(np.searchsorted(np.cumsum(probs), params['top_p'])) + 1
+            ids, values, probs = ids[:keep], values[:keep], probs[:keep]
+        if params['min_p'] > 0:
+            keep = probs >= params['min_p'] * probs[0]
+            ids, values = ids[keep], values[keep]
+        
+        probs = np.exp((values - values[0]) / temperature)
+        probs /= probs.sum()
+        return int(seq.rng.choice(ids, p=probs))
+    
+    def _append_token(self, seq: _Sequence, token: int):
+        """Add a sampled token, stream new text and finish on EOS, stop or length"""
+        if token == self._eos:
+            self._finish(seq, 'stop')
+            return
+        
+        seq.tokens.append(token)
+        seq.text += seq.decoder.decode(self._llm.detokenize([token]))
+        
+        for stop in seq.stop:
+            index = seq.text.find(stop, max(0, seq.sent - len(stop)))
+            if index >= 0:
+                seq.text = seq.text[:index]
+                self._finish(seq, 'stop')
+                return
+        
+        if seq.n_generated >= seq.max_tokens:
+            self._finish(seq, 'length')
+            return
+        
+        # Hold back text that could be the start of a stop string
+        hold = max((len(stop) - 1 for stop in seq.stop), default=0)
+        end = max(seq.sent, len(seq.text) - hold)
+        if end > seq.sent:
+            seq.events.put(('token', seq.text[seq.sent:end]))
+            seq.sent = end
+    
+    def _finish(
+        self,
+        seq: _Sequence,
+        finish_reason: Optional[str] = None,
+        error: Optional[Exception] = None,
+        notify: bool = True
+    ):
+        """Free a request's sequence and KV cells and deliver its result"""
+        llama_cpp.llama_kv_cache_seq_rm(self._llm.ctx, seq.seq_id, -1, -1)
+        
+        with self._cond:
+            del self._active[seq.seq_id]
+            self._free_ids.append(seq.seq_id)
+            self._cells_used -= seq.reserved
+            if seq.prefix is not None:
+                seq.prefix.users -= 1
+            self._cond.notify_all()
+        
+        if not notify:
+            return
+        
+        if error is not None:
+            seq.events.put(('error', error))
+            return
+        
+        if len(seq.text) > seq.sent:
+            seq.events.put(('token', seq.text[seq.sent:]))
+            seq.sent = len(seq.text)
+        
+        seq.events.put(('done', {
+            'text': seq.text,
+            'tokens_generated': seq.n_generated,
+            'tokens_prompt': seq.n_prompt,
+            'latency_ms': int((time.time() - seq.started_at) * 1000),
+            'finish_reason': finish_reason,
+        }))
+    
+    @staticmethod
+    def _digest(tokens: Sequence[int]) -> bytes:
+        return hashlib.sha1(np.asarray(tokens, dtype=np.intc).tobytes()).digest()
+    
+    def _match_prefix(self, tokens: Sequence[int]):
+        """Resident prefix sharing the most leading tokens, and that length"""
+        tokens = np.asarray(tokens, dtype=np.intc)
+        best, best_length = None, 0
+        
+        for prefix in self._prefixes.values():
+            n = min(len(prefix.tokens), len(tokens))
+            mismatch = np.flatnonzero(prefix.tokens[:n] != tokens[:n])
+            length = int(mismatch[0]) if len(mismatch) else n
+            if length > best_length:
+                best, best_length = prefix, length
+        
+        if best is not None:
+            self._prefixes.move_to_end(self._digest(best.tokens))
+            self.prefix_hits += 1
+        else:
+            self.prefix_misses += 1
+        return best, best_length
+    
+    def _count_prefix_uses(self, seq: _Sequence):
+        """Keep only the prefixes of seq that have been requested often enough (lock held)"""
+        due = []
+        for end in seq.prefix_ends:
+            key = self._digest(seq.tokens[:end])
+            if key in self._prefixes:
+                continue
+            
+            uses = self._prefix_uses.pop(key, 0) + 1
+            self._prefix_uses[key] = uses
+            if uses >= self._min_prefix_uses:
+                due.append(end)
+        
+        while len(self._prefix_uses) > 1024:
+            self._prefix_uses.popitem(last=False)
+        seq.prefix_ends = due
+    
+    def _keep_prefixes(self, seq: _Sequence):
+        """Make the due prefixes seq has now evaluated resident"""
+        while seq.prefix_ends and seq.prefix_ends[0] <= seq.n_past:
+            end = seq.prefix_ends.pop(0)
+            
+            with self._cond:
+                if not self._free_prefix_ids and not self._evict_prefix():
+                    return
+                
+                tokens = np.array(seq.tokens[:end], dtype=np.intc)
+                key = self._digest(tokens)
+                if key in self._prefixes:
+                    continue
+                
+                prefix = _ResidentPrefix(self._free_prefix_ids.pop(), tokens)
+                llama_cpp.llama_kv_cache_seq_cp(self._llm.ctx, seq.seq_id, prefix.seq_id, 0, end)
+                self._prefixes[key] = prefix
+                self._prefix_uses.pop(key, None)
+                self._cells_used += end
+            
+            logger.info(f"Keeping prompt prefix resident: {end} tokens")
+    
+    def _evict_prefix(self, keep: Optional[_ResidentPrefix] = None) -> bool:
+        """Drop the least recently used prefix no request is sharing (lock held)"""
+        for key, prefix in self._prefixes.items():
+            if prefix.users == 0 and prefix is not keep:
+                llama_cpp.llama_kv_cache_seq_rm(self._llm.ctx, prefix.seq_id, -1, -1)
+                del self._prefixes[key]
+                self._free_prefix_ids.append(prefix.seq_id)
+                self._cells_used -= len(prefix.tokens)
+                return True
+        return False
+    
+    def count_tokens(self, text: str) -> int:
+        """Count tokens in text, tokenized as prompts are (special tokens parsed)"""
+        self._ensure_loaded()
+        return len(self._llm.tokenize(text.encode('utf-8'), special=True))
+    
+    def is_loaded(self) -> bool:
+        """Check if model is loaded"""
+        return self._llm is not None
+    
+    def prefix_cache_stats(self) -> Dict[str, Any]:
+        """Resident prompt prefix counters (empty before the model loads)"""
+        if self._llm is None:
+            return {}
+        
+        with self._cond:
+            return {
+                'resident': len(self._prefixes),
+                'tokens': sum(len(prefix.tokens) for prefix in self._prefixes.values()),
+                'hits': self.prefix_hits,
+                'misses': self.prefix_misses,
+            }
+    
+    def batch_stats(self) -> Dict[str, Any]:
+        """Sequence and KV cell usage of the decode loop"""
+        if self._llm is None:
+            return {}
+        
+        with self._cond:
+            return {
+                'parallel_sequences': self.slots,
+                'active': len(self._active),
+                'waiting': len(self._pending),
+                'kv_cells': self.n_ctx,
+                'kv_cells_reserved': self._cells_used,
+                'steps': self.steps,
+                'tokens_decoded': self.tokens_decoded,
+            }
+
+
+# Global instance (the model loads on first use)
+batched_llm_engine = BatchedLLMEngine()
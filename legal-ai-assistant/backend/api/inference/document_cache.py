@@ -0,0 +1,203 @@
+# api/inference/document_cache.py
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+import logging
+
+from ..rag.text_extraction import text_extraction_service
+from .llm_engine import llm_engine
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentTextCache:
+    """
+    Bounded LRU/TTL cache of document sha256 -> normalised text and token count
+    
+    Mode A/B requests on the same document skip file IO, PDF parsing and
+    re-tokenisation. Entries live in a per-process LRU and, when shared is
+    enabled, in the Django cache (Redis, zlib-compressed) so every worker
+    benefits from a document prepared once. Keys are content hashes, so an
+    entry never goes stale; the token count is keyed by the LLM model too.
+    """
+    
+    # Bump when normalize() changes
+    NORMALIZATION_VERSION = 1
+    
+    def __init__(
+        self,
+        max_entries: int = 32,
+        ttl_seconds: int = 86400,
+        shared: bool = False,
+        cache_alias: str = 'default',
+        engine=None
+    ):
+        """
+        Args:
+            max_entries: Max documents kept in the local LRU (0 = disabled)
+            ttl_seconds: Seconds before a cached document expires
+            shared: Also read/write the Django cache shared by all workers
+            cache_alias: Django cache used when shared is enabled
+            engine: LLM engine whose tokenizer counts tokens (default: the local llm_engine)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self.cache_alias = cache_alias
+        self.engine = engine or llm_engine
+        self._entries = OrderedDict()  # key -> (expires_at, entry)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Clean extracted text without losing its layout
+        
+        Line breaks are kept (clause excerpts and section headers depend on
+        them); runs of spaces, trailing whitespace, control characters and
+        long runs of blank lines are collapsed.
+        """
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        text = re.sub(r'[^\S\n]+', ' ', text)
+        text = re.sub(r'[\x00-\x08\x0b-\x1f\x7f]', '', text)
+        text = re.sub(r' *\n *', '\n', text)
+        text = re.sub(r'\n{3,}', '\n\n', text)
+        return text.strip()
+    
+    def key(self, sha256: str) -> str:
+        """Cache key of a document for the current LLM"""
+        from django.conf import settings
+        
+        model_name = os.path.basename(settings.MODEL_CONFIG.get('model_path') or '')
+        return f"document-text:v{self.NORMALIZATION_VERSION}:{model_name}:{sha256}"
+    
+    def get(self, document) -> Dict:
+        """
+        Normalised text and token count of a Document
+        
+        Returns:
+            Dict with 'text' and 'tokens' (None if the tokenizer is unavailable)
+        """
+        if not self.max_entries or not document.sha256:
+            return self._prepare(document)
+        
+        key = self.key(document.sha256)
+        
+        entry = self._get_local(key)
+        if entry is None and self.shared:
+            entry = self._get_shared(key)
+        
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry
+        
+        entry = self._prepare(document)
+        
+        self._put_local(key, entry)
+        if self.shared:
+            self._put_shared(key, entry)
+        
+        with self._lock:
+            self.misses += 1
+        return entry
+    
+    def _prepare(self, document) -> Dict:
+        """Extract (from the on-disk text cache when possible), normalise and count tokens"""
+        text = self.normalize(text_extraction_service.extract_document(document))
+        
+        try:
+            tokens = self.engine.count_tokens(text)
+        except Exception as e:
+            logger.warning(f"Could not count tokens for document {document.id}: {e}")
+            tokens = None
+        
+        return {'text': text, 'tokens': tokens}
+    
+    def _get_local(self, key: str) -> Optional[Dict]:
+        """Look up the per-process LRU, dropping expired entries"""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                return None
+            
+            expires_at, entry = cached
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            return entry
+    
+    def _put_local(self, key: str, entry: Dict):
+        """Insert into the per-process LRU, evicting the oldest entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def _get_shared(self, key: str) -> Optional[Dict]:
+        """Look up the shared Django cache, promoting a hit into the local LRU"""
+        try:
+            from django.core.cache import caches
+            value = caches[self.cache_alias].get(key)
+        except Exception as e:
+            logger.warning(f"Shared document cache unavailable: {e}")
+            return None
+        
+        if value is None:
+            return None
+        
+        entry = {
+            'text': zlib.decompress(value['text']).decode('utf-8'),
+            'tokens': value['tokens'],
+        }
+        self._put_local(key, entry)
+        
+        with self._lock:
+            self.shared_hits += 1
+        return entry
+    
+    def _put_shared(self, key: str, entry: Dict):
+        """Write a prepared document to the shared Django cache"""
+        try:
+            from django.core.cache import caches
+            caches[self.cache_alias].set(
+                key,
+                {
+                    'text': zlib.compress(entry['text'].encode('utf-8')),
+                    'tokens': entry['tokens'],
+                },
+                timeout=self.ttl_seconds
+            )
+        except Exception as e:
+            logger.warning(f"Shared document cache unavailable: {e}")
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters of this process"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+    
+    def clear(self):
+        """Drop local entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.shared_hits = 0
+            self.misses = 0
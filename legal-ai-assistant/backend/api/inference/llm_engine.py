@@ -2,17 +2,27 @@
 import os
 import time
 import logging
-from typing import Dict, Any, Optional, Iterator
+from typing import Dict, Any, List, Optional, Iterator, Sequence
 from llama_cpp import Llama
 
+from .prefix_cache import PrefixStateCache
+
 logger = logging.getLogger(__name__)
 
 
 class LLMEngine:
-    """Singleton LLM inference engine with lazy loading"""
+    """
+    Singleton LLM inference engine with lazy loading
+    
+    Callers can name prompt prefixes worth keeping (a mode's system block,
+    a Mode A/B document prompt); once requested repeatedly their KV state
+    is snapshotted and restored, so only the rest of the prompt is
+    evaluated.
+    """
     _instance = None
     _llm = None
     _initialized = False
+    _prefix_cache = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -64,6 +74,11 @@ class LLMEngine:
                 verbose=False,
             )
             
+            self._prefix_cache = PrefixStateCache(
+                max_bytes=model_config.get('prefix_cache_mb', 1024) * 1024 * 1024,
+                min_uses=model_config.get('prefix_cache_min_uses', 2),
+            )
+            
             load_time = time.time() - start_time
             logger.info(f"Model loaded successfully in {load_time:.2f}s")
             
@@ -80,10 +95,14 @@ class LLMEngine:
         top_k: int = 50,
         stop: Optional[list] = None,
         stream: bool = False,
+        cache_prefixes: Sequence[str] = (),
         **kwargs
     ) -> Dict[str, Any]:
         """
         Generate text from prompt
+        
+        cache_prefixes are leading parts of prompt whose evaluated state
+        may be snapshotted for reuse by later prompts.
         """
         # Ensure model is loaded before use
         self._ensure_loaded()
@@ -94,8 +113,10 @@ class LLMEngine:
         try:
             start_time = time.time()
             
+            prompt_tokens = self._prepare_prompt(prompt, cache_prefixes)
+            
             response = self._llm(
-                prompt,
+                prompt_tokens,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 top_p=top_p,
@@ -130,6 +151,7 @@ class LLMEngine:
         top_p: float = 0.9,
         top_k: int = 50,
         stop: Optional[list] = None,
+        cache_prefixes: Sequence[str] = (),
         **kwargs
     ) -> Iterator[str]:
         """
@@ -142,8 +164,10 @@ class LLMEngine:
             raise RuntimeError("Model failed to load")
         
         try:
+            prompt_tokens = self._prepare_prompt(prompt, cache_prefixes)
+            
             stream = self._llm(
-                prompt,
+                prompt_tokens,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 top_p=top_p,
@@ -163,15 +187,69 @@ class LLMEngine:
             logger.error(f"Streaming error: {e}")
             raise
     
+    def _prepare_prompt(self, prompt: str, cache_prefixes: Sequence[str]) -> List[int]:
+        """
+        Tokenize prompt and load the longest already-evaluated prefix
+        
+        Restores the snapshot sharing the most leading tokens with the
+        prompt (when it beats what the context already holds), evaluates up
+        to any cache_prefixes that have become worth a snapshot and saves
+        them. Llama then only evaluates the tokens after llm.n_tokens.
+        
+        Returns:
+            Prompt tokens, to pass to Llama instead of the text
+        """
+        llm = self._llm
+        tokens = llm.tokenize(prompt.encode('utf-8'), special=True)
+        
+        if not self._prefix_cache.max_bytes:
+            return tokens
+        
+        # Llama.generate() always re-evaluates the last prompt token
+        usable = tokens[:-1]
+        loaded = Llama.longest_token_prefix(llm.input_ids[:llm.n_tokens], usable)
+        
+        state, matched = self._prefix_cache.longest_match(usable)
+        if state is not None and matched > loaded:
+            self._prefix_cache.restore(llm, state, matched)
+            loaded = matched
+        llm.n_tokens = loaded
+        
+        prefix_ends = sorted(set(
+            Llama.longest_token_prefix(
+                llm.tokenize(prefix.encode('utf-8'), special=True), usable
+            )
+            for prefix in cache_prefixes
+        ))
+        
+        for end in prefix_ends:
+            # A prefix the context already holds past cannot be snapshotted
+            # without re-evaluating; it is picked up when it is next needed
+            if end < loaded or not self._prefix_cache.should_save(usable[:end]):
+                continue
+            if end > loaded:
+                llm.eval(usable[loaded:end])
+                loaded = end
+            self._prefix_cache.save(llm)
+        
+        logger.debug(f"Prompt: {len(tokens)} tokens, {loaded} reused from prefix state")
+        return tokens
+    
+    def prefix_cache_stats(self) -> Dict[str, Any]:
+        """Prompt prefix snapshot counters (empty before the model loads)"""
+        if self._prefix_cache is None:
+            return {}
+        return self._prefix_cache.stats()
+    
     def count_tokens(self, text: str) -> int:
-        """Count tokens in text"""
+        """Count tokens in text, tokenized as prompts are (special tokens parsed)"""
         # Ensure model is loaded before use
         self._ensure_loaded()
         
         if self._llm is None:
             raise RuntimeError("Model failed to load")
         
-        return len(self._llm.tokenize(text.encode('utf-8')))
+        return len(self._llm.tokenize(text.encode('utf-8'), special=True))
     
     def is_loaded(self) -> bool:
         """Check if model is loaded"""
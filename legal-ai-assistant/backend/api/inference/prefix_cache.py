@@ -0,0 +1,170 @@
+# api/inference/prefix_cache.py
+import ctypes
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+import logging
+import numpy as np
+import llama_cpp
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixState:
+    """llama.cpp context state (KV cache) after evaluating a token prefix"""
+    
+    def __init__(self, tokens: np.ndarray, data: np.ndarray):
+        self.tokens = tokens
+        self.data = data
+    
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.tokens.nbytes
+
+
+class PrefixStateCache:
+    """
+    Byte-bounded LRU of llama.cpp state snapshots, matched by token prefix
+    
+    A snapshot holds the KV cache after a prompt prefix was evaluated (a
+    mode's fixed system block, or a whole Mode A/B document prompt).
+    Restoring the snapshot with the longest common prefix means only the
+    rest of the prompt is evaluated.
+    
+    Snapshots are copied straight from the context instead of through
+    Llama.save_state(), which also copies the n_ctx x n_vocab logits
+    matrix and zero-fills a maximum-size buffer on every save.
+    """
+    
+    def __init__(self, max_bytes: int = 1024 * 1024 * 1024, min_uses: int = 2):
+        """
+        Args:
+            max_bytes: Total snapshot size kept (0 = disabled)
+            min_uses: Times a prefix must be requested before it is snapshotted
+        """
+        self.max_bytes = max_bytes
+        self.min_uses = min_uses
+        self._states = OrderedDict()  # token digest -> PrefixState
+        self._uses = OrderedDict()    # token digest -> times requested
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+    
+    @staticmethod
+    def _digest(tokens: Sequence[int]) -> bytes:
+        return hashlib.sha1(np.asarray(tokens, dtype=np.intc).tobytes()).digest()
+    
+    @property
+    def size_bytes(self) -> int:
+        return sum(state.nbytes for state in self._states.values())
+    
+    def longest_match(self, tokens: Sequence[int]) -> Tuple[Optional[PrefixState], int]:
+        """Snapshot sharing the longest prefix with tokens, and that prefix length"""
+        tokens = np.asarray(tokens, dtype=np.intc)
+        best, best_length = None, 0
+        
+        with self._lock:
+            for key, state in self._states.items():
+                n = min(len(state.tokens), len(tokens))
+                mismatch = np.flatnonzero(state.tokens[:n] != tokens[:n])
+                length = int(mismatch[0]) if len(mismatch) else n
+                if length > best_length:
+                    best, best_length, best_key = state, length, key
+            
+            if best is not None:
+                self._states.move_to_end(best_key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        
+        return best, best_length
+    
+    def should_save(self, tokens: Sequence[int]) -> bool:
+        """Count a request for this prefix; True once it is worth a snapshot"""
+        if not self.max_bytes:
+            return False
+        
+        key = self._digest(tokens)
+        with self._lock:
+            if key in self._states:
+                return False
+            
+            uses = self._uses.pop(key, 0) + 1
+            self._uses[key] = uses
+            while len(self._uses) > 1024:
+                self._uses.popitem(last=False)
+            return uses >= self.min_uses
+    
+    def save(self, llm: llama_cpp.Llama):
+        """Snapshot the context's current state (its first llm.n_tokens tokens)"""
+        ctx = llm.ctx
+        
+        # Uninitialised scratch: only the pages the copy writes become resident
+        scratch = np.empty(llama_cpp.llama_get_state_size(ctx), dtype=np.uint8)
+        n_bytes = llama_cpp.llama_copy_state_data(
+            ctx, scratch.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8))
+        )
+        
+        state = PrefixState(
+            tokens=np.array(llm.input_ids[:llm.n_tokens], dtype=np.intc),
+            data=scratch[:n_bytes].copy(),
+        )
+        
+        if state.nbytes > self.max_bytes:
+            return
+        
+        key = self._digest(state.tokens)
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            self._uses.pop(key, None)
+            self.saves += 1
+            
+            total = self.size_bytes
+            while total > self.max_bytes and self._states:
+                _, evicted = self._states.popitem(last=False)
+                total -= evicted.nbytes
+        
+        logger.info(
+            f"Saved prompt prefix state: {len(state.tokens)} tokens, "
+            f"{state.nbytes / (1024 * 1024):.1f} MB"
+        )
+    
+    @staticmethod
+    def restore(llm: llama_cpp.Llama, state: PrefixState, n_tokens: int):
+        """
+        Load a snapshot into the context, keeping its first n_tokens tokens
+        
+        KV cells past n_tokens are dropped by the next Llama.eval().
+        """
+        n_bytes = llama_cpp.llama_set_state_data(
+            llm.ctx, state.data.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8))
+        )
+        if n_bytes != len(state.data):
+            raise RuntimeError("Failed to restore prompt prefix state")
+        
+        llm.input_ids[:len(state.tokens)] = state.tokens
+        llm.n_tokens = n_tokens
+    
+    def stats(self) -> Dict:
+        """Snapshot counters of this process"""
+        with self._lock:
+            return {
+                'snapshots': len(self._states),
+                'size_mb': round(self.size_bytes / (1024 * 1024), 1),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+                'hits': self.hits,
+                'misses': self.misses,
+                'saves': self.saves,
+            }
+    
+    def clear(self):
+        """Drop every snapshot and reset the counters"""
+        with self._lock:
+            self._states.clear()
+            self._uses.clear()
+            self.hits = 0
+            self.misses = 0
+            self.saves = 0
@@ -78,6 +78,85 @@ Do not output anything outside the fenced code block, and do not output JSON. Ne
         return cls.format_llama2_prompt(cls.SYSTEM, user_message)
 
 
+class SectionSummaryPrompt(PromptTemplate):
+    """Mode A, long documents: notes on one section (map step)"""
+
+    SYSTEM = """You are a legal document summarizer working on one part of a longer document. Write concise Markdown notes on this part only, under these headings:
+
+## Key Points
+## Risks
+## Obligations
+
+Every note MUST keep the citation of the text it comes from, in the format: [Section X, paragraph Y]. Use the section and paragraph numbers that appear in the text. Leave out a heading if this part has nothing for it. Never fabricate information."""
+
+    @classmethod
+    def build(cls, section_text: str, document_title: str,
+              section_number: int, section_count: int) -> str:
+        """Build section notes prompt"""
+        user_message = f"""Document: {document_title}
+
+Write notes on part {section_number} of {section_count} of this legal document.
+
+Text:
+{section_text}
+
+Return only the Markdown notes, one bullet per point, each with its [Section X, paragraph Y] citation. Never fabricate information."""
+
+        return cls.format_llama2_prompt(cls.SYSTEM, user_message)
+
+    @classmethod
+    def static_prefix(cls) -> str:
+        """Leading text shared by every section prompt"""
+        marker = '\x00'
+        return cls.build(marker, marker, 0, 0).split(marker, 1)[0]
+
+
+class SummaryReducePrompt(PromptTemplate):
+    """Mode A, long documents: merge section notes into the summary (reduce step)"""
+
+    @classmethod
+    def build(cls, section_notes: List[str], document_title: str) -> str:
+        """Build the prompt merging notes on consecutive parts of a document"""
+        notes = "\n\n".join(
+            f"### Part {i}\n{note}" for i, note in enumerate(section_notes, 1)
+        )
+
+        user_message = f"""Document: {document_title}
+
+Combine these notes on consecutive parts of a legal document into one Markdown summary.
+
+Notes:
+{notes}
+
+Keep every citation exactly as written in the notes ([Section X, paragraph Y]). Merge repeated points and keep all of their citations.
+
+Return the summary in **raw Markdown syntax**, and wrap the entire Markdown output inside a fenced code block annotated as 'markdown'. Use this structure inside the code block:
+
+```markdown
+## Executive Summary
+- point with [Section X, paragraph Y]
+
+## Key Points
+- point with [Section X, paragraph Y]
+
+## Risks
+- point with [Section X, paragraph Y]
+
+## Obligations
+- point with [Section X, paragraph Y]
+```
+
+Do not output anything outside the fenced code block, and do not output JSON. Never fabricate information."""
+
+        return cls.format_llama2_prompt(SummarizerPrompt.SYSTEM, user_message)
+
+    @classmethod
+    def static_prefix(cls) -> str:
+        """Leading text shared by every merge prompt"""
+        marker = '\x00'
+        return cls.build([marker], marker).split(marker, 1)[0]
+
+
 class ClauseClassifierPrompt(PromptTemplate):
     """Mode B: Clause Detection & Classification"""
 
@@ -248,3 +327,20 @@ class PromptBuilder:
 
         else:
             raise ValueError(f"Unknown mode: {mode}")
+
+    @staticmethod
+    def static_prefix(mode: str) -> str:
+        """
+        Leading text shared by every prompt of a mode (system block and
+        fixed instructions, up to the first request-specific value)
+        """
+        marker = '\x00'
+
+        if mode == 'C':
+            prompt = PromptBuilder.build_prompt(mode, question=marker, context_passages=[])
+        else:
+            prompt = PromptBuilder.build_prompt(
+                mode, document_text=marker, document_title=marker
+            )
+
+        return prompt.split(marker, 1)[0]
@@ -0,0 +1,192 @@
+# api/inference/scheduler.py
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """The admission queue is full; the request is rejected immediately"""
+
+
+class QueueTimeoutError(Exception):
+    """The request's deadline passed before a generation slot was free"""
+
+
+class Ticket:
+    """A request waiting for, or holding, a generation slot"""
+    
+    def __init__(self, priority: int, seq: int, deadline: float):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.position = 0      # Requests ahead of this one when it was queued
+        self.waiting = False   # A caller is blocked in wait() on it
+        self.cancelled = False
+    
+    def __lt__(self, other: 'Ticket') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+    
+    @property
+    def waited_ms(self) -> int:
+        end = self.started_at or time.monotonic()
+        return int((end - self.enqueued_at) * 1000)
+
+
+class InferenceScheduler:
+    """
+    Bounded priority admission queue in front of the LLM engine
+    
+    The engine runs a fixed number of generations at once (slots). Other
+    requests wait in a queue ordered by priority (lower first), then
+    arrival. A request is rejected at once when the queue is full
+    (QueueFullError, HTTP 429), and gives up when its deadline passes
+    before a slot frees (QueueTimeoutError, HTTP 503), so latency under
+    load stays bounded instead of requests piling up.
+    
+    Usage:
+        ticket = scheduler.submit()      # may raise QueueFullError
+        scheduler.wait(ticket)           # may raise QueueTimeoutError
+        try:
+            ...generate...
+        finally:
+            scheduler.release(ticket)
+    
+    Waiting runs on the caller's thread, so a streaming request can report
+    its queue position before it blocks. A free slot goes to the best
+    ticket whose caller is waiting: a ticket that is submitted but never
+    waited on (e.g. a stream the client dropped) never blocks the ones
+    behind it, and only counts towards max_queue until its deadline.
+    """
+    
+    def __init__(self, slots: int = 1, max_queue: int = 16, timeout: float = 60.0):
+        """
+        Args:
+            slots: Generations run concurrently
+            max_queue: Requests allowed to wait (0 = no waiting)
+            timeout: Default seconds a request may wait for a slot
+        """
+        self.slots = slots
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._queue = []          # heap of waiting tickets
+        self._running = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.avg_service_s = None  # Moving average of slot hold time
+    
+    def submit(self, priority: int = 0, timeout: Optional[float] = None) -> Ticket:
+        """
+        Queue a request
+        
+        Args:
+            priority: Lower values are served first
+            timeout: Seconds the request may wait (None = scheduler default)
+        
+        Returns:
+            Ticket with its queue position
+        """
+        timeout = self.timeout if timeout is None else timeout
+        
+        with self._cond:
+            self._drop_expired()
+            
+            if len(self._queue) >= self.max_queue and len(self._running) >= self.slots:
+                self.rejected += 1
+                raise QueueFullError(
+                    f"Inference queue is full ({len(self._queue)} waiting)"
+                )
+            
+            ticket = Ticket(priority, next(self._seq), time.monotonic() + timeout)
+            ticket.position = sum(1 for queued in self._queue if queued < ticket)
+            heapq.heappush(self._queue, ticket)
+            self._cond.notify_all()
+            return ticket
+    
+    def wait(self, ticket: Ticket):
+        """Block until ticket holds a slot, or raise QueueTimeoutError"""
+        with self._cond:
+            ticket.waiting = True
+            try:
+                while True:
+                    self._drop_expired()
+                    
+                    if ticket.cancelled:
+                        self.timed_out += 1
+                        raise QueueTimeoutError(
+                            f"No inference slot within {ticket.waited_ms / 1000:.0f}s"
+                        )
+                    
+                    if len(self._running) < self.slots and self._next_waiting() is ticket:
+                        self._queue.remove(ticket)
+                        heapq.heapify(self._queue)
+                        ticket.started_at = time.monotonic()
+                        self._running.add(ticket)
+                        self._cond.notify_all()
+                        return
+                    
+                    self._cond.wait(max(0.0, ticket.deadline - time.monotonic()))
+            finally:
+                ticket.waiting = False
+    
+    def release(self, ticket: Ticket):
+        """Give back a slot (or withdraw a ticket that is still queued)"""
+        with self._cond:
+            if ticket in self._running:
+                self._running.discard(ticket)
+                self.completed += 1
+                
+                held = time.monotonic() - ticket.started_at
+                self.avg_service_s = held if self.avg_service_s is None else (
+                    0.8 * self.avg_service_s + 0.2 * held
+                )
+            elif not ticket.cancelled and ticket in self._queue:
+                ticket.cancelled = True
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+            self._cond.notify_all()
+    
+    def estimated_wait(self) -> int:
+        """Seconds until a newly queued request would likely start (Retry-After)"""
+        with self._cond:
+            service_s = self.avg_service_s or self.timeout / max(1, self.max_queue)
+            return max(1, math.ceil(service_s * (len(self._queue) + 1) / self.slots))
+    
+    def _next_waiting(self) -> Optional[Ticket]:
+        """Best queued ticket whose caller is in wait() (lock held)"""
+        return min((ticket for ticket in self._queue if ticket.waiting), default=None)
+    
+    def _drop_expired(self):
+        """Cancel waiting tickets whose deadline has passed (lock held)"""
+        now = time.monotonic()
+        expired = [ticket for ticket in self._queue if ticket.deadline <= now]
+        if expired:
+            for ticket in expired:
+                ticket.cancelled = True
+            self._queue = [ticket for ticket in self._queue if not ticket.cancelled]
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+    
+    def stats(self) -> Dict:
+        """Queue depth and counters of this process"""
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'running': len(self._running),
+                'queued': len(self._queue),
+                'max_queue': self.max_queue,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_service_ms': int((self.avg_service_s or 0) * 1000),
+            }
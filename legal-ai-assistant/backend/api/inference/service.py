@@ -5,7 +5,12 @@ from typing import Dict, Any, Optional, Iterator
 from django.conf import settings
 
 from .llm_engine import llm_engine
-from .prompts import PromptBuilder
+from .batch_engine import BatchedLLMEngine, batched_llm_engine
+from .document_cache import DocumentTextCache
+from .scheduler import InferenceScheduler, QueueFullError, QueueTimeoutError
+from .worker_pool import RemoteLLMEngine
+from .summarizer import MapReduceSummarizer
+from .prompts import PromptBuilder, SummaryReducePrompt
 from .post_processor import ResponseProcessor
 
 logger = logging.getLogger(__name__)
@@ -15,8 +20,58 @@ class InferenceService:
     """High-level service for LLM inference"""
     
     def __init__(self):
-        self.engine = llm_engine
+        model_config = settings.MODEL_CONFIG
+        
+        # Generate in a pool of LLM worker processes when one is configured
+        # (manage.py run_llm_workers), otherwise in this process
+        if model_config.get('worker_socket_dir'):
+            self.engine = RemoteLLMEngine(
+                socket_dir=model_config['worker_socket_dir'],
+                workers=model_config.get('workers', 1),
+                claim_timeout=model_config.get('queue_timeout', 60),
+            )
+            slots = self.engine.workers
+        # Decode concurrent requests together in this process
+        elif model_config.get('parallel_sequences', 1) > 1:
+            self.engine = batched_llm_engine
+            slots = model_config['parallel_sequences']
+        else:
+            self.engine = llm_engine
+            slots = 1
+        
         self.processor = ResponseProcessor()
+        
+        self.document_cache = DocumentTextCache(
+            max_entries=model_config.get('document_cache_size', 32),
+            ttl_seconds=model_config.get('document_cache_ttl', 86400),
+            shared=model_config.get('document_cache_shared', False),
+            engine=self.engine,
+        )
+        
+        # One generation at a time per Llama instance (or batched sequence)
+        self.scheduler = InferenceScheduler(
+            slots=slots,
+            max_queue=model_config.get('queue_max_size', 16),
+            timeout=model_config.get('queue_timeout', 60),
+        )
+        
+        # Mode A for documents longer than the context window
+        self.summarizer = MapReduceSummarizer(
+            engine=self.engine,
+            scheduler=self.scheduler,
+            n_ctx=model_config.get('n_ctx', 4096),
+            note_tokens=model_config.get('summary_note_tokens', 384),
+            cache_ttl=model_config.get('summary_cache_ttl', 7 * 86400),
+        )
+    
+    def document_text(self, document) -> Dict[str, Any]:
+        """
+        Normalised text and token count of a document for modes A/B
+        
+        Returns:
+            Dict with 'text' and 'tokens' (None if they could not be counted)
+        """
+        return self.document_cache.get(document)
     
     def chat(
         self,
@@ -24,10 +79,13 @@ class InferenceService:
         message: str,
         document_text: Optional[str] = None,
         document_title: Optional[str] = None,
+        document_tokens: Optional[int] = None,
+        document_sha256: Optional[str] = None,
         context_passages: Optional[list] = None,
         filters: Optional[Dict] = None,
         settings_override: Optional[Dict] = None,
         stream: bool = False,
+        priority: int = 0,
     ) -> Dict[str, Any]:
         """
         Process chat request
@@ -37,13 +95,17 @@ class InferenceService:
             message: User message
             document_text: Document text for modes A/B
             document_title: Document title
+            document_tokens: Token count of document_text, if already known
+            document_sha256: Document hash; caches section notes of long Mode A documents
             context_passages: Retrieved passages for mode C
             filters: Filters for mode C
             settings_override: Custom inference settings
             stream: Whether to stream response
+            priority: Queue priority (lower is served first)
         
         Returns:
-            Dict with response and metadata
+            Dict with response and metadata; on rejection by the scheduler,
+            error_code is 'queue_full' or 'queue_timeout'
         """
         start_time = time.time()
         
@@ -75,13 +137,64 @@ class InferenceService:
             
             prompt = PromptBuilder.build_prompt(**prompt_kwargs)
             
+            # Prefixes whose KV state is worth keeping: the mode's fixed
+            # system block, and for A/B the whole prompt (it depends only on
+            # the document, so repeat requests evaluate a single token)
+            cache_prefixes = [PromptBuilder.static_prefix(mode)]
+            if mode in ['A', 'B']:
+                cache_prefixes.append(prompt)
+            
             # Get inference settings
             model_config = settings.MODEL_CONFIG.copy()
             if settings_override:
                 model_config.update(settings_override)
             
-            # Count input tokens
-            tokens_in = self.engine.count_tokens(prompt)
+            # Count input tokens (a cached document count saves re-tokenising
+            # the document; the template is counted around an empty document)
+            if mode in ['A', 'B'] and document_tokens is not None:
+                prompt_kwargs['document_text'] = ''
+                tokens_in = document_tokens + self.engine.count_tokens(
+                    PromptBuilder.build_prompt(**prompt_kwargs)
+                )
+            else:
+                tokens_in = self.engine.count_tokens(prompt)
+            
+            # A Mode A document too long for one prompt is summarised section
+            # by section first; the final prompt then merges the notes
+            summary = None
+            if mode == 'A' and self.summarizer.needs_sections(
+                tokens_in, model_config.get('max_tokens', 256)
+            ):
+                summary = self.summarizer.job(
+                    document_text=document_text,
+                    document_title=document_title or 'Untitled',
+                    document_tokens=document_tokens,
+                    sha256=document_sha256,
+                    params=model_config,
+                    priority=priority,
+                )
+                cache_prefixes = [SummaryReducePrompt.static_prefix()]
+                
+                if stream:
+                    # Sections run inside the stream; it queues afterwards
+                    return self._stream_response(
+                        prompt=None,
+                        mode=mode,
+                        tokens_in=tokens_in,
+                        ticket=None,
+                        summary=summary,
+                        priority=priority,
+                        cache_prefixes=cache_prefixes,
+                        **model_config
+                    )
+                
+                prompt = summary.run()
+                # Like a Mode A prompt, it only depends on the document
+                cache_prefixes.append(prompt)
+            
+            # Queue for the engine (a full queue rejects here, before any
+            # streaming response has started)
+            ticket = self.scheduler.submit(priority=priority)
             
             # Generate response
             if stream:
@@ -89,16 +202,23 @@ class InferenceService:
                     prompt=prompt,
                     mode=mode,
                     tokens_in=tokens_in,
+                    ticket=ticket,
+                    cache_prefixes=cache_prefixes,
                     **model_config
                 )
             else:
-                response = self.engine.generate(
-                    prompt=prompt,
-                    max_tokens=model_config.get('max_tokens', 256),
-                    temperature=model_config.get('temperature', 0.7),
-                    top_p=model_config.get('top_p', 0.9),
-                    top_k=model_config.get('top_k', 50),
-                )
+                try:
+                    self.scheduler.wait(ticket)
+                    response = self.engine.generate(
+                        prompt=prompt,
+                        max_tokens=model_config.get('max_tokens', 256),
+                        temperature=model_config.get('temperature', 0.7),
+                        top_p=model_config.get('top_p', 0.9),
+                        top_k=model_config.get('top_k', 50),
+                        cache_prefixes=cache_prefixes,
+                    )
+                finally:
+                    self.scheduler.release(ticket)
                 
                 # Process response
                 processed = self._process_response(mode, response['text'])
@@ -111,7 +231,7 @@ class InferenceService:
                 
                 latency_ms = int((time.time() - start_time) * 1000)
                 
-                return {
+                result = {
                     'success': True,
                     'mode': mode,
                     'response': final_text,
@@ -119,9 +239,27 @@ class InferenceService:
                     'tokens_in': tokens_in,
                     'tokens_out': response['tokens_generated'],
                     'latency_ms': latency_ms,
+                    'queue_ms': ticket.waited_ms,
                     'finish_reason': response['finish_reason'],
                 }
                 
+                if summary is not None:
+                    result['sections'] = len(summary.sections)
+                    result['sections_cached'] = summary.cached_sections
+                
+                return result
+        
+        except (QueueFullError, QueueTimeoutError) as e:
+            logger.warning(f"Inference request rejected: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'error_code': 'queue_full' if isinstance(e, QueueFullError) else 'queue_timeout',
+                'retry_after': self.scheduler.estimated_wait(),
+                'mode': mode,
+                'latency_ms': int((time.time() - start_time) * 1000),
+            }
+        
         except Exception as e:
             logger.error(f"Inference error: {e}", exc_info=True)
             return {
@@ -133,19 +271,39 @@ class InferenceService:
     
     def _stream_response(
         self,
-        prompt: str,
+        prompt: Optional[str],
         mode: str,
         tokens_in: int,
+        ticket,
+        summary=None,
+        priority: int = 0,
         **kwargs
     ) -> Iterator[Dict[str, Any]]:
-        """Stream response token by token"""
+        """
+        Stream response token by token once the request holds a slot
+        
+        With a SummaryJob (long Mode A document), section progress events
+        come first and the request queues for the final generation after.
+        """
         try:
-            # Send initial metadata
-            yield {
+            # Send initial metadata (before waiting, so clients see the queue)
+            start = {
                 'type': 'start',
                 'mode': mode,
                 'tokens_in': tokens_in,
+                'queue_position': ticket.position if ticket else 0,
             }
+            if summary is not None:
+                start['sections'] = len(summary.sections)
+            yield start
+            
+            if summary is not None:
+                yield from summary
+                prompt = summary.prompt
+                kwargs['cache_prefixes'] = kwargs.get('cache_prefixes', []) + [prompt]
+                ticket = self.scheduler.submit(priority=priority)
+            
+            self.scheduler.wait(ticket)
             
             # Stream tokens
             for token in self.engine.generate_stream(prompt=prompt, **kwargs):
@@ -159,13 +317,27 @@ class InferenceService:
                 'type': 'done',
                 'disclaimer': self.processor.LEGAL_DISCLAIMER,
             }
-            
+        
+        except (QueueFullError, QueueTimeoutError) as e:
+            logger.warning(f"Inference request rejected: {e}")
+            yield {
+                'type': 'error',
+                'error': str(e),
+                'error_code': 'queue_full' if isinstance(e, QueueFullError) else 'queue_timeout',
+                'retry_after': self.scheduler.estimated_wait(),
+            }
+        
         except Exception as e:
             logger.error(f"Streaming error: {e}", exc_info=True)
             yield {
                 'type': 'error',
                 'error': str(e),
             }
+        
+        finally:
+            # Also runs when the client disconnects mid-stream
+            if ticket is not None:
+                self.scheduler.release(ticket)
     
     def _process_response(self, mode: str, response_text: str) -> Dict[str, Any]:
         """Process response based on mode"""
@@ -180,10 +352,20 @@ class InferenceService:
     
     def health_check(self) -> Dict[str, Any]:
         """Check if inference engine is ready"""
-        return {
+        health = {
             'model_loaded': self.engine.is_loaded(),
             'model_path': settings.MODEL_CONFIG.get('model_path'),
+            'document_cache': self.document_cache.stats(),
+            'prefix_cache': self.engine.prefix_cache_stats(),
+            'queue': self.scheduler.stats(),
         }
+        
+        if isinstance(self.engine, RemoteLLMEngine):
+            health['workers'] = self.engine.health()
+        elif isinstance(self.engine, BatchedLLMEngine):
+            health['batch'] = self.engine.batch_stats()
+        
+        return health
 
 
 # Global instance
@@ -0,0 +1,341 @@
+# api/inference/summarizer.py
+import hashlib
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Iterator, List, Optional, Union
+
+from ..rag.chunker import DocumentChunker
+from .prompts import SectionSummaryPrompt, SummaryReducePrompt
+
+logger = logging.getLogger(__name__)
+
+
+class MapReduceSummarizer:
+    """
+    Mode A for documents whose prompt does not fit the context window
+    
+    The document is split with DocumentChunker into sections that each fit
+    one prompt, and every section is summarised into cited notes (map).
+    Sections run in parallel up to the scheduler's slots, so a worker pool
+    or a batched engine works on several at once. The notes are merged by
+    the final Mode A generation (reduce); notes too long for one prompt
+    are merged in groups first. Section notes (and merged groups) are
+    cached by document sha256 and section, so a re-run only pays for the
+    final merge.
+    """
+    
+    # Bump when the section prompts or the splitting change
+    CACHE_VERSION = 1
+    
+    def __init__(
+        self,
+        engine,
+        scheduler,
+        n_ctx: int = 4096,
+        note_tokens: int = 384,
+        cache_ttl: int = 7 * 86400,
+        cache_alias: str = 'default'
+    ):
+        """
+        Args:
+            engine: LLM engine (local, batched or worker pool)
+            scheduler: InferenceScheduler every section generation queues on
+            n_ctx: Context window of one prompt, in tokens
+            note_tokens: Max tokens generated per section (and per merge of notes)
+            cache_ttl: Seconds section notes stay in the Django cache (0 = no caching)
+            cache_alias: Django cache holding section notes
+        """
+        self.engine = engine
+        self.scheduler = scheduler
+        self.n_ctx = n_ctx
+        self.note_tokens = note_tokens
+        self.cache_ttl = cache_ttl
+        self.cache_alias = cache_alias
+    
+    def needs_sections(self, prompt_tokens: int, max_tokens: int) -> bool:
+        """True when a Mode A prompt and its answer do not fit the context window"""
+        return prompt_tokens + max_tokens > self.n_ctx
+    
+    def job(
+        self,
+        document_text: str,
+        document_title: str,
+        document_tokens: Optional[int] = None,
+        sha256: Optional[str] = None,
+        params: Optional[Dict] = None,
+        priority: int = 0
+    ) -> 'SummaryJob':
+        """
+        Split a document and prepare its summarisation
+        
+        Args:
+            document_text: Normalised document text
+            document_title: Document title
+            document_tokens: Token count of document_text, if known
+            sha256: Document hash; enables caching of section notes
+            params: Inference settings (max_tokens, temperature, top_p, top_k)
+            priority: Queue priority of the request
+        
+        Returns:
+            SummaryJob to iterate for progress
+        """
+        sections = self.split(document_text, document_title, document_tokens)
+        logger.info(f"Summarising '{document_title}' in {len(sections)} sections")
+        return SummaryJob(self, sections, document_title, sha256, params or {}, priority)
+    
+    def split(
+        self,
+        document_text: str,
+        document_title: str,
+        document_tokens: Optional[int] = None
+    ) -> List[str]:
+        """Split document text into sections that fit one section prompt each"""
+        # Document tokens a section prompt has room for (title and part
+        # numbers are counted at a generous width)
+        overhead = self.engine.count_tokens(
+            SectionSummaryPrompt.build('', document_title, 9999, 9999)
+        )
+        budget = self.n_ctx - overhead - self.note_tokens
+        
+        chars_per_token = len(document_text) / document_tokens if document_tokens else 3.0
+        chunk_size = max(256, int(budget * chars_per_token * 0.9))
+        chunker = DocumentChunker(
+            chunk_size=chunk_size,
+            chunk_overlap=min(200, chunk_size // 10),
+            min_chunk_size=1,
+        )
+        
+        sections = []
+        for chunk in chunker.chunk_text(document_text, document_title):
+            sections.extend(self._fit(chunk['text'], budget))
+        return sections
+    
+    def _fit(self, text: str, budget: int) -> List[str]:
+        """Halve a section (at a space) until every part is within budget tokens"""
+        if len(text) < 2 or self.engine.count_tokens(text) <= budget:
+            return [text]
+        
+        middle = text.rfind(' ', 0, len(text) // 2)
+        if middle <= 0:
+            middle = len(text) // 2
+        return self._fit(text[:middle], budget) + self._fit(text[middle:].lstrip(), budget)
+    
+    def summarize_section(
+        self,
+        section: str,
+        index: int,
+        section_count: int,
+        document_title: str,
+        sha256: Optional[str],
+        params: Dict,
+        priority: int
+    ) -> str:
+        """Notes on one section, cached once generated"""
+        prompt = SectionSummaryPrompt.build(section, document_title, index + 1, section_count)
+        note = self._generate(
+            prompt, params, priority, [SectionSummaryPrompt.static_prefix()]
+        )
+        self._put_cached(sha256, index, section, note)
+        return note
+    
+    def reduce_prompt(
+        self,
+        notes: List[str],
+        document_title: str,
+        sha256: Optional[str],
+        params: Dict,
+        priority: int
+    ) -> str:
+        """
+        Final Mode A prompt over the section notes
+        
+        While the notes do not fit one prompt (with room for the answer),
+        consecutive groups of them are merged into shorter notes.
+        """
+        max_prompt = self.n_ctx - params.get('max_tokens', 256)
+        
+        while True:
+            prompt = SummaryReducePrompt.build(notes, document_title)
+            if len(notes) == 1 or self.engine.count_tokens(prompt) <= max_prompt:
+                return prompt
+            
+            groups = self._group(notes, document_title, self.n_ctx - self.note_tokens)
+            logger.info(f"Merging {len(notes)} section notes in {len(groups)} groups")
+            
+            with ThreadPoolExecutor(max_workers=max(1, min(len(groups), self.scheduler.slots))) as pool:
+                notes = list(pool.map(
+                    lambda group: self._merge(group, document_title, sha256, params, priority + 1),
+                    groups
+                ))
+    
+    def _group(self, notes: List[str], document_title: str, max_prompt: int) -> List[List[str]]:
+        """Consecutive groups of notes whose merge prompt fits max_prompt (two at least, but the last)"""
+        groups = [[]]
+        for note in notes:
+            candidate = groups[-1] + [note]
+            if len(groups[-1]) >= 2 and self.engine.count_tokens(
+                SummaryReducePrompt.build(candidate, document_title)
+            ) > max_prompt:
+                groups.append([note])
+            else:
+                groups[-1] = candidate
+        return groups
+    
+    def _merge(
+        self,
+        group: List[str],
+        document_title: str,
+        sha256: Optional[str],
+        params: Dict,
+        priority: int
+    ) -> str:
+        """Merge consecutive notes into one (cached like a section)"""
+        if len(group) == 1:
+            return group[0]
+        
+        merged_notes = "\n\n".join(group)
+        note = self.get_cached(sha256, 'merge', merged_notes)
+        if note is None:
+            note = self._generate(
+                SummaryReducePrompt.build(group, document_title),
+                params,
+                priority,
+                [SummaryReducePrompt.static_prefix()]
+            )
+            self._put_cached(sha256, 'merge', merged_notes, note)
+        return note
+    
+    def _generate(self, prompt: str, params: Dict, priority: int, cache_prefixes: List[str]) -> str:
+        """One notes generation through the scheduler, without code fences"""
+        ticket = self.scheduler.submit(priority=priority)
+        try:
+            self.scheduler.wait(ticket)
+            response = self.engine.generate(
+                prompt=prompt,
+                max_tokens=self.note_tokens,
+                temperature=params.get('temperature', 0.7),
+                top_p=params.get('top_p', 0.9),
+                top_k=params.get('top_k', 50),
+                cache_prefixes=cache_prefixes,
+            )
+        finally:
+            self.scheduler.release(ticket)
+        
+        # Notes are nested in the merge prompt, so drop any ``` fences
+        return re.sub(r'^\s*```[\w-]*\s*$', '', response['text'], flags=re.MULTILINE).strip()
+    
+    def _cache_key(self, sha256: str, part: Union[int, str], section: str) -> str:
+        """Cache key of notes on a section (part = its index, or 'merge') for the current LLM"""
+        from django.conf import settings
+        
+        model_name = os.path.basename(settings.MODEL_CONFIG.get('model_path') or '')
+        digest = hashlib.sha1(section.encode('utf-8')).hexdigest()[:16]
+        return f"summary-section:v{self.CACHE_VERSION}:{model_name}:{sha256}:{part}:{digest}"
+    
+    def get_cached(self, sha256: Optional[str], part: Union[int, str], section: str) -> Optional[str]:
+        """Cached notes of a section, or None"""
+        if not sha256 or not self.cache_ttl:
+            return None
+        
+        try:
+            from django.core.cache import caches
+            return caches[self.cache_alias].get(self._cache_key(sha256, part, section))
+        except Exception as e:
+            logger.warning(f"Section summary cache unavailable: {e}")
+            return None
+    
+    def _put_cached(self, sha256: Optional[str], part: Union[int, str], section: str, note: str):
+        if not sha256 or not self.cache_ttl:
+            return
+        
+        try:
+            from django.core.cache import caches
+            caches[self.cache_alias].set(
+                self._cache_key(sha256, part, section), note, timeout=self.cache_ttl
+            )
+        except Exception as e:
+            logger.warning(f"Section summary cache unavailable: {e}")
+
+
+class SummaryJob:
+    """
+    A map-reduce summarisation of one document
+    
+    Iterating runs the section pass and yields a progress event as each
+    section is done; prompt then holds the final (reduce) Mode A prompt.
+    """
+    
+    def __init__(
+        self,
+        summarizer: MapReduceSummarizer,
+        sections: List[str],
+        document_title: str,
+        sha256: Optional[str],
+        params: Dict,
+        priority: int
+    ):
+        self.summarizer = summarizer
+        self.sections = sections
+        self.document_title = document_title
+        self.sha256 = sha256
+        self.params = params
+        self.priority = priority
+        self.cached_sections = 0
+        self.prompt = None
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        summarizer = self.summarizer
+        notes = [
+            summarizer.get_cached(self.sha256, index, section)
+            for index, section in enumerate(self.sections)
+        ]
+        todo = [index for index, note in enumerate(notes) if note is None]
+        self.cached_sections = len(notes) - len(todo)
+        
+        done = self.cached_sections
+        yield self._progress(done)
+        
+        if todo:
+            # Sections queue behind interactive requests of the same priority
+            pool = ThreadPoolExecutor(max_workers=max(1, min(len(todo), summarizer.scheduler.slots)))
+            try:
+                futures = {
+                    pool.submit(
+                        summarizer.summarize_section,
+                        self.sections[index],
+                        index,
+                        len(self.sections),
+                        self.document_title,
+                        self.sha256,
+                        self.params,
+                        self.priority + 1,
+                    ): index
+                    for index in todo
+                }
+                for future in as_completed(futures):
+                    notes[futures[future]] = future.result()
+                    done += 1
+                    yield self._progress(done)
+            finally:
+                # Sections already running finish (and are cached) on their own
+                pool.shutdown(wait=False, cancel_futures=True)
+        
+        self.prompt = summarizer.reduce_prompt(
+            notes, self.document_title, self.sha256, self.params, self.priority
+        )
+    
+    def _progress(self, done: int) -> Dict[str, Any]:
+        return {
+            'type': 'progress',
+            'sections_done': done,
+            'sections': len(self.sections),
+            'sections_cached': self.cached_sections,
+        }
+    
+    def run(self) -> str:
+        """Summarise every section and return the final prompt"""
+        for _ in self:
+            pass
+        return self.prompt
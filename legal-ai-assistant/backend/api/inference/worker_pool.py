@@ -0,0 +1,432 @@
+# api/inference/worker_pool.py
+import os
+import time
+import errno
+import fcntl
+import hashlib
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from multiprocessing.connection import Client, Listener, wait
+from typing import Dict, Any, List, Optional, Iterator, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between restarts of a worker that keeps exiting
+RESTART_BACKOFF = 5.0
+
+
+def worker_authkey() -> bytes:
+    """Connection key shared by web processes and LLM workers"""
+    from django.conf import settings
+    return hashlib.sha256(f"llm-worker:{settings.SECRET_KEY}".encode('utf-8')).digest()
+
+
+def worker_socket(socket_dir: str, index: int) -> str:
+    """Unix socket path of LLM worker index"""
+    return os.path.join(socket_dir, f"llm-worker-{index}.sock")
+
+
+def serve_worker(socket_path: str, n_threads: int):
+    """
+    LLM worker process: load the model once, then serve one request per connection
+    
+    Spawned by WorkerPool, so this must not rely on state from the parent.
+    
+    Protocol (pickled dicts over multiprocessing.connection):
+        request:  {'op': 'generate', 'prompt', 'params', 'stream', 'cache_prefixes'}
+                  {'op': 'health'}
+        stream:   {'type': 'token', 'text'}... then {'type': 'done'}
+        reply:    {'type': 'done', 'result'} | {'type': 'health', ...}
+                  | {'type': 'error', 'error'}
+        cancel:   the client sends {'op': 'cancel'} or closes the connection
+    """
+    import django
+    django.setup()
+    
+    from django.conf import settings
+    settings.MODEL_CONFIG['n_threads'] = n_threads
+    
+    from .llm_engine import llm_engine
+    llm_engine.load_model()
+    
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    listener = Listener(socket_path, family='AF_UNIX', authkey=worker_authkey())
+    os.chmod(socket_path, 0o600)
+    
+    logger.info(f"LLM worker {os.getpid()} serving on {socket_path} ({n_threads} threads)")
+    
+    served = 0
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            # Failed handshake (wrong key, client gone); keep serving
+            logger.warning(f"LLM worker connection failed: {e}")
+            continue
+        
+        try:
+            request = conn.recv()
+            
+            if request['op'] == 'health':
+                conn.send({
+                    'type': 'health',
+                    'pid': os.getpid(),
+                    'model_loaded': llm_engine.is_loaded(),
+                    'n_threads': n_threads,
+                    'served': served,
+                    'prefix_cache': llm_engine.prefix_cache_stats(),
+                })
+            
+            elif request['op'] == 'generate':
+                served += 1
+                _serve_generate(conn, llm_engine, request)
+        
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            logger.error(f"LLM worker error: {e}", exc_info=True)
+            try:
+                conn.send({'type': 'error', 'error': str(e)})
+            except (EOFError, OSError):
+                pass
+        finally:
+            conn.close()
+
+
+def _serve_generate(conn, engine, request: Dict):
+    """Run one generation, streaming tokens until done or cancelled"""
+    params = request['params']
+    cache_prefixes = request.get('cache_prefixes', ())
+    
+    if not request.get('stream'):
+        result = engine.generate(
+            prompt=request['prompt'], cache_prefixes=cache_prefixes, **params
+        )
+        conn.send({'type': 'done', 'result': result})
+        return
+    
+    tokens = engine.generate_stream(
+        prompt=request['prompt'], cache_prefixes=cache_prefixes, **params
+    )
+    try:
+        for token in tokens:
+            # A cancel message (or a closed connection) stops generation
+            if conn.poll():
+                conn.recv()
+                logger.info("LLM worker generation cancelled")
+                return
+            conn.send({'type': 'token', 'text': token})
+        conn.send({'type': 'done'})
+    finally:
+        tokens.close()
+
+
+class RemoteLLMEngine:
+    """
+    LLMEngine interface backed by a pool of LLM worker processes
+    
+    Each worker (manage.py run_llm_workers) owns one Llama and listens on
+    its own Unix socket. A request claims an idle worker with a
+    non-blocking flock on the worker's lock file, so web processes share
+    the pool without a broker; the lock is held until the response ends.
+    A request goes to the worker that last served one of its
+    cache_prefixes when that worker is idle, so the prefix snapshot in
+    its KV cache is reused. Prompts are tokenized locally with a
+    vocabulary-only model.
+    """
+    
+    # Prompt prefixes whose last worker is remembered (per process)
+    MAX_AFFINITY_ENTRIES = 1024
+    
+    def __init__(self, socket_dir: str, workers: int, claim_timeout: float = 30.0):
+        """
+        Args:
+            socket_dir: Directory of the workers' sockets and lock files
+            workers: Number of workers in the pool
+            claim_timeout: Seconds to wait for an idle worker
+        """
+        self.socket_dir = socket_dir
+        self.workers = workers
+        self.claim_timeout = claim_timeout
+        self._next = 0
+        self._affinity = OrderedDict()  # prefix digest -> worker index
+        self._affinity_lock = threading.Lock()
+        self._vocab = None
+        self._vocab_lock = threading.Lock()
+    
+    def _claim(self, cache_prefixes: Sequence[str] = ()) -> Tuple[int, int, Any]:
+        """
+        Lock and connect to an idle worker
+        
+        Workers that last served one of cache_prefixes (longest first) are
+        tried before the others, which are tried round-robin.
+        
+        Returns:
+            Worker index, lock file descriptor and open connection
+        """
+        deadline = time.monotonic() + self.claim_timeout
+        digests = [
+            hashlib.sha1(prefix.encode('utf-8')).digest()
+            for prefix in sorted(cache_prefixes, key=len, reverse=True)
+        ]
+        with self._affinity_lock:
+            preferred = [self._affinity[d] for d in digests if d in self._affinity]
+        
+        while True:
+            start = self._next
+            self._next = (self._next + 1) % self.workers
+            
+            order = preferred + [(start + offset) % self.workers for offset in range(self.workers)]
+            for index in dict.fromkeys(order):
+                lock_fd = self._try_lock(index)
+                if lock_fd is None:
+                    continue
+                
+                try:
+                    conn = self._connect(index)
+                except OSError as e:
+                    # Stale socket of a worker that is restarting
+                    logger.warning(f"LLM worker {index} unreachable: {e}")
+                    os.close(lock_fd)
+                    continue
+                
+                self._remember(digests, index)
+                return index, lock_fd, conn
+            
+            if time.monotonic() >= deadline:
+                raise RuntimeError("No LLM worker available")
+            time.sleep(0.05)
+    
+    def _remember(self, digests: List[bytes], index: int):
+        """Record the worker whose KV cache now holds these prefixes"""
+        with self._affinity_lock:
+            for digest in digests:
+                self._affinity[digest] = index
+                self._affinity.move_to_end(digest)
+            while len(self._affinity) > self.MAX_AFFINITY_ENTRIES:
+                self._affinity.popitem(last=False)
+    
+    def _try_lock(self, index: int) -> Optional[int]:
+        """flock a worker's lock file without blocking; None if busy or absent"""
+        path = worker_socket(self.socket_dir, index)
+        if not os.path.exists(path):
+            return None
+        
+        lock_fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_fd
+        except OSError as e:
+            os.close(lock_fd)
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return None
+    
+    def _connect(self, index: int):
+        return Client(
+            worker_socket(self.socket_dir, index),
+            family='AF_UNIX',
+            authkey=worker_authkey()
+        )
+    
+    def generate(
+        self,
+        prompt: str,
+        cache_prefixes: Sequence[str] = (),
+        **params
+    ) -> Dict[str, Any]:
+        """Generate text on a pool worker (same result as LLMEngine.generate)"""
+        index, lock_fd, conn = self._claim(cache_prefixes)
+        try:
+            with conn:
+                conn.send({
+                    'op': 'generate',
+                    'prompt': prompt,
+                    'params': _generation_params(params),
+                    'stream': False,
+                    'cache_prefixes': list(cache_prefixes),
+                })
+                reply = conn.recv()
+        finally:
+            os.close(lock_fd)
+        
+        if reply['type'] == 'error':
+            raise RuntimeError(f"LLM worker {index}: {reply['error']}")
+        return reply['result']
+    
+    def generate_stream(
+        self,
+        prompt: str,
+        cache_prefixes: Sequence[str] = (),
+        **params
+    ) -> Iterator[str]:
+        """Stream tokens from a pool worker; closing the iterator cancels generation"""
+        index, lock_fd, conn = self._claim(cache_prefixes)
+        try:
+            with conn:
+                conn.send({
+                    'op': 'generate',
+                    'prompt': prompt,
+                    'params': _generation_params(params),
+                    'stream': True,
+                    'cache_prefixes': list(cache_prefixes),
+                })
+                
+                finished = False
+                try:
+                    while True:
+                        message = conn.recv()
+                        if message['type'] == 'token':
+                            yield message['text']
+                        elif message['type'] == 'done':
+                            finished = True
+                            return
+                        else:
+                            raise RuntimeError(f"LLM worker {index}: {message['error']}")
+                finally:
+                    if not finished:
+                        try:
+                            conn.send({'op': 'cancel'})
+                        except OSError:
+                            pass
+        finally:
+            os.close(lock_fd)
+    
+    def count_tokens(self, text: str) -> int:
+        """Count tokens (as prompts are tokenized) with a vocabulary-only model copy"""
+        with self._vocab_lock:
+            if self._vocab is None:
+                from django.conf import settings
+                from llama_cpp import Llama
+                
+                self._vocab = Llama(
+                    model_path=settings.MODEL_CONFIG['model_path'],
+                    vocab_only=True,
+                    verbose=False,
+                )
+        return len(self._vocab.tokenize(text.encode('utf-8'), special=True))
+    
+    def health(self) -> List[Dict[str, Any]]:
+        """State of every worker: 'idle' (with its stats), 'busy' or 'down'"""
+        statuses = []
+        
+        for index in range(self.workers):
+            path = worker_socket(self.socket_dir, index)
+            status = {'worker': index, 'socket': path}
+            
+            if not os.path.exists(path):
+                statuses.append(dict(status, state='down'))
+                continue
+            
+            fd = self._try_lock(index)
+            if fd is None:
+                statuses.append(dict(status, state='busy'))
+                continue
+            
+            try:
+                with self._connect(index) as conn:
+                    conn.send({'op': 'health'})
+                    reply = conn.recv()
+                statuses.append(dict(status, state='idle', **{
+                    key: value for key, value in reply.items() if key != 'type'
+                }))
+            except (OSError, EOFError) as e:
+                statuses.append(dict(status, state='down', error=str(e)))
+            finally:
+                os.close(fd)
+        
+        return statuses
+    
+    def is_loaded(self) -> bool:
+        """True when at least one worker is serving"""
+        return any(status['state'] != 'down' for status in self.health())
+    
+    def prefix_cache_stats(self) -> Dict[str, Any]:
+        """Per-worker prompt prefix snapshot counters (idle workers only)"""
+        return {
+            status['worker']: status.get('prefix_cache', {})
+            for status in self.health() if status['state'] == 'idle'
+        }
+
+
+def _generation_params(params: Dict) -> Dict:
+    """Sampling parameters to forward to a worker (drops unrelated MODEL_CONFIG keys)"""
+    return {
+        key: params[key]
+        for key in ('max_tokens', 'temperature', 'top_p', 'top_k', 'stop')
+        if key in params
+    }
+
+
+class WorkerPool:
+    """
+    Supervisor for the LLM worker processes (manage.py run_llm_workers)
+    
+    Starts one spawned process per worker and restarts any that exit.
+    """
+    
+    def __init__(self, socket_dir: str, workers: int, threads_per_worker: int):
+        self.socket_dir = socket_dir
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._context = multiprocessing.get_context('spawn')
+        self._processes = {}    # index -> Process
+        self._started_at = {}   # index -> monotonic start time
+        self._stopping = False
+    
+    def _start(self, index: int):
+        process = self._context.Process(
+            target=serve_worker,
+            args=(worker_socket(self.socket_dir, index), self.threads_per_worker),
+            name=f"llm-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info(f"Started LLM worker {index} (pid {process.pid})")
+    
+    def run(self):
+        """Start the workers and supervise them until stop()"""
+        os.makedirs(self.socket_dir, mode=0o700, exist_ok=True)
+        
+        for index in range(self.workers):
+            self._start(index)
+        
+        while not self._stopping:
+            sentinels = {
+                process.sentinel: index for index, process in self._processes.items()
+            }
+            for sentinel in wait(list(sentinels), timeout=1.0):
+                index = sentinels[sentinel]
+                process = self._processes[index]
+                process.join()
+                if self._stopping:
+                    break
+                
+                logger.error(
+                    f"LLM worker {index} exited with code {process.exitcode}; restarting"
+                )
+                # Do not spin on a worker that dies at startup
+                uptime = time.monotonic() - self._started_at[index]
+                if uptime < RESTART_BACKOFF:
+                    time.sleep(RESTART_BACKOFF - uptime)
+                self._start(index)
+    
+    def stop(self):
+        """Terminate the workers and remove their sockets"""
+        self._stopping = True
+        
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join(timeout=10)
+        
+        for index in range(self.workers):
+            path = worker_socket(self.socket_dir, index)
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,219 @@
+# api/management/commands/benchmark_vector_store.py
+import tempfile
+import time
+import logging
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+
+from api.rag.vector_store_numpy import NumpyVectorStore
+from api.rag.vector_store_ivf import IVFVectorStore
+from api.rag.partitioned_store import rebuild_from_database
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark quantized and approximate vector search (recall vs latency) against the exact store'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Benchmark on this user\'s indexed chunks instead of synthetic data',
+        )
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=100000,
+            help='Number of synthetic vectors (default: 100000)',
+        )
+        parser.add_argument(
+            '--dim',
+            type=int,
+            default=384,
+            help='Dimension of synthetic vectors (default: 384)',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='Number of queries (default: 200)',
+        )
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=10,
+            help='Results per query (default: 10)',
+        )
+        parser.add_argument(
+            '--nlist',
+            type=int,
+            default=0,
+            help='IVF cells (default: about 4 * sqrt(n))',
+        )
+        parser.add_argument(
+            '--nprobe',
+            type=str,
+            default='1,2,4,8,16,32',
+            help='Comma-separated nprobe values to sweep',
+        )
+        parser.add_argument(
+            '--quantization',
+            type=str,
+            default='int8,float16',
+            help='Comma-separated scan representations to compare with float32',
+        )
+        parser.add_argument(
+            '--rerank-factor',
+            type=int,
+            default=4,
+            help='Candidates re-scored exactly per result (default: 4)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed',
+        )
+    
+    def handle(self, *args, **options):
+        # Keep per-add logging out of the report
+        logging.getLogger('api.rag').setLevel(logging.WARNING)
+        
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+        
+        exact = self._build_exact(options, rng)
+        if exact is None:
+            return
+        
+        n = exact.size
+        self.stdout.write(f"Index: {n} vectors, dimension {exact.embedding_dim}")
+        
+        # Queries are perturbed index rows, like questions close to a passage
+        rows = rng.choice(n, options['queries'], replace=n < options['queries'])
+        queries = exact.vectors[rows] + rng.normal(
+            scale=0.05, size=(len(rows), exact.embedding_dim)
+        ).astype(np.float32)
+        
+        exact_results, exact_times = self._run(exact, queries, k)
+        truth = [set(r['chunk_id'] for r in results) for results in exact_results]
+        self._report('exact', truth, exact_results, exact_times, k)
+        self._report_memory('float32', exact)
+        
+        # All queries in one matrix-matrix product
+        start = time.perf_counter()
+        batch_results = exact.search_many(queries, k=k)
+        batch_ms = (time.perf_counter() - start) * 1000
+        self._report(
+            'exact batched', truth, batch_results,
+            np.full(len(queries), batch_ms / len(queries)), k
+        )
+        
+        for quantization in filter(None, options['quantization'].split(',')):
+            store = NumpyVectorStore(
+                embedding_dim=exact.embedding_dim,
+                quantization=quantization,
+                rerank_factor=options['rerank_factor'],
+            )
+            store.add_vectors(exact.vectors, [
+                {'chunk_id': int(chunk_id)} for chunk_id in exact.chunk_ids
+            ])
+            
+            # Served from a snapshot like a partition, float32 rows mapped
+            with tempfile.TemporaryDirectory() as path:
+                store.save(path)
+                store = NumpyVectorStore(
+                    embedding_dim=exact.embedding_dim,
+                    quantization=quantization,
+                    rerank_factor=options['rerank_factor'],
+                )
+                store.load(path)
+            
+            results, times = self._run(store, queries, k)
+            self._report(f"exact {quantization}", truth, results, times, k)
+            self._report_memory(quantization, store)
+        
+        ivf = IVFVectorStore(
+            embedding_dim=exact.embedding_dim,
+            nlist=options['nlist'],
+            min_train_size=0,
+        )
+        ivf.add_vectors(exact.vectors, [
+            {'chunk_id': int(chunk_id)} for chunk_id in exact.chunk_ids
+        ])
+        
+        start = time.perf_counter()
+        ivf.train(seed=options['seed'])
+        self.stdout.write(
+            f"IVF training: {len(ivf.centroids)} cells in "
+            f"{time.perf_counter() - start:.1f}s"
+        )
+        
+        for nprobe in [int(v) for v in options['nprobe'].split(',')]:
+            results, times = self._run(ivf, queries, k, nprobe=nprobe)
+            self._report(f"ivf nprobe={nprobe}", truth, results, times, k)
+    
+    def _build_exact(self, options, rng):
+        """Build the exact store from a user's chunks or synthetic data"""
+        username = options.get('user')
+        
+        if username:
+            try:
+                user = User.objects.get(username=username)
+            except User.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f"User '{username}' not found"))
+                return None
+            
+            from api.rag.embeddings import embedding_service
+            store = NumpyVectorStore(embedding_dim=embedding_service.embedding_dim)
+            rebuild_from_database(store, user.id)
+            
+            if store.size == 0:
+                self.stdout.write(self.style.WARNING("No indexed chunks found"))
+                return None
+            return store
+        
+        # Clustered synthetic data, closer to real embeddings than pure noise
+        n, dim = options['size'], options['dim']
+        clusters = max(1, int(np.sqrt(n)) // 2)
+        centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+        vectors = centers[rng.integers(0, clusters, n)] + rng.normal(
+            scale=0.6, size=(n, dim)
+        ).astype(np.float32)
+        
+        store = NumpyVectorStore(embedding_dim=dim)
+        store.add_vectors(vectors, [{'chunk_id': i + 1} for i in range(n)])
+        return store
+    
+    def _run(self, store, queries, k, **search_options):
+        """Run every query, returning results and per-query latencies (ms)"""
+        results = []
+        times = []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(store.search(query, k=k, **search_options))
+            times.append((time.perf_counter() - start) * 1000)
+        return results, np.array(times)
+    
+    def _report(self, label, truth, results, times, k):
+        """Print recall@k and latency percentiles for one configuration"""
+        hits = [
+            len(expected & set(r['chunk_id'] for r in found))
+            for expected, found in zip(truth, results)
+        ]
+        recall = sum(hits) / max(1, sum(len(expected) for expected in truth))
+        
+        self.stdout.write(
+            f"  {label:<16} recall@{k}: {recall:.3f}  "
+            f"p50: {np.percentile(times, 50):.2f} ms  "
+            f"p95: {np.percentile(times, 95):.2f} ms"
+        )
+    
+    def _report_memory(self, label, store):
+        """Print the bytes the store holds and those one unfiltered scan reads"""
+        self.stdout.write(
+            f"  {'':<16} {label}: resident {store.nbytes / (1024 * 1024):.1f} MB, "
+            f"scanned per query {store.scan_nbytes / (1024 * 1024):.1f} MB"
+        )
@@ -0,0 +1,183 @@
+# api/management/commands/export_embedding_onnx.py
+import inspect
+import os
+import time
+import logging
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+logger = logging.getLogger(__name__)
+
+# Sample texts for the numerical check, short and long
+CHECK_TEXTS = [
+    "What are the termination conditions?",
+    "The lessee shall indemnify the lessor against all claims arising from the use of the premises.",
+    "Section 420 IPC: cheating and dishonestly inducing delivery of property.",
+    "Notwithstanding anything contained herein, either party may terminate this Agreement "
+    "upon thirty (30) days' written notice to the other party, provided that all fees "
+    "accrued up to the date of termination shall remain payable. " * 4,
+    "force majeure",
+]
+
+
+class Command(BaseCommand):
+    help = 'Export the embedding model to ONNX (optionally int8-quantised) and check it against torch'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model-path',
+            type=str,
+            help='sentence-transformers model directory (default: EMBEDDING_CONFIG model_path)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='onnx/model.onnx',
+            help='Output file, relative to the model directory (default: onnx/model.onnx)',
+        )
+        parser.add_argument(
+            '--quantize',
+            action='store_true',
+            help='Also write an int8 dynamically quantised model (model_qint8.onnx)',
+        )
+        parser.add_argument(
+            '--check-only',
+            action='store_true',
+            help='Skip the export and only check existing ONNX files',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=1e-4,
+            help='Max abs difference to torch for the fp32 export (default: 1e-4)',
+        )
+        parser.add_argument(
+            '--int8-min-cosine',
+            type=float,
+            default=0.99,
+            help='Min cosine similarity to torch for the int8 export (default: 0.99)',
+        )
+    
+    def handle(self, *args, **options):
+        model_path = options.get('model_path') or settings.EMBEDDING_CONFIG['model_path']
+        
+        if not os.path.isdir(model_path):
+            raise CommandError(f"Model directory not found: {model_path}")
+        
+        output = options['output']
+        quantized = os.path.join(os.path.dirname(output), 'model_qint8.onnx')
+        
+        from sentence_transformers import SentenceTransformer
+        torch_model = SentenceTransformer(model_path, device='cpu')
+        
+        if not options['check_only']:
+            self._export(torch_model, os.path.join(model_path, output))
+            if options['quantize']:
+                self._quantize(
+                    os.path.join(model_path, output),
+                    os.path.join(model_path, quantized)
+                )
+        
+        # Numerical check against the torch backend
+        reference = torch_model.encode(CHECK_TEXTS, convert_to_numpy=True)
+        failed = not self._check(
+            model_path, output, reference, max_diff=options['tolerance']
+        )
+        
+        if os.path.exists(os.path.join(model_path, quantized)):
+            failed |= not self._check(
+                model_path, quantized, reference, min_cosine=options['int8_min_cosine']
+            )
+        
+        if failed:
+            raise CommandError("ONNX output differs from torch beyond tolerance")
+    
+    def _export(self, torch_model, path):
+        """Export the transformer (token embeddings) with dynamic batch/sequence axes"""
+        import torch
+        
+        transformer = torch_model[0].auto_model.eval()
+        tokenizer = torch_model.tokenizer
+        
+        class TokenEmbeddings(torch.nn.Module):
+            """Return only last_hidden_state; pooling runs in numpy"""
+            
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+            
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    token_type_ids=token_type_ids,
+                )[0]
+        
+        sample = tokenizer(
+            CHECK_TEXTS[:2], padding=True, truncation=True, return_tensors='pt'
+        )
+        inputs = (
+            sample['input_ids'],
+            sample['attention_mask'],
+            sample.get('token_type_ids', torch.zeros_like(sample['input_ids'])),
+        )
+        dynamic = {0: 'batch', 1: 'sequence'}
+        
+        # Newer torch defaults to the dynamo exporter; keep the tracing one
+        export_options = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            export_options['dynamo'] = False
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                TokenEmbeddings(transformer),
+                inputs,
+                path,
+                input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+                output_names=['last_hidden_state'],
+                dynamic_axes={
+                    'input_ids': dynamic,
+                    'attention_mask': dynamic,
+                    'token_type_ids': dynamic,
+                    'last_hidden_state': dynamic,
+                },
+                opset_version=14,
+                **export_options
+            )
+        
+        self.stdout.write(self.style.SUCCESS(f"Exported {path}"))
+    
+    def _quantize(self, source, target):
+        """Write an int8 dynamically quantised copy (weights int8, activations fp32)"""
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        
+        quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+        self.stdout.write(self.style.SUCCESS(f"Quantised {target}"))
+    
+    def _check(self, model_path, onnx_file, reference, max_diff=None, min_cosine=None):
+        """Compare ONNX embeddings with torch ones; return whether within tolerance"""
+        from api.rag.onnx_encoder import OnnxSentenceEncoder
+        
+        encoder = OnnxSentenceEncoder(model_path, onnx_file=onnx_file)
+        
+        start = time.perf_counter()
+        embeddings = encoder.encode(CHECK_TEXTS)
+        elapsed = (time.perf_counter() - start) * 1000
+        
+        diff = float(np.abs(embeddings - reference).max())
+        cosine = float(np.min(
+            np.sum(embeddings * reference, axis=1)
+            / (np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1))
+        ))
+        
+        ok = (max_diff is None or diff <= max_diff) and (
+            min_cosine is None or cosine >= min_cosine
+        )
+        style = self.style.SUCCESS if ok else self.style.ERROR
+        self.stdout.write(style(
+            f"  {onnx_file:<24} max abs diff: {diff:.2e}  min cosine: {cosine:.5f}  "
+            f"encode: {elapsed:.1f} ms  {'OK' if ok else 'FAILED'}"
+        ))
+        return ok
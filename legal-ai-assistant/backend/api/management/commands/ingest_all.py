@@ -27,11 +27,17 @@ class Command(BaseCommand):
             type=str,
             help='Only ingest documents of this type',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Worker processes for extraction and embedding (0 = one per core)',
+        )
 
     def handle(self, *args, **options):
         username = options.get('user')
         reindex = options.get('reindex', False)
         doctype = options.get('doctype')
+        workers = options.get('workers')
         
         # Get documents
         queryset = Document.objects.all()
@@ -58,7 +64,9 @@ class Command(BaseCommand):
         self.stdout.write(f"Ingesting {len(documents)} documents...")
         
         # Ingest
-        result = ingestion_service.ingest_multiple(documents, reindex=reindex)
+        result = ingestion_service.ingest_multiple(
+            documents, reindex=reindex, workers=workers
+        )
         
         # Report results
         self.stdout.write(
@@ -0,0 +1,45 @@
+# api/management/commands/reembed_chunks.py
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from api.rag.ingestion import ingestion_service
+from api.rag.embeddings import embedding_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Re-embed chunks that were embedded by a different model than the configured one'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Username to re-embed chunks for (optional)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=512,
+            help='Chunks embedded and written per batch (default: 512)',
+        )
+    
+    def handle(self, *args, **options):
+        username = options.get('user')
+        user_id = None
+        
+        if username:
+            try:
+                user_id = User.objects.get(username=username).id
+            except User.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f"User '{username}' not found"))
+                return
+        
+        self.stdout.write(f"Current embedding model: {embedding_service.model_fingerprint}")
+        
+        total = ingestion_service.reembed_stale_chunks(
+            user_id=user_id,
+            batch_size=options['batch_size']
+        )
+        
+        self.stdout.write(self.style.SUCCESS(f"Re-embedded {total} chunks"))
@@ -0,0 +1,58 @@
+# api/management/commands/run_llm_workers.py
+import os
+import signal
+import logging
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.inference.worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run the pool of LLM worker processes that web processes generate on'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Worker processes, one model copy each (default: MODEL_CONFIG workers)',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            help='Inference threads per worker (default: MODEL_CONFIG worker_threads, 0 = cores / workers)',
+        )
+        parser.add_argument(
+            '--socket-dir',
+            type=str,
+            help='Directory for the worker sockets (default: MODEL_CONFIG worker_socket_dir)',
+        )
+    
+    def handle(self, *args, **options):
+        model_config = settings.MODEL_CONFIG
+        
+        socket_dir = options.get('socket_dir') or model_config.get('worker_socket_dir')
+        if not socket_dir:
+            raise CommandError("Set LLM_WORKER_SOCKET_DIR or pass --socket-dir")
+        
+        workers = options.get('workers') or model_config.get('workers', 1)
+        threads = options.get('threads') or model_config.get('worker_threads', 0)
+        if not threads:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+        
+        pool = WorkerPool(socket_dir, workers, threads)
+        
+        def shutdown(signum, frame):
+            self.stdout.write("Stopping LLM workers...")
+            pool.stop()
+        
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        
+        self.stdout.write(
+            f"Starting {workers} LLM workers x {threads} threads on {socket_dir}"
+        )
+        pool.run()
+        self.stdout.write(self.style.SUCCESS("LLM workers stopped"))
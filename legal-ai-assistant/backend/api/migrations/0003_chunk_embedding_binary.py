@@ -0,0 +1,63 @@
+# Generated by Django 4.2.13
+
+from django.db import migrations, models
+import numpy as np
+
+
+BATCH_SIZE = 2000
+
+
+def json_to_binary(apps, schema_editor):
+    """Convert JSON float lists into raw float32 bytes"""
+    Chunk = apps.get_model('api', 'Chunk')
+    chunks = Chunk.objects.filter(embedding_json__isnull=False).only('id', 'embedding_json')
+    
+    batch = []
+    for chunk in chunks.iterator(chunk_size=BATCH_SIZE):
+        chunk.embedding = np.asarray(chunk.embedding_json, dtype=np.float32).tobytes()
+        batch.append(chunk)
+        if len(batch) >= BATCH_SIZE:
+            Chunk.objects.bulk_update(batch, ['embedding'])
+            batch = []
+    
+    if batch:
+        Chunk.objects.bulk_update(batch, ['embedding'])
+
+
+def binary_to_json(apps, schema_editor):
+    """Convert raw float32 bytes back into JSON float lists"""
+    Chunk = apps.get_model('api', 'Chunk')
+    chunks = Chunk.objects.filter(embedding__isnull=False).only('id', 'embedding')
+    
+    batch = []
+    for chunk in chunks.iterator(chunk_size=BATCH_SIZE):
+        chunk.embedding_json = np.frombuffer(
+            bytes(chunk.embedding), dtype=np.float32
+        ).tolist()
+        batch.append(chunk)
+        if len(batch) >= BATCH_SIZE:
+            Chunk.objects.bulk_update(batch, ['embedding_json'])
+            batch = []
+    
+    if batch:
+        Chunk.objects.bulk_update(batch, ['embedding_json'])
+
+
+class Migration(migrations.Migration):
+    
+    dependencies = [
+        ('api', '0002_chatlog_document'),
+    ]
+    
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='chunk',
+            name='embedding_json',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_embeddingcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='embedding_model',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+    ]
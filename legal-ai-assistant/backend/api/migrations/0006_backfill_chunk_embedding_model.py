@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7
+
+from django.db import migrations
+from django.db.models.functions import Length
+
+
+def stamp_configured_model(apps, schema_editor):
+    """
+    Stamp embeddings stored before fingerprinting with the configured model
+    
+    Those rows were produced by the model configured at upgrade time, so
+    they stay searchable instead of all being treated as stale. Rows whose
+    size does not match the model's dimension are left unstamped and get
+    re-embedded.
+    """
+    Chunk = apps.get_model('api', 'Chunk')
+    legacy = Chunk.objects.filter(embedding__isnull=False, embedding_model='')
+    if not legacy.exists():
+        return
+    
+    from api.rag.embeddings import embedding_service
+    
+    legacy.annotate(
+        embedding_bytes=Length('embedding')
+    ).filter(
+        embedding_bytes=embedding_service.embedding_dim * 4
+    ).update(
+        embedding_model=embedding_service.model_fingerprint
+    )
+
+
+class Migration(migrations.Migration):
+    
+    dependencies = [
+        ('api', '0005_chunk_embedding_model'),
+    ]
+    
+    operations = [
+        migrations.RunPython(stamp_configured_model, migrations.RunPython.noop),
+    ]
@@ -6,6 +6,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 import json
+import numpy as np
 
 
 class OrgProfile(models.Model):
@@ -106,7 +107,8 @@ class Chunk(models.Model):
     ord = models.IntegerField()  # Order within document
     heading = models.CharField(max_length=500, blank=True)  # Section heading if available
     text = models.TextField()  # The actual chunk text
-    embedding_json = models.JSONField(null=True, blank=True)  # Vector embedding as list
+    embedding = models.BinaryField(null=True, blank=True)  # Vector embedding as raw float32 bytes
+    embedding_model = models.CharField(max_length=100, blank=True, default='', db_index=True)  # Fingerprint of the model that produced embedding
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -121,14 +123,28 @@ class Chunk(models.Model):
         return f"Chunk {self.ord} of {self.document.title}"
 
     def get_embedding(self):
-        """Parse embedding from JSON"""
-        if self.embedding_json:
-            return self.embedding_json
+        """Decode embedding bytes into a float32 vector"""
+        if self.embedding:
+            return np.frombuffer(bytes(self.embedding), dtype=np.float32)
         return None
 
-    def set_embedding(self, embedding_vector):
-        """Store embedding as JSON"""
-        self.embedding_json = embedding_vector
+    def set_embedding(self, embedding_vector, model_fingerprint=''):
+        """Store embedding as raw float32 bytes, stamped with the model that produced it"""
+        self.embedding = np.asarray(embedding_vector, dtype=np.float32).tobytes()
+        self.embedding_model = model_fingerprint
+
+
+class EmbeddingCacheEntry(models.Model):
+    """Content-addressed cache of chunk embeddings (see api/rag/embedding_cache.py)"""
+    key = models.CharField(max_length=64, unique=True)  # sha256 of model fingerprint + normalised text
+    embedding = models.BinaryField()  # float32 vector as raw bytes
+    last_used_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        db_table = 'embedding_cache'
+
+    def __str__(self):
+        return f"Embedding {self.key[:12]}"
 
 
 class AuditLog(models.Model):
@@ -1,7 +1,6 @@
 # api/rag/chunker.py
 import re
-import nltk
-from typing import List, Dict, Optional
+from typing import Iterable, Iterator, List, Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -150,42 +149,124 @@ class DocumentChunker:
         """
         Split text into chunks with overlap
         """
-        chunks = []
+        state = {'chunk': '', 'start': start_position}
         
         # Split by sentences
-        sentences = nltk.sent_tokenize(text)
+        chunks = list(self._accumulate(state, _sent_tokenize(text), heading))
         
-        current_chunk = ""
-        chunk_start = start_position
+        # Add final chunk
+        final_chunk = self._final_chunk(state, heading)
+        if final_chunk:
+            chunks.append(final_chunk)
         
+        return chunks
+    
+    def _accumulate(
+        self,
+        state: Dict,
+        sentences: Iterable[str],
+        heading: str = ""
+    ) -> Iterator[Dict]:
+        """Add sentences to the open chunk, yielding each chunk that fills up"""
         for sentence in sentences:
+            current_chunk = state['chunk']
+            
             # Check if adding sentence exceeds chunk size
             if len(current_chunk) + len(sentence) > self.chunk_size and current_chunk:
                 # Save current chunk
-                chunks.append({
+                yield {
                     'text': current_chunk.strip(),
                     'heading': heading,
-                    'char_start': chunk_start,
-                    'char_end': chunk_start + len(current_chunk)
-                })
+                    'char_start': state['start'],
+                    'char_end': state['start'] + len(current_chunk)
+                }
                 
                 # Start new chunk with overlap
                 overlap_text = self._get_overlap(current_chunk)
-                current_chunk = overlap_text + " " + sentence
-                chunk_start = chunk_start + len(current_chunk) - len(overlap_text)
+                state['chunk'] = overlap_text + " " + sentence
+                state['start'] = state['start'] + len(state['chunk']) - len(overlap_text)
             else:
-                current_chunk += " " + sentence if current_chunk else sentence
-        
-        # Add final chunk
+                state['chunk'] = current_chunk + " " + sentence if current_chunk else sentence
+    
+    def _final_chunk(self, state: Dict, heading: str = "") -> Optional[Dict]:
+        """The open chunk, if it is long enough to keep"""
+        current_chunk = state['chunk']
         if current_chunk.strip() and len(current_chunk.strip()) >= self.min_chunk_size:
-            chunks.append({
+            return {
                 'text': current_chunk.strip(),
                 'heading': heading,
-                'char_start': chunk_start,
-                'char_end': chunk_start + len(current_chunk)
-            })
+                'char_start': state['start'],
+                'char_end': state['start'] + len(current_chunk)
+            }
+        return None
+    
+    def iter_chunks(
+        self,
+        pages: Iterable[str],
+        metadata: Optional[Dict] = None
+    ) -> Iterator[Dict]:
+        """
+        Chunk a stream of pages (or any consecutive text blocks) lazily
         
-        return chunks
+        Only the current page and the sentence running across its end are
+        held in memory. The trailing sentence of each page is carried into
+        the next one, so the chunks match chunk_text on the joined text
+        (except that a sentence longer than chunk_size is cut at a page end).
+        
+        Args:
+            pages: Text blocks in document order
+            metadata: Additional metadata to include
+        
+        Yields:
+            Chunk dictionaries, as returned by chunk_text
+        """
+        state = {'chunk': '', 'start': 0}
+        carry = ''
+        emitted = 0
+        
+        for page in pages:
+            text = carry + page
+            sentences = _sent_tokenize(self._clean_text(text))
+            if not sentences:
+                carry = text
+                continue
+            
+            # The last sentence may continue on the next page
+            carry = sentences.pop() + (' ' if text[-1:].isspace() else '')
+            if len(carry) > self.chunk_size:
+                # Text without sentence boundaries: chunk it now rather
+                # than carry (and re-tokenize) it over every later page
+                sentences.append(carry)
+                carry = ''
+            
+            for chunk in self._accumulate(state, sentences):
+                chunk['ord'] = emitted
+                chunk['metadata'] = metadata or {}
+                emitted += 1
+                yield chunk
+        
+        final_sentences = _sent_tokenize(self._clean_text(carry))
+        chunks = list(self._accumulate(state, final_sentences))
+        
+        final_chunk = self._final_chunk(state)
+        if not emitted and not chunks and len(state['chunk']) <= self.chunk_size:
+            # A short document is kept as one chunk, however small
+            final_chunk = {
+                'text': state['chunk'],
+                'heading': '',
+                'char_start': 0,
+                'char_end': len(state['chunk'])
+            } if state['chunk'] else None
+        if final_chunk:
+            chunks.append(final_chunk)
+        
+        for chunk in chunks:
+            chunk['ord'] = emitted
+            chunk['metadata'] = metadata or {}
+            emitted += 1
+            yield chunk
+        
+        logger.info(f"Created {emitted} chunks from document stream")
     
     def _get_overlap(self, text: str) -> str:
         """Get overlap text from end of chunk"""
@@ -193,7 +274,7 @@ class DocumentChunker:
             return text
         
         # Try to get overlap at sentence boundary
-        sentences = nltk.sent_tokenize(text)
+        sentences = _sent_tokenize(text)
         overlap = ""
         
         for sentence in reversed(sentences):
@@ -209,6 +290,12 @@ class DocumentChunker:
         return overlap.strip()
 
 
+def _sent_tokenize(text: str) -> List[str]:
+    """Split text into sentences (nltk pulls in scipy, so it is imported on first use)"""
+    import nltk
+    return nltk.sent_tokenize(text)
+
+
 # Factory function
 def create_chunker(chunk_size: int = 500, chunk_overlap: int = 100) -> DocumentChunker:
     """Create a document chunker with specified parameters"""
@@ -0,0 +1,154 @@
+# api/rag/embedding_batcher.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Union
+import logging
+import numpy as np
+
+from .embeddings import embedding_service
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching dispatcher in front of EmbeddingService
+    
+    Concurrent encode calls (typically one query each) are queued and a
+    single dispatcher thread runs them as one forward pass: it takes the
+    first waiting call, then gathers more for up to max_wait_ms or until
+    max_batch_size texts are collected, and hands each caller its rows.
+    """
+    
+    def __init__(
+        self,
+        service=None,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None
+    ):
+        """
+        Args:
+            service: Embedding service to batch for (default: global service)
+            max_batch_size: Max texts per forward pass (<= 1 disables
+                batching, None = from settings)
+            max_wait_ms: How long to wait for more calls once one is queued
+                (None = from settings)
+        """
+        from django.conf import settings
+        
+        rag_config = settings.RAG_CONFIG
+        if max_batch_size is None:
+            max_batch_size = rag_config.get('embedding_batch_size', 64)
+        if max_wait_ms is None:
+            max_wait_ms = rag_config.get('embedding_batch_wait_ms', 2.0)
+        
+        self.service = service or embedding_service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+    
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """
+        Generate embeddings, batched with other concurrent callers
+        
+        Args:
+            texts: Single text or list of texts
+        
+        Returns:
+            numpy array of embeddings, one row per text
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        
+        # Large requests are batches already
+        if self.max_batch_size <= 1 or len(texts) >= self.max_batch_size:
+            return self.service.encode(texts, batch_size=self.max_batch_size or 32)
+        
+        self._ensure_running()
+        future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+    
+    def encode_single(self, text: str) -> np.ndarray:
+        """Generate embedding for a single text"""
+        return self.encode([text])[0]
+    
+    def _ensure_running(self):
+        """Start the dispatcher thread (again after a fork)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='embedding-batcher',
+                daemon=True,
+            )
+            self._thread.start()
+    
+    def _run(self):
+        """Dispatcher loop: gather queued calls and encode them together"""
+        while True:
+            requests = [self._queue.get()]
+            count = len(requests[0][0])
+            deadline = time.monotonic() + self.max_wait
+            
+            while count < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        request = self._queue.get(timeout=timeout)
+                    else:
+                        request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                requests.append(request)
+                count += len(request[0])
+            
+            self._dispatch(requests)
+    
+    def _dispatch(self, requests):
+        """Encode one gathered batch and resolve each caller's future"""
+        texts = [text for request_texts, _ in requests for text in request_texts]
+        
+        try:
+            embeddings = self.service.encode(texts, batch_size=len(texts))
+        except Exception as e:
+            logger.error(f"Batched embedding error: {e}")
+            for _, future in requests:
+                future.set_exception(e)
+            return
+        
+        self.batches += 1
+        self.texts += len(texts)
+        
+        start = 0
+        for request_texts, future in requests:
+            end = start + len(request_texts)
+            future.set_result(embeddings[start:end])
+            start = end
+    
+    def stats(self) -> dict:
+        """Batches run and average batch size in this process"""
+        return {
+            'batches': self.batches,
+            'texts': self.texts,
+            'avg_batch_size': self.texts / self.batches if self.batches else 0.0,
+        }
+
+
+# Global instance
+embedding_batcher = EmbeddingBatcher()
@@ -0,0 +1,184 @@
+# api/rag/embedding_cache.py
+import hashlib
+from typing import Dict, Iterable, List, Optional, Set
+import logging
+import numpy as np
+from django.db import DatabaseError
+from django.utils import timezone
+
+from ..models import EmbeddingCacheEntry
+from .embeddings import embedding_service
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of chunk embeddings
+    
+    Entries are keyed by sha256(model fingerprint + normalised chunk
+    text), so a reindexed document only embeds the chunks whose text
+    changed, and boilerplate repeated across documents is embedded once.
+    The table is kept under max_entries by evicting the least recently
+    used rows.
+    """
+    
+    # Keys per IN (...) lookup, below SQLite's bound-parameter limit
+    LOOKUP_BATCH_SIZE = 500
+    
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Args:
+            max_entries: Max cached embeddings (0 = disabled, None = from settings)
+        """
+        if max_entries is None:
+            from django.conf import settings
+            max_entries = settings.RAG_CONFIG.get('embedding_cache_size', 200000)
+        
+        self.max_entries = max_entries
+        self.embedding_service = embedding_service
+    
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Collapse whitespace so re-extracted text maps to the same key"""
+        return ' '.join(text.split())
+    
+    def key(self, text: str) -> str:
+        """Cache key of a chunk text for the current model"""
+        content = f"{self.embedding_service.model_fingerprint}\0{self.normalize_text(text)}"
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        pending_entries: Optional[Dict[str, np.ndarray]] = None,
+        pending_hits: Optional[Set[str]] = None
+    ) -> np.ndarray:
+        """
+        Embed texts, reusing cached embeddings and encoding only misses
+        
+        Args:
+            texts: Chunk texts
+            batch_size: Batch size for encoding the misses
+            pending_entries: If given, new embeddings are collected here (by
+                key) for a later store() instead of being written immediately
+            pending_hits: If given, keys of cache hits are collected here for
+                a later touch() instead of being marked as used immediately
+        
+        Returns:
+            numpy array of embeddings, one row per text
+        """
+        if not self.max_entries or not texts:
+            return self.embedding_service.encode(texts, batch_size=batch_size)
+        
+        keys = [self.key(text) for text in texts]
+        cached = self._lookup(keys)
+        if pending_hits is not None:
+            pending_hits.update(cached)
+        else:
+            self.touch(cached)
+        
+        # Encode each distinct missing text once
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in cached and key not in missing:
+                missing[key] = i
+        
+        if missing:
+            encoded = self.embedding_service.encode(
+                [texts[i] for i in missing.values()],
+                batch_size=batch_size
+            )
+            new_entries = dict(zip(missing, np.asarray(encoded, dtype=np.float32)))
+            if pending_entries is not None:
+                pending_entries.update(new_entries)
+            else:
+                self.store(new_entries)
+            cached.update(new_entries)
+        
+        logger.info(
+            f"Embedding cache: {len(texts) - len(missing)} hits, "
+            f"{len(missing)} misses"
+        )
+        
+        return np.stack([cached[key] for key in keys])
+    
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Fetch cached embeddings for keys (read-only)"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        
+        try:
+            for start in range(0, len(unique_keys), self.LOOKUP_BATCH_SIZE):
+                batch = unique_keys[start:start + self.LOOKUP_BATCH_SIZE]
+                rows = EmbeddingCacheEntry.objects.filter(key__in=batch).values_list(
+                    'key', 'embedding'
+                )
+                for key, embedding in rows:
+                    found[key] = np.frombuffer(bytes(embedding), dtype=np.float32)
+        except DatabaseError as e:
+            logger.warning(f"Embedding cache lookup failed: {e}")
+            return {}
+        
+        dim = self.embedding_service.embedding_dim
+        return {key: vec for key, vec in found.items() if len(vec) == dim}
+    
+    def touch(self, keys: Iterable[str]):
+        """Mark entries as recently used, so eviction keeps them"""
+        if not self.max_entries:
+            return
+        
+        keys = list(keys)
+        try:
+            for start in range(0, len(keys), self.LOOKUP_BATCH_SIZE):
+                EmbeddingCacheEntry.objects.filter(
+                    key__in=keys[start:start + self.LOOKUP_BATCH_SIZE]
+                ).update(last_used_at=timezone.now())
+        except DatabaseError as e:
+            logger.warning(f"Embedding cache update failed: {e}")
+    
+    def store(self, entries: Dict[str, np.ndarray]):
+        """Insert new embeddings and evict the least recently used overflow"""
+        if not self.max_entries or not entries:
+            return
+        
+        try:
+            EmbeddingCacheEntry.objects.bulk_create(
+                [
+                    EmbeddingCacheEntry(key=key, embedding=embedding.tobytes())
+                    for key, embedding in entries.items()
+                ],
+                batch_size=self.LOOKUP_BATCH_SIZE,
+                ignore_conflicts=True
+            )
+            self._evict()
+        except DatabaseError as e:
+            logger.warning(f"Embedding cache write failed: {e}")
+    
+    def _evict(self):
+        """Delete least recently used entries beyond max_entries"""
+        overflow = EmbeddingCacheEntry.objects.count() - self.max_entries
+        if overflow <= 0:
+            return
+        
+        # Evict a little extra so inserts do not trigger eviction every time
+        overflow += self.max_entries // 10
+        stale_ids = list(
+            EmbeddingCacheEntry.objects.order_by('last_used_at')
+            .values_list('id', flat=True)[:overflow]
+        )
+        for start in range(0, len(stale_ids), self.LOOKUP_BATCH_SIZE):
+            EmbeddingCacheEntry.objects.filter(
+                id__in=stale_ids[start:start + self.LOOKUP_BATCH_SIZE]
+            ).delete()
+        
+        logger.info(f"Evicted {len(stale_ids)} entries from embedding cache")
+    
+    def clear(self):
+        """Drop every cached embedding"""
+        EmbeddingCacheEntry.objects.all().delete()
+
+
+# Global instance
+embedding_cache = EmbeddingCache()
@@ -1,20 +1,41 @@
 # api/rag/embeddings.py
-from sentence_transformers import SentenceTransformer
 import numpy as np
+import hashlib
+import json
 import logging
-from typing import List, Union
+import threading
+from typing import List, Optional, Union
 # import os for checking local path
 import os 
 
 logger = logging.getLogger(__name__)
 
-LOCAL_MODEL_PATH = '/Users/gokuldasgirishkumar/code/legal_adivisor/legal-ai-assistant/backend/api/rag/local_models/all-MiniLM-L6-v2' 
+# Files whose contents identify a model in its fingerprint (weights by size)
+FINGERPRINT_CONFIG_FILES = [
+    'config.json',
+    'modules.json',
+    'sentence_bert_config.json',
+    '1_Pooling/config.json',
+]
+FINGERPRINT_WEIGHT_SUFFIXES = ('.safetensors', '.bin')
+
 
 class EmbeddingService:
-    """Service for generating text embeddings"""
+    """
+    Service for generating text embeddings
+    
+    The model (and torch / ONNX Runtime) is loaded on first encode or by
+    warm_up(), not at import, so processes that never embed do not pay
+    for it. Model id and dimension are read from the model's config files.
+    
+    model_fingerprint identifies the model that produced an embedding; it
+    is stamped on stored chunk embeddings and persisted indexes so a model
+    swap is detected instead of silently mixing vector spaces.
+    """
     
     _instance = None
     _model = None
+    _load_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
@@ -22,28 +43,88 @@ class EmbeddingService:
         return cls._instance
     
     def __init__(self):
+        if not hasattr(self, '_model_path'):
+            from django.conf import settings
+            
+            self._configured_path = settings.EMBEDDING_CONFIG['model_path']
+            self._model_path = self._resolve_model_path(self._configured_path)
+            self._model_id = os.path.basename(self._model_path.rstrip('/'))
+            self._embedding_dim = self._configured_dimension(self._model_path)
+            self._fingerprint = None
+    
+    @staticmethod
+    def _resolve_model_path(configured_path: str) -> str:
+        """Local model directory, or its hub name if it is missing"""
+        if os.path.exists(configured_path):
+            return configured_path
+        # Fallback to the hub (Only works if temporary online access is okay)
+        return os.path.basename(configured_path.rstrip('/'))
+    
+    @staticmethod
+    def _configured_dimension(model_path: str) -> Optional[int]:
+        """Embedding dimension from the sentence-transformers config, without loading weights"""
+        for config_file, key in (
+            ('1_Pooling/config.json', 'word_embedding_dimension'),
+            ('config.json', 'hidden_size'),
+        ):
+            try:
+                with open(os.path.join(model_path, config_file)) as f:
+                    return int(json.load(f)[key])
+            except (OSError, ValueError, KeyError):
+                continue
+        return None
+    
+    def _ensure_loaded(self):
+        """Load the model on first use"""
         if self._model is None:
-            self.load_model()
+            with self._load_lock:
+                if self._model is None:
+                    self.load_model()
     
     def load_model(self):
         """Load the sentence transformer model"""
         
         # 1. Determine the path to load from
-        if os.path.exists(LOCAL_MODEL_PATH):
-            model_path = LOCAL_MODEL_PATH
+        model_path = self._model_path
+        if model_path == self._configured_path:
             logger.info(f"Loading embedding model from **LOCAL PATH**: {model_path}")
         else:
-            # 2. Fallback or use original setting (Only use this line if temporary online access is okay)
-            model_path = 'all-MiniLM-L6-v2' 
-            logger.warning(f"Local model not found at {LOCAL_MODEL_PATH}. Attempting to load **ONLINE** from: {model_path}")
-            
+            # 2. Fallback to the hub name
+            logger.warning(f"Local model not found at {self._configured_path}. Attempting to load **ONLINE** from: {model_path}")
+        
+        from django.conf import settings
+        embedding_config = settings.EMBEDDING_CONFIG
+        backend = embedding_config.get('backend', 'torch')
+        
         try:
             # Load the model from the determined path/name
-            self._model = SentenceTransformer(model_path)
-            self._embedding_dim = 384
-            
-            logger.info(f"Embedding model loaded. Dimension: {self._embedding_dim}")
+            if backend == 'onnx':
+                # ONNX Runtime: no torch import, faster CPU inference
+                from .onnx_encoder import OnnxSentenceEncoder
+                self._model = OnnxSentenceEncoder(
+                    model_path,
+                    onnx_file=embedding_config['onnx_file'],
+                    num_threads=embedding_config['onnx_threads'],
+                )
+            else:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(model_path)
+                detected_dim = model.get_sentence_embedding_dimension()
+                if self._embedding_dim not in (None, detected_dim):
+                    logger.warning(
+                        f"Model config declares dimension {self._embedding_dim}, "
+                        f"model produces {detected_dim}; using {detected_dim}"
+                    )
+                    self._fingerprint = None
+                self._embedding_dim = detected_dim
+                self._model = model
+            self._backend = backend
             
+            logger.info(
+                f"Embedding model loaded ({backend} backend). "
+                f"Dimension: {self._embedding_dim}"
+            )
+        
         except Exception as e:
             # Raise an informative error if it fails to load
             logger.error(f"Failed to load embedding model from {model_path}. Error: {e}")
@@ -60,8 +141,7 @@ class EmbeddingService:
         Returns:
             numpy array of embeddings
         """
-        if self._model is None:
-            raise RuntimeError("Embedding model not loaded")
+        self._ensure_loaded()
         
         # Convert single text to list
         if isinstance(texts, str):
@@ -84,15 +164,77 @@ class EmbeddingService:
         """Generate embedding for a single text"""
         return self.encode(text)[0]
     
+    @property
+    def model_id(self) -> str:
+        """Name of the loaded model (used to key cached embeddings)"""
+        return self._model_id
+    
+    @property
+    def model_fingerprint(self) -> str:
+        """
+        Identifier of the model's vector space: '<name>-<dim>-<hash>'
+        
+        The hash covers the model's config files and weight file sizes, so
+        retrained or swapped weights under the same name get a new one.
+        Runtime backends (torch / ONNX) share a fingerprint.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha256(self._model_id.encode('utf-8'))
+            
+            for config_file in FINGERPRINT_CONFIG_FILES:
+                try:
+                    with open(os.path.join(self._model_path, config_file), 'rb') as f:
+                        digest.update(config_file.encode('utf-8') + b'\0' + f.read())
+                except OSError:
+                    continue
+            
+            if os.path.isdir(self._model_path):
+                for name in sorted(os.listdir(self._model_path)):
+                    if name.endswith(FINGERPRINT_WEIGHT_SUFFIXES):
+                        size = os.path.getsize(os.path.join(self._model_path, name))
+                        digest.update(f"{name}\0{size}".encode('utf-8'))
+            
+            self._fingerprint = (
+                f"{self._model_id}-{self.embedding_dim}-{digest.hexdigest()[:12]}"
+            )
+        return self._fingerprint
+    
     @property
     def embedding_dim(self) -> int:
-        """Get embedding dimension"""
+        """Get embedding dimension (loads the model only if no config declares it)"""
+        if self._embedding_dim is None:
+            self._ensure_loaded()
         return self._embedding_dim
     
     def is_loaded(self) -> bool:
         """Check if model is loaded"""
         return self._model is not None
+    
+    def warm_up(self):
+        """Load the model and run one encode so the first request is not slow"""
+        self._ensure_loaded()
+        self.encode("warm up")
+
+
+# Global instance (the model itself loads on first use)
+embedding_service = EmbeddingService()
 
 
-# Global instance
-embedding_service = EmbeddingService()
\ No newline at end of file
+def warm_up_embedding_model(config_key: str = 'warm_load'):
+    """
+    Load the embedding model at process start (Django/Celery worker boot)
+    
+    Args:
+        config_key: EMBEDDING_CONFIG flag that enables it ('warm_load' for
+            web servers, 'worker_warm_load' for Celery workers, which
+            mostly never embed and load the model on first use)
+    """
+    from django.conf import settings
+    
+    if not settings.EMBEDDING_CONFIG.get(config_key, config_key == 'warm_load'):
+        return
+    
+    try:
+        embedding_service.warm_up()
+    except Exception as e:
+        logger.error(f"Embedding model warm-up failed: {e}", exc_info=True)
\ No newline at end of file
@@ -1,14 +1,21 @@
 # api/rag/ingestion.py
 import os
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from typing import List, Dict, Optional
 import logging
 from django.db import transaction
-import PyPDF2
+from django.db.models import Count
 
 from ..models import Document, Chunk
 from .chunker import DocumentChunker
 from .embeddings import embedding_service
-from .vector_store import get_vector_store
+from .embedding_cache import embedding_cache
+from .ingestion_workers import init_worker, process_document
+from .text_extraction import text_extraction_service
+from .vector_store import get_vector_store, save_vector_store
 
 logger = logging.getLogger(__name__)
 
@@ -16,16 +23,36 @@ logger = logging.getLogger(__name__)
 class IngestionService:
     """Service for ingesting documents into RAG system"""
     
+    # Flush collected vectors to the index once a batch holds this many
+    BULK_APPEND_SIZE = 20000
+    
+    # Parallel ingestion: chunks written to the database per transaction
+    WRITE_BATCH_SIZE = 5000
+    
+    # Streaming ingestion: chunks embedded and written per batch, and
+    # chunked batches buffered ahead of the embedder
+    STREAM_BATCH_SIZE = 256
+    STREAM_QUEUE_BATCHES = 4
+    
+    # Seconds a user's re-embedding lock outlives its last batch, so the
+    # lock of a process that died mid-run expires
+    REEMBED_LOCK_TIMEOUT = 600
+    
     def __init__(self):
         self.chunker = DocumentChunker(chunk_size=500, chunk_overlap=100)
         self.embedding_service = embedding_service
+        self.embedding_cache = embedding_cache
         self.vector_store = get_vector_store()
+        self._reembedding = set()
+        self._reembed_lock = threading.Lock()
     
     @transaction.atomic
     def ingest_document(
         self,
         document: Document,
-        reindex: bool = False
+        reindex: bool = False,
+        save_index: bool = True,
+        pending_vectors: Optional[Dict[int, List]] = None
     ) -> Dict:
         """
         Ingest a document: chunk, embed, and index
@@ -33,6 +60,9 @@ class IngestionService:
         Args:
             document: Document model instance
             reindex: Whether to reindex if already indexed
+            save_index: Whether to persist the index once the transaction commits
+            pending_vectors: If given, (embeddings, metadata) are collected here
+                per user for a later bulk append instead of being added immediately
         
         Returns:
             Dict with ingestion statistics
@@ -48,15 +78,17 @@ class IngestionService:
                     'chunks': existing_chunks
                 }
             
-            # Delete existing chunks if reindexing
+            user_id = document.user_id
+            pending = pending_vectors
+            
+            # Delete existing chunks (and their vectors) if reindexing
             if reindex:
+                self._remove_on_commit(user_id, document.id)
                 Chunk.objects.filter(document=document).delete()
-            
-            # Extract text
-            text = self._extract_text(document)
-            
-            if not text or len(text.strip()) < 100:
-                raise ValueError("Document text too short or empty")
+                if pending is None:
+                    # New vectors follow the removal of the old ones
+                    pending = {}
+                    transaction.on_commit(lambda: self._flush_pending(pending))
             
             # Create metadata
             metadata = {
@@ -69,59 +101,26 @@ class IngestionService:
                 'source': document.source,
             }
             
-            # Chunk document
-            chunks_data = self.chunker.chunk_text(
-                text=text,
-                document_title=document.title,
-                metadata=metadata
-            )
-            
-            logger.info(f"Created {len(chunks_data)} chunks for document {document.id}")
-            
-            # Generate embeddings in batches
-            chunk_texts = [chunk['text'] for chunk in chunks_data]
-            embeddings = self.embedding_service.encode(chunk_texts, batch_size=32)
+            pending_mark = len((pending or {}).get(user_id, []))
             
-            logger.info(f"Generated embeddings for {len(chunk_texts)} chunks")
+            try:
+                with transaction.atomic():
+                    stats = self._stream_document(document, metadata, pending)
+            except Exception:
+                # The chunks were rolled back; drop the vectors already appended
+                if pending is not None:
+                    del pending.get(user_id, [])[pending_mark:]
+                else:
+                    self.vector_store.remove_document(user_id, document.id)
+                raise
             
-            # Save chunks to database
-            chunk_objects = []
-            for i, (chunk_data, embedding) in enumerate(zip(chunks_data, embeddings)):
-                chunk = Chunk(
-                    document=document,
-                    ord=chunk_data['ord'],
-                    heading=chunk_data.get('heading', ''),
-                    text=chunk_data['text'],
-                    embedding_json=embedding.tolist()
-                )
-                chunk_objects.append(chunk)
-            
-            Chunk.objects.bulk_create(chunk_objects)
-            
-            logger.info(f"Saved {len(chunk_objects)} chunks to database")
-            
-            # Add to vector store
-            vector_metadata = []
-            for chunk_data, chunk_obj in zip(chunks_data, chunk_objects):
-                meta = metadata.copy()
-                meta.update({
-                    'chunk_id': chunk_obj.id,
-                    'text': chunk_data['text'],
-                    'heading': chunk_data.get('heading', ''),
-                    'ord': chunk_data['ord'],
-                })
-                vector_metadata.append(meta)
-            
-            self.vector_store.add_vectors(embeddings, vector_metadata)
-            
-            logger.info(f"Added {len(embeddings)} vectors to index")
+            if save_index:
+                transaction.on_commit(lambda: save_vector_store(user_id))
             
             return {
                 'success': True,
                 'document_id': document.id,
-                'chunks_created': len(chunk_objects),
-                'embeddings_generated': len(embeddings),
-                'text_length': len(text),
+                **stats,
             }
             
         except Exception as e:
@@ -131,38 +130,225 @@ class IngestionService:
                 'error': str(e)
             }
     
-    def _extract_text(self, document: Document) -> str:
-        """Extract text from document file"""
-        file_ext = os.path.splitext(document.path)[1].lower()
+    def _stream_document(
+        self,
+        document: Document,
+        metadata: Dict,
+        pending_vectors: Optional[Dict[int, List]] = None
+    ) -> Dict:
+        """
+        Extract, chunk, embed and write a document as overlapping stages
+        
+        A producer thread extracts pages and chunks them into batches of
+        STREAM_BATCH_SIZE chunks on a bounded queue. This thread embeds
+        each batch (the model releases the GIL, so extraction continues
+        meanwhile), bulk-inserts its chunks and appends its vectors to the
+        index. Memory stays bounded by the queue, whatever the document size.
         
-        if file_ext == '.txt':
-            with open(document.path, 'r', encoding='utf-8') as f:
-                return f.read()
+        Returns:
+            Dict with chunk, embedding and text length counts
+        """
+        batches = queue.Queue(maxsize=self.STREAM_QUEUE_BATCHES)
+        stop = threading.Event()
+        text_stats = {'length': 0, 'leading': 0, 'trailing': 0, 'started': False}
+        
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
         
-        elif file_ext == '.pdf':
-            text = ""
-            with open(document.path, 'rb') as pdf_file:
-                pdf_reader = PyPDF2.PdfReader(pdf_file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
+        def counted_pages():
+            for page in text_extraction_service.iter_pages(document.path, document.sha256):
+                # Track len(text.strip()) without joining the pages
+                text_stats['length'] += len(page)
+                if not text_stats['started']:
+                    stripped = page.lstrip()
+                    text_stats['leading'] += len(page) - len(stripped)
+                    text_stats['started'] = bool(stripped)
+                if page.strip():
+                    text_stats['trailing'] = len(page) - len(page.rstrip())
+                else:
+                    text_stats['trailing'] += len(page)
+                yield page
+        
+        def stripped_length() -> int:
+            """len(text.strip()) of the pages read so far (never decreases)"""
+            return max(
+                0, text_stats['length'] - text_stats['leading'] - text_stats['trailing']
+            )
         
-        else:
-            raise ValueError(f"Unsupported file type: {file_ext}")
+        def produce():
+            try:
+                # Batches are held back until the text is known to be long
+                # enough, so a too-short document is rejected before any
+                # chunk is embedded or written
+                held = []
+                batch = []
+                for chunk in self.chunker.iter_chunks(counted_pages(), metadata=metadata):
+                    batch.append(chunk)
+                    if len(batch) >= self.STREAM_BATCH_SIZE:
+                        held.append(batch)
+                        batch = []
+                        if stripped_length() >= 100:
+                            if not all(put(ready) for ready in held):
+                                return
+                            held = []
+                
+                if stripped_length() < 100:
+                    raise ValueError("Document text too short or empty")
+                if batch:
+                    held.append(batch)
+                if not all(put(ready) for ready in held):
+                    return
+                put(None)
+            except Exception as e:
+                put(e)
+        
+        producer = threading.Thread(
+            target=produce, name=f"ingest-{document.id}", daemon=True
+        )
+        producer.start()
+        
+        model_fingerprint = self.embedding_service.model_fingerprint
+        chunks_created = 0
+        
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                
+                # Unchanged chunk texts come from the embedding cache
+                embeddings = self.embedding_cache.encode(
+                    [chunk['text'] for chunk in batch], batch_size=32
+                )
+                
+                chunk_objects = []
+                for chunk_data, embedding in zip(batch, embeddings):
+                    chunk = Chunk(
+                        document=document,
+                        ord=chunk_data['ord'],
+                        heading=chunk_data.get('heading', ''),
+                        text=chunk_data['text']
+                    )
+                    chunk.set_embedding(embedding, model_fingerprint)
+                    chunk_objects.append(chunk)
+                
+                Chunk.objects.bulk_create(chunk_objects)
+                
+                # Add to vector store (only the compact columns the index keeps)
+                vector_metadata = [
+                    {
+                        'chunk_id': chunk_obj.id,
+                        'document_id': document.id,
+                        'year': metadata['year'],
+                        'jurisdiction': document.jurisdiction,
+                    }
+                    for chunk_obj in chunk_objects
+                ]
+                
+                if pending_vectors is not None:
+                    pending_vectors.setdefault(document.user_id, []).append(
+                        (embeddings, vector_metadata)
+                    )
+                else:
+                    self.vector_store.add_vectors(
+                        document.user_id, embeddings, vector_metadata
+                    )
+                
+                chunks_created += len(chunk_objects)
+        finally:
+            stop.set()
+            producer.join()
+        
+        logger.info(
+            f"Saved {chunks_created} chunks with embeddings for document {document.id}"
+        )
+        
+        return {
+            'chunks_created': chunks_created,
+            'embeddings_generated': chunks_created,
+            'text_length': text_stats['length'],
+        }
+    
+    def _extract_text(self, document: Document) -> str:
+        """Extract text from document file"""
+        return text_extraction_service.extract_document(document)
     
     def ingest_multiple(
         self,
         documents: List[Document],
-        reindex: bool = False
+        reindex: bool = False,
+        workers: Optional[int] = None
     ) -> Dict:
-        """Ingest multiple documents"""
+        """
+        Ingest multiple documents
+        
+        Args:
+            documents: Document model instances
+            reindex: Whether to reindex already indexed documents
+            workers: Processes for extraction, chunking and embedding
+                (None = RAG_CONFIG['ingestion_workers'], 0 = one per core,
+                1 = sequential in this process)
+        
+        Returns:
+            Dict with ingestion statistics
+        """
+        if workers is None:
+            from django.conf import settings
+            workers = settings.RAG_CONFIG.get('ingestion_workers', 1)
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        
+        if workers > 1 and multiprocessing.current_process().daemon:
+            # e.g. a Celery prefork child, which may not start processes
+            logger.warning(
+                "Parallel ingestion is unavailable in a daemonic process, "
+                "ingesting sequentially"
+            )
+            workers = 1
+        
+        if workers > 1 and len(documents) > 1:
+            results = self._ingest_parallel(documents, reindex, workers)
+            return self._summarize(documents, results)
+        
         results = []
+        pending = {}
         
         for document in documents:
-            result = self.ingest_document(document, reindex=reindex)
+            result = self.ingest_document(
+                document,
+                reindex=reindex,
+                save_index=False,
+                pending_vectors=pending
+            )
             results.append(result)
+            
+            pending_count = sum(
+                len(embeddings)
+                for batches in pending.values()
+                for embeddings, _ in batches
+            )
+            if pending_count >= self.BULK_APPEND_SIZE:
+                self._flush_pending(pending)
         
+        self._flush_pending(pending)
+        
+        return self._summarize(documents, results)
+    
+    def _summarize(self, documents: List[Document], results: List[Dict]) -> Dict:
+        """Persist the index once for the whole batch and total the results"""
         successful = sum(1 for r in results if r.get('success'))
+        
+        if successful:
+            save_vector_store()
+        
         total_chunks = sum(r.get('chunks_created', 0) for r in results)
         
         return {
@@ -172,6 +358,363 @@ class IngestionService:
             'total_chunks': total_chunks,
             'results': results,
         }
+    
+    def _ingest_parallel(
+        self,
+        documents: List[Document],
+        reindex: bool,
+        workers: int
+    ) -> List[Dict]:
+        """
+        Extract, chunk and embed documents in a process pool
+        
+        Each worker loads the embedding model once. This process is the
+        only writer: finished documents are written WRITE_BATCH_SIZE chunks
+        per transaction and their vectors appended to the index in bulk.
+        """
+        results = []
+        
+        if not reindex:
+            indexed = dict(
+                Chunk.objects.filter(document__in=documents)
+                .values('document_id')
+                .annotate(chunks=Count('id'))
+                .values_list('document_id', 'chunks')
+            )
+            for document_id, chunks in indexed.items():
+                results.append({
+                    'success': True,
+                    'document_id': document_id,
+                    'message': 'Document already indexed',
+                    'chunks': chunks,
+                })
+            documents = [d for d in documents if d.id not in indexed]
+        
+        documents_by_id = {document.id: document for document in documents}
+        jobs = iter([self._ingestion_job(document) for document in documents])
+        
+        workers = min(workers, len(documents)) or 1
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        logger.info(
+            f"Ingesting {len(documents)} documents with {workers} worker processes"
+        )
+        
+        pending = {}
+        finished = []
+        
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(self.chunker.chunk_size, self.chunker.chunk_overlap, threads),
+            ) as executor:
+                # Bound the documents in flight so results do not pile up in memory
+                in_flight = set()
+                for job in jobs:
+                    in_flight.add(executor.submit(process_document, job))
+                    if len(in_flight) < workers * 2:
+                        continue
+                    
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    finished.extend(future.result() for future in done)
+                    
+                    if sum(len(r.get('chunks', ())) for r in finished) >= self.WRITE_BATCH_SIZE:
+                        results.extend(self._write_batch(finished, documents_by_id, reindex, pending))
+                        finished = []
+                
+                for future in in_flight:
+                    finished.append(future.result())
+            
+            results.extend(self._write_batch(finished, documents_by_id, reindex, pending))
+        finally:
+            # Batches already written are committed: index them even when
+            # the pool failed (e.g. BrokenProcessPool) before the end
+            self._flush_pending(pending)
+        return results
+    
+    def _ingestion_job(self, document: Document) -> Dict:
+        """Picklable description of a document for an ingestion worker"""
+        return {
+            'document_id': document.id,
+            'user_id': document.user_id,
+            'path': document.path,
+            'sha256': document.sha256,
+            'title': document.title,
+            'metadata': {
+                'document_id': document.id,
+                'title': document.title,
+                'doctype': document.doctype,
+                'jurisdiction': document.jurisdiction,
+                'date': document.date,
+                'year': document.date.year if document.date else None,
+                'source': document.source,
+            },
+        }
+    
+    def _write_batch(
+        self,
+        worker_results: List[Dict],
+        documents_by_id: Dict[int, Document],
+        reindex: bool,
+        pending_vectors: Dict[int, List]
+    ) -> List[Dict]:
+        """Write the chunks of several processed documents in one transaction"""
+        results = [r for r in worker_results if not r['success']]
+        processed = [r for r in worker_results if r['success']]
+        
+        if not processed:
+            return results
+        
+        model_fingerprint = self.embedding_service.model_fingerprint
+        
+        with transaction.atomic():
+            if reindex:
+                for r in processed:
+                    self._remove_on_commit(r['user_id'], r['document_id'])
+                Chunk.objects.filter(
+                    document_id__in=[r['document_id'] for r in processed]
+                ).delete()
+            
+            chunk_objects = []
+            for r in processed:
+                document = documents_by_id[r['document_id']]
+                for (chunk_ord, heading, text), embedding in zip(r['chunks'], r['embeddings']):
+                    chunk = Chunk(document=document, ord=chunk_ord, heading=heading, text=text)
+                    chunk.set_embedding(embedding, model_fingerprint)
+                    chunk_objects.append(chunk)
+            
+            Chunk.objects.bulk_create(chunk_objects, batch_size=1000)
+        
+        logger.info(
+            f"Saved {len(chunk_objects)} chunks of {len(processed)} documents to database"
+        )
+        
+        new_entries = {}
+        cache_hits = []
+        position = 0
+        for r in processed:
+            document = documents_by_id[r['document_id']]
+            created = chunk_objects[position:position + len(r['chunks'])]
+            position += len(created)
+            
+            pending_vectors.setdefault(document.user_id, []).append((
+                r['embeddings'],
+                [
+                    {
+                        'chunk_id': chunk_obj.id,
+                        'document_id': document.id,
+                        'year': document.date.year if document.date else None,
+                        'jurisdiction': document.jurisdiction,
+                    }
+                    for chunk_obj in created
+                ],
+            ))
+            new_entries.update(r['new_cache_entries'])
+            cache_hits.extend(r['cache_hits'])
+            
+            results.append({
+                'success': True,
+                'document_id': document.id,
+                'chunks_created': len(created),
+                'embeddings_generated': len(r['embeddings']),
+                'text_length': r['text_length'],
+            })
+        
+        self.embedding_cache.store(new_entries)
+        self.embedding_cache.touch(cache_hits)
+        
+        pending_count = sum(
+            len(embeddings)
+            for batches in pending_vectors.values()
+            for embeddings, _ in batches
+        )
+        if pending_count >= self.BULK_APPEND_SIZE:
+            self._flush_pending(pending_vectors)
+        
+        return results
+    
+    def reembed_stale_chunks(
+        self,
+        user_id: Optional[int] = None,
+        batch_size: int = 512
+    ) -> int:
+        """
+        Re-embed chunks stored by another embedding model, batch by batch
+        
+        Each batch is written back to its Chunk rows (stamped with the
+        current model fingerprint) and appended to the owner's partition,
+        so search coverage grows while the backlog is worked through.
+        
+        Args:
+            user_id: Only re-embed this user's chunks (None = everyone's)
+            batch_size: Chunks embedded and written per batch
+        
+        Returns:
+            Number of chunks re-embedded
+        """
+        model_fingerprint = self.embedding_service.model_fingerprint
+        stale = Chunk.objects.exclude(
+            embedding__isnull=False,
+            embedding_model=model_fingerprint
+        )
+        
+        if user_id is None:
+            user_ids = (
+                stale.values_list('document__user_id', flat=True)
+                .order_by()
+                .distinct()
+            )
+            return sum(
+                self.reembed_stale_chunks(uid, batch_size=batch_size)
+                for uid in list(user_ids)
+            )
+        
+        # One re-embedding run per user at a time, in this process and
+        # across processes sharing the cache
+        with self._reembed_lock:
+            if user_id in self._reembedding:
+                return 0
+            self._reembedding.add(user_id)
+        
+        lock_key = f"reembed-lock:{user_id}"
+        lock_token = f"{os.getpid()}:{threading.get_ident()}"
+        try:
+            if not self._cache_lock(lock_key, lock_token):
+                logger.info(f"Re-embedding of user {user_id} already running elsewhere")
+                return 0
+            
+            try:
+                total = self._reembed_user_chunks(
+                    user_id,
+                    stale.filter(document__user_id=user_id),
+                    model_fingerprint,
+                    batch_size,
+                    on_batch=lambda: self._cache_lock(lock_key, lock_token, refresh=True)
+                )
+            finally:
+                self._cache_unlock(lock_key, lock_token)
+        finally:
+            with self._reembed_lock:
+                self._reembedding.discard(user_id)
+        
+        if total:
+            save_vector_store(user_id)
+        return total
+    
+    def _cache_lock(self, key: str, token: str, refresh: bool = False) -> bool:
+        """
+        Take (or extend) a lock in the default Django cache
+        
+        Without a reachable cache, only the in-process guard applies and
+        the lock counts as taken.
+        """
+        try:
+            from django.core.cache import caches
+            cache = caches['default']
+            if refresh:
+                return cache.touch(key, self.REEMBED_LOCK_TIMEOUT)
+            return cache.add(key, token, timeout=self.REEMBED_LOCK_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Re-embedding lock unavailable: {e}")
+            return True
+    
+    def _cache_unlock(self, key: str, token: str):
+        """Release a lock taken by _cache_lock, unless it expired and was taken over"""
+        try:
+            from django.core.cache import caches
+            cache = caches['default']
+            if cache.get(key) == token:
+                cache.delete(key)
+        except Exception as e:
+            logger.warning(f"Re-embedding lock unavailable: {e}")
+    
+    def _reembed_user_chunks(
+        self,
+        user_id,
+        stale,
+        model_fingerprint,
+        batch_size,
+        on_batch=None
+    ) -> int:
+        """Re-embed one user's stale chunks in id order"""
+        total = 0
+        last_id = 0
+        
+        while True:
+            chunks = list(
+                stale.filter(id__gt=last_id)
+                .select_related('document')
+                .order_by('id')[:batch_size]
+            )
+            if not chunks:
+                break
+            last_id = chunks[-1].id
+            
+            embeddings = self.embedding_cache.encode(
+                [chunk.text for chunk in chunks], batch_size=32
+            )
+            for chunk, embedding in zip(chunks, embeddings):
+                chunk.set_embedding(embedding, model_fingerprint)
+            Chunk.objects.bulk_update(chunks, ['embedding', 'embedding_model'])
+            
+            self.vector_store.add_vectors(user_id, embeddings, [
+                {
+                    'chunk_id': chunk.id,
+                    'document_id': chunk.document_id,
+                    'year': chunk.document.date.year if chunk.document.date else None,
+                    'jurisdiction': chunk.document.jurisdiction,
+                }
+                for chunk in chunks
+            ])
+            
+            total += len(chunks)
+            logger.info(
+                f"Re-embedded {total} chunks of user {user_id} for model {model_fingerprint}"
+            )
+            if on_batch:
+                on_batch()
+        
+        return total
+    
+    def reembed_in_background(self, user_id: int):
+        """Run reembed_stale_chunks for a user in a daemon thread"""
+        def run():
+            from django.db import connection
+            
+            try:
+                self.reembed_stale_chunks(user_id)
+            except Exception as e:
+                logger.error(f"Re-embedding failed for user {user_id}: {e}", exc_info=True)
+            finally:
+                connection.close()
+        
+        threading.Thread(
+            target=run, name=f"reembed-{user_id}", daemon=True
+        ).start()
+    
+    def _remove_on_commit(self, user_id: int, document_id: int):
+        """
+        Drop a document's vectors from the index once the transaction commits
+        
+        A rollback then leaves the index (and its persisted tombstones)
+        untouched. The partition is loaded now, while it still matches the
+        database, so the removal does not trigger a rebuild.
+        """
+        self.vector_store.partition(user_id)
+        transaction.on_commit(
+            lambda: self.vector_store.remove_document(user_id, document_id)
+        )
+    
+    def _flush_pending(self, pending: Dict[int, List]):
+        """Append collected vectors to the index, one bulk operation per user"""
+        for user_id, batches in pending.items():
+            self.vector_store.add_vectors_bulk(user_id, batches)
+            logger.info(
+                f"Bulk-added {sum(len(embeddings) for embeddings, _ in batches)} "
+                f"vectors from {len(batches)} documents to index of user {user_id}"
+            )
+        pending.clear()
 
 
 # Global instance
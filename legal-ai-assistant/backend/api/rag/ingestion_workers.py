@@ -0,0 +1,116 @@
+# api/rag/ingestion_workers.py
+import os
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Per-process state, set up once by init_worker
+_chunker = None
+_embedding_cache = None
+
+
+def extract_text(path: str, sha256: Optional[str] = None) -> str:
+    """Extract text from a document file (.txt or .pdf), via the text cache"""
+    from .text_extraction import text_extraction_service
+    
+    # Already running in a pool worker: extract this document's pages here
+    return text_extraction_service.extract(path, sha256, parallel=False)
+
+
+def init_worker(chunk_size: int, chunk_overlap: int, num_threads: int):
+    """
+    Process pool initializer: set up Django and load the embedding model once
+    
+    Workers are spawned rather than forked, so this module must not import
+    Django models at import time.
+    
+    Args:
+        chunk_size: DocumentChunker chunk size
+        chunk_overlap: DocumentChunker chunk overlap
+        num_threads: Inference threads for this worker's model
+    """
+    global _chunker, _embedding_cache
+    
+    import django
+    django.setup()
+    
+    from django.conf import settings
+    
+    # Split the cores between workers instead of every model using all of them
+    if settings.EMBEDDING_CONFIG.get('backend') == 'onnx':
+        if not settings.EMBEDDING_CONFIG.get('onnx_threads'):
+            settings.EMBEDDING_CONFIG['onnx_threads'] = num_threads
+    else:
+        import torch
+        torch.set_num_threads(num_threads)
+    
+    from .chunker import DocumentChunker
+    from .embedding_cache import embedding_cache
+    
+    _chunker = DocumentChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    _embedding_cache = embedding_cache
+    _embedding_cache.embedding_service.warm_up()
+    
+    logger.info(f"Ingestion worker {os.getpid()} ready ({num_threads} threads)")
+
+
+def process_document(job: Dict) -> Dict:
+    """
+    Extract, chunk and embed one document in a worker process
+    
+    The worker never writes to the database: chunks, embeddings, new
+    embedding cache entries and the keys of cache hits are returned to
+    the parent, which writes them in large batches.
+    
+    Args:
+        job: document_id, user_id, path, title and chunk metadata
+    
+    Returns:
+        Dict with the chunks and embeddings, or the error
+    """
+    document_id = job['document_id']
+    
+    try:
+        text = extract_text(job['path'], job.get('sha256'))
+        
+        if not text or len(text.strip()) < 100:
+            raise ValueError("Document text too short or empty")
+        
+        chunks_data = _chunker.chunk_text(
+            text=text,
+            document_title=job['title'],
+            metadata=job['metadata']
+        )
+        
+        new_entries = {}
+        cache_hits = set()
+        embeddings = _embedding_cache.encode(
+            [chunk['text'] for chunk in chunks_data],
+            batch_size=32,
+            pending_entries=new_entries,
+            pending_hits=cache_hits
+        )
+        
+        return {
+            'success': True,
+            'document_id': document_id,
+            'user_id': job['user_id'],
+            'chunks': [
+                (chunk['ord'], chunk.get('heading', ''), chunk['text'])
+                for chunk in chunks_data
+            ],
+            'embeddings': embeddings,
+            'new_cache_entries': new_entries,
+            'cache_hits': list(cache_hits),
+            'text_length': len(text),
+        }
+    
+    except Exception as e:
+        logger.error(f"Ingestion worker error for document {document_id}: {e}", exc_info=True)
+        return {
+            'success': False,
+            'document_id': document_id,
+            'error': str(e)
+        }
@@ -0,0 +1,146 @@
+# api/rag/onnx_encoder.py
+import json
+import os
+from typing import List, Optional, Union
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class OnnxSentenceEncoder:
+    """
+    Torch-free sentence encoder running an exported transformer with ONNX Runtime
+    
+    Reads the sentence-transformers layout of a local model directory
+    (tokenizer.json, sentence_bert_config.json, 1_Pooling, modules.json)
+    and reproduces its tokenize -> transformer -> pool -> normalize
+    pipeline, so it can stand in for SentenceTransformer.encode.
+    """
+    
+    def __init__(
+        self,
+        model_dir: str,
+        onnx_file: str = 'onnx/model.onnx',
+        num_threads: int = 0
+    ):
+        """
+        Args:
+            model_dir: sentence-transformers model directory
+            onnx_file: Exported model, relative to model_dir (or absolute)
+            num_threads: Intra-op threads for ONNX Runtime (0 = its default)
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        onnx_path = os.path.join(model_dir, onnx_file)
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at {onnx_path}. "
+                f"Run 'python manage.py export_embedding_onnx' first."
+            )
+        
+        st_config = _read_json(os.path.join(model_dir, 'sentence_bert_config.json')) or {}
+        self.max_seq_length = st_config.get('max_seq_length', 256)
+        
+        # Dynamic padding to the longest text of each batch
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        pad_token = (self.tokenizer.padding or {}).get('pad_token', '[PAD]')
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(
+            pad_id=self.tokenizer.token_to_id(pad_token) or 0,
+            pad_token=pad_token
+        )
+        
+        pooling = _read_json(os.path.join(model_dir, '1_Pooling', 'config.json')) or {}
+        if pooling.get('pooling_mode_cls_token'):
+            self.pooling = 'cls'
+        elif pooling.get('pooling_mode_max_tokens'):
+            self.pooling = 'max'
+        else:
+            self.pooling = 'mean'
+        
+        modules = _read_json(os.path.join(model_dir, 'modules.json')) or []
+        self.normalize = any(m.get('type', '').endswith('Normalize') for m in modules)
+        
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            onnx_path, options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        
+        logger.info(f"Loaded ONNX embedding model from {onnx_path}")
+    
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True
+    ) -> np.ndarray:
+        """
+        Generate embeddings (same contract as SentenceTransformer.encode)
+        
+        Args:
+            sentences: Single text or list of texts
+            batch_size: Texts per forward pass
+        
+        Returns:
+            numpy array of shape (n, dim), or (dim,) for a single string
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        
+        if not sentences:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        # Length-sorted batches keep padding to a minimum
+        order = np.argsort([-len(text) for text in sentences], kind='stable')
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            batch = [sentences[i] for i in order[start:start + batch_size]]
+            batches.append(self._encode_batch(batch))
+        
+        embeddings = np.empty_like(np.concatenate(batches))
+        embeddings[order] = np.concatenate(batches)
+        
+        return embeddings[0] if single else embeddings
+    
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Tokenize, run the transformer and pool one batch"""
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.array(
+                [e.type_ids for e in encodings], dtype=np.int64
+            )
+        
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        
+        if self.pooling == 'cls':
+            pooled = hidden[:, 0]
+        elif self.pooling == 'max':
+            pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+        else:
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        
+        if self.normalize:
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            pooled = pooled / np.clip(norms, 1e-12, None)
+        
+        return pooled.astype(np.float32)
+
+
+def _read_json(path: str) -> Optional[Union[dict, list]]:
+    """Read a JSON file, or None if it does not exist"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
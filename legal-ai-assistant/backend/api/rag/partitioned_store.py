@@ -0,0 +1,515 @@
+# api/rag/partitioned_store.py
+import numpy as np
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Dict, Optional, Tuple
+import logging
+
+from .vector_store_numpy import NumpyVectorStore
+from .vector_store_ivf import IVFVectorStore
+
+logger = logging.getLogger(__name__)
+
+
+# Index implementations selectable with RAG_CONFIG['backend']
+VECTOR_STORE_BACKENDS = {
+    'numpy': NumpyVectorStore,
+    'ivf': IVFVectorStore,
+}
+
+
+class PartitionedVectorStore:
+    """
+    Vector index partitioned by document owner
+    
+    Each user gets their own NumpyVectorStore persisted under
+    <index_dir>/users/<user_id>, so a query only scores the caller's
+    chunks. Partitions are loaded lazily on first use and the least
+    recently used ones are evicted once the memory budget is exceeded.
+    A partition whose snapshot another process has since replaced is
+    mapped again on its next use (and before it is saved over).
+    
+    With a model_fingerprint, partitions only hold chunks embedded by that
+    model. Chunks embedded by another model are reported to on_stale_chunks
+    so they can be re-embedded and appended incrementally.
+    """
+    
+    def __init__(
+        self,
+        index_dir: str,
+        embedding_dim: int = 384,
+        memory_budget_bytes: int = 1024 * 1024 * 1024,
+        backend: str = 'numpy',
+        backend_options: Optional[Dict] = None,
+        model_fingerprint: Optional[str] = None,
+        on_stale_chunks: Optional[Callable[[int], None]] = None
+    ):
+        """
+        Args:
+            index_dir: Root directory of the persisted partitions
+            embedding_dim: Dimension of embeddings
+            memory_budget_bytes: Bytes of loaded partitions to keep before evicting
+            backend: Key of VECTOR_STORE_BACKENDS used for each partition
+            backend_options: Extra constructor arguments for the backend
+            model_fingerprint: Current embedding model (see EmbeddingService)
+            on_stale_chunks: Called with a user id whose partition was loaded
+                while some of their chunks were embedded by another model
+        """
+        if backend not in VECTOR_STORE_BACKENDS:
+            raise ValueError(f"Unknown vector store backend: {backend}")
+        
+        self.index_dir = index_dir
+        self.embedding_dim = embedding_dim
+        self.memory_budget_bytes = memory_budget_bytes
+        self.backend = backend
+        self.backend_options = backend_options or {}
+        self.model_fingerprint = model_fingerprint
+        self.on_stale_chunks = on_stale_chunks
+        self._partitions = OrderedDict()  # user_id -> NumpyVectorStore (LRU order)
+        self._dirty = set()
+        self._manifest_mtimes = {}  # user_id -> manifest mtime last checked
+        self._lock = threading.RLock()
+        logger.info(
+            f"Initialized partitioned vector store at {index_dir} "
+            f"(budget {memory_budget_bytes // (1024 * 1024)} MB)"
+        )
+    
+    def partition_path(self, user_id: int) -> str:
+        """Directory holding the snapshot of one user's partition"""
+        return os.path.join(self.index_dir, 'users', str(user_id))
+    
+    def partition(self, user_id: int) -> NumpyVectorStore:
+        """Get a user's partition, loading it on first use"""
+        with self._lock:
+            store = self._partitions.get(user_id)
+            if store is not None:
+                if not self._snapshot_replaced(user_id, store):
+                    self._partitions.move_to_end(user_id)
+                    return store
+                self._drop_replaced(user_id)
+            
+            store = self._create_partition()
+            self._load_or_rebuild(user_id, store)
+            self._partitions[user_id] = store
+            self._evict(keep=user_id)
+            self._check_stale_chunks(user_id)
+            return store
+    
+    def _snapshot_replaced(self, user_id: int, store: NumpyVectorStore) -> bool:
+        """
+        Whether the partition's manifest now names another generation than
+        the one the store was loaded from or saved as
+        
+        Only a stat() unless manifest.json changed since the last check.
+        """
+        path = self.partition_path(user_id)
+        try:
+            mtime = os.stat(os.path.join(path, 'manifest.json')).st_mtime_ns
+        except OSError:
+            return False
+        
+        if self._manifest_mtimes.get(user_id) == mtime:
+            return False
+        
+        try:
+            manifest = store._read_manifest(path)
+        except (OSError, ValueError):
+            return False
+        
+        self._manifest_mtimes[user_id] = mtime
+        return manifest is not None and manifest.get('generation') != store.generation
+    
+    def _drop_replaced(self, user_id: int):
+        """Forget a partition whose snapshot another process replaced"""
+        logger.info(
+            f"Vector index partition for user {user_id} was saved by "
+            f"another process, mapping it again"
+        )
+        del self._partitions[user_id]
+        self._dirty.discard(user_id)
+    
+    def _create_partition(self) -> NumpyVectorStore:
+        """Create an empty store for one partition"""
+        store_class = VECTOR_STORE_BACKENDS[self.backend]
+        return store_class(
+            embedding_dim=self.embedding_dim,
+            model_fingerprint=self.model_fingerprint,
+            **self.backend_options
+        )
+    
+    def add_vectors(
+        self,
+        user_id: int,
+        embeddings: np.ndarray,
+        metadata: List[Dict]
+    ):
+        """Add vectors to a user's partition"""
+        self.add_vectors_bulk(user_id, [(embeddings, metadata)])
+    
+    def add_vectors_bulk(
+        self,
+        user_id: int,
+        batches: List[Tuple[np.ndarray, List[Dict]]]
+    ):
+        """Append many documents' vectors to a user's partition at once"""
+        with self._lock:
+            previous = self._partitions.get(user_id)
+        
+        store = self.partition(user_id)
+        if store is not previous:
+            # (Re)loaded or rebuilt from the database, which may already
+            # hold these chunks
+            batches = self._unindexed(store, batches)
+        
+        store.add_vectors_bulk(batches)
+        
+        with self._lock:
+            self._dirty.add(user_id)
+            self._evict(keep=user_id)
+    
+    @staticmethod
+    def _unindexed(
+        store: NumpyVectorStore,
+        batches: List[Tuple[np.ndarray, List[Dict]]]
+    ) -> List[Tuple[np.ndarray, List[Dict]]]:
+        """Drop the rows of batches whose chunk is already in the store"""
+        if store.size == 0:
+            return batches
+        
+        kept = []
+        for embeddings, metadata in batches:
+            chunk_ids = np.array([meta['chunk_id'] for meta in metadata])
+            new = ~np.isin(chunk_ids, store.chunk_ids)
+            if new.all():
+                kept.append((embeddings, metadata))
+            elif new.any():
+                kept.append((
+                    np.asarray(embeddings)[new],
+                    [meta for meta, keep in zip(metadata, new) if keep]
+                ))
+        return kept
+    
+    def remove_document(self, user_id: int, document_id: int) -> int:
+        """
+        Remove a document's vectors from its owner's partition
+        
+        Rows are tombstoned and the tombstones persisted next to the last
+        snapshot (or the partition saved, if that snapshot is gone); the
+        partition is compacted in the background once enough of it is
+        deleted.
+        
+        Returns:
+            Number of vectors removed
+        """
+        store = self.partition(user_id)
+        removed = store.remove_document(document_id)
+        
+        if removed:
+            if not store.save_tombstones():
+                with self._lock:
+                    self._dirty.add(user_id)
+                self.save(user_id)
+                store = self.partition(user_id)
+            store.maybe_compact(self.partition_path(user_id))
+        
+        return removed
+    
+    def search(
+        self,
+        user_id: int,
+        query_embedding: np.ndarray,
+        k: int = 10,
+        filters: Optional[Dict] = None,
+        **search_options
+    ) -> List[Dict]:
+        """Search only within a user's partition (backend knobs such as nprobe pass through)"""
+        return self.partition(user_id).search(
+            query_embedding=query_embedding,
+            k=k,
+            filters=filters,
+            **search_options
+        )
+    
+    def search_many(
+        self,
+        user_id: int,
+        query_embeddings: np.ndarray,
+        k: int = 10,
+        filters: Optional[Dict] = None,
+        **search_options
+    ) -> List[List[Dict]]:
+        """Search several queries within a user's partition in one batch"""
+        return self.partition(user_id).search_many(
+            query_embeddings=query_embeddings,
+            k=k,
+            filters=filters,
+            **search_options
+        )
+    
+    def save(self, user_id: Optional[int] = None):
+        """Persist one partition, or every partition with unsaved changes"""
+        with self._lock:
+            user_ids = [user_id] if user_id is not None else list(self._dirty)
+            for uid in user_ids:
+                store = self._partitions.get(uid)
+                if store is not None:
+                    if self._snapshot_replaced(uid, store):
+                        # Saving would drop the other process's rows; map its
+                        # snapshot instead (rebuilt from the database, and
+                        # saved, if it lacks ours)
+                        self._drop_replaced(uid)
+                        self.partition(uid)
+                    else:
+                        store.save(self.partition_path(uid))
+                self._dirty.discard(uid)
+    
+    def partition_size(self, user_id: int) -> int:
+        """Number of (non-deleted) vectors in a user's partition"""
+        return self.partition(user_id).live_size
+    
+    @property
+    def loaded_partitions(self) -> int:
+        """Number of partitions currently loaded"""
+        return len(self._partitions)
+    
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the loaded partitions"""
+        return sum(store.nbytes for store in self._partitions.values())
+    
+    def clear(self):
+        """Drop every loaded partition (snapshots on disk are kept)"""
+        with self._lock:
+            self._partitions.clear()
+            self._dirty.clear()
+            self._manifest_mtimes.clear()
+    
+    def _evict(self, keep: int):
+        """Evict least recently used partitions until under the memory budget"""
+        while self.nbytes > self.memory_budget_bytes and len(self._partitions) > 1:
+            user_id = next(iter(self._partitions))
+            if user_id == keep:
+                self._partitions.move_to_end(user_id)
+                continue
+            
+            store = self._partitions.pop(user_id)
+            if user_id in self._dirty:
+                store.save(self.partition_path(user_id))
+                self._dirty.discard(user_id)
+            
+            logger.info(f"Evicted vector index partition for user {user_id}")
+    
+    def _check_stale_chunks(self, user_id: int):
+        """Report a user whose chunks were partly embedded by another model"""
+        if self.model_fingerprint is None or self.on_stale_chunks is None:
+            return
+        
+        from django.db import DatabaseError
+        
+        try:
+            stale = _stale_chunks(user_id, self.model_fingerprint).exists()
+        except DatabaseError:
+            return
+        
+        if stale:
+            logger.warning(
+                f"Chunks of user {user_id} were embedded by another model, "
+                f"re-embedding for {self.model_fingerprint}"
+            )
+            self.on_stale_chunks(user_id)
+    
+    def _load_or_rebuild(self, user_id: int, store: NumpyVectorStore):
+        """
+        Load a partition snapshot, rebuilding it from the database when the
+        snapshot is missing or does not match the user's indexed chunks
+        """
+        from django.db import DatabaseError
+        
+        path = self.partition_path(user_id)
+        
+        try:
+            expected = _indexed_chunk_stats(user_id, self.model_fingerprint)
+        except DatabaseError as e:
+            # Tables not migrated yet (e.g. during manage.py migrate)
+            logger.warning(f"Skipping vector store load, database unavailable: {e}")
+            return
+        
+        if os.path.exists(os.path.join(path, 'manifest.json')):
+            try:
+                store.load(path)
+                if store.chunk_stats() == expected:
+                    return
+                logger.warning(
+                    f"Vector index partition for user {user_id} is stale, "
+                    f"rebuilding from database"
+                )
+            except Exception as e:
+                logger.warning(f"Could not load partition for user {user_id}: {e}")
+        elif expected[0] > 0:
+            logger.warning(
+                f"Vector index partition for user {user_id} missing, "
+                f"rebuilding from database"
+            )
+        else:
+            return
+        
+        store.clear()
+        store.reserve(expected[0])
+        rebuild_from_database(store, user_id, model_fingerprint=self.model_fingerprint)
+        
+        if store.size > 0 or os.path.exists(path):
+            store.save(path)
+
+
+def rebuild_from_database(
+    store: NumpyVectorStore,
+    user_id: int,
+    batch_size: int = 2000,
+    model_fingerprint: Optional[str] = None
+):
+    """
+    Rebuild a user's partition from the embeddings saved on Chunk rows
+    
+    The raw float32 blobs are joined and decoded with a single
+    np.frombuffer call, then appended to the store in one bulk write.
+    Given a model_fingerprint, only chunks embedded by that model are used.
+    """
+    rows = (
+        _embedded_chunks(user_id, model_fingerprint)
+        .order_by('id')
+        .values_list(
+            'id', 'document_id', 'document__date',
+            'document__jurisdiction', 'embedding'
+        )
+    )
+    
+    blobs = []
+    metadata = []
+    
+    for chunk_id, document_id, date, jurisdiction, embedding in rows.iterator(chunk_size=batch_size):
+        blobs.append(embedding)
+        metadata.append({
+            'chunk_id': chunk_id,
+            'document_id': document_id,
+            'year': date.year if date else None,
+            'jurisdiction': jurisdiction,
+        })
+    
+    if blobs:
+        embeddings = np.frombuffer(
+            b''.join(blobs), dtype=np.float32
+        ).reshape(len(blobs), -1)
+        store.add_vectors(embeddings, metadata)
+    
+    logger.info(
+        f"Rebuilt vector index partition for user {user_id} from database. "
+        f"Total vectors: {store.size}"
+    )
+
+
+def _embedded_chunks(user_id: int, model_fingerprint: Optional[str] = None):
+    """A user's chunks that carry an embedding (from model_fingerprint, if given)"""
+    from ..models import Chunk
+    
+    chunks = Chunk.objects.filter(document__user_id=user_id, embedding__isnull=False)
+    if model_fingerprint is not None:
+        chunks = chunks.filter(embedding_model=model_fingerprint)
+    return chunks
+
+
+def _stale_chunks(user_id: int, model_fingerprint: str):
+    """A user's chunks not embedded by model_fingerprint"""
+    from ..models import Chunk
+    
+    return Chunk.objects.filter(document__user_id=user_id).exclude(
+        embedding__isnull=False,
+        embedding_model=model_fingerprint
+    )
+
+
+def _indexed_chunk_stats(user_id: int, model_fingerprint: Optional[str] = None):
+    """(count, max chunk id) of a user's chunks that carry an embedding"""
+    from django.db.models import Count, Max
+    
+    stats = _embedded_chunks(user_id, model_fingerprint).aggregate(
+        count=Count('id'),
+        max_id=Max('id'),
+    )
+    return stats['count'], stats['max_id']
+
+
+# Global instance (lazy initialization)
+_global_vector_store = None
+_global_lock = threading.Lock()
+
+
+def get_vector_store() -> PartitionedVectorStore:
+    """Get or create the global partitioned vector store"""
+    global _global_vector_store
+    
+    if _global_vector_store is None:
+        with _global_lock:
+            if _global_vector_store is None:
+                from django.conf import settings
+                from .embeddings import embedding_service
+                
+                rag_config = settings.RAG_CONFIG
+                backend = rag_config.get('backend', 'numpy')
+                backend_options = {
+                    'quantization': rag_config.get('quantization'),
+                    'rerank_factor': rag_config.get('rerank_factor', 4),
+                    'compaction_threshold': rag_config.get('compaction_threshold', 0.2),
+                }
+                if backend == 'ivf':
+                    backend_options.update({
+                        'nlist': rag_config['ivf_nlist'],
+                        'nprobe': rag_config['ivf_nprobe'],
+                        'min_train_size': rag_config['ivf_min_train_size'],
+                    })
+                
+                _global_vector_store = PartitionedVectorStore(
+                    index_dir=rag_config['index_dir'],
+                    embedding_dim=embedding_service.embedding_dim,
+                    memory_budget_bytes=rag_config['partition_budget_mb'] * 1024 * 1024,
+                    backend=backend,
+                    backend_options=backend_options,
+                    model_fingerprint=embedding_service.model_fingerprint,
+                    on_stale_chunks=_reembed_in_background,
+                )
+    
+    return _global_vector_store
+
+
+def _reembed_in_background(user_id: int):
+    """Re-embed a user's stale chunks without blocking the caller"""
+    from .ingestion import ingestion_service
+    ingestion_service.reembed_in_background(user_id)
+
+
+def save_vector_store(user_id: Optional[int] = None):
+    """Persist one user's partition, or all partitions with unsaved changes"""
+    if _global_vector_store is None:
+        return
+    
+    try:
+        _global_vector_store.save(user_id)
+    except Exception as e:
+        logger.error(f"Failed to save vector store: {e}", exc_info=True)
+
+
+def warm_up_vector_store():
+    """
+    Create the vector store at process start (Django/Celery worker boot)
+    
+    Partitions themselves are memory-mapped lazily on first query.
+    """
+    from django.conf import settings
+    
+    if not settings.RAG_CONFIG.get('warm_load', True):
+        return
+    
+    try:
+        get_vector_store()
+    except Exception as e:
+        logger.error(f"Vector store warm-up failed: {e}", exc_info=True)
@@ -0,0 +1,187 @@
+# api/rag/query_cache.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Optional
+import logging
+import numpy as np
+
+from .embeddings import embedding_service
+from .embedding_batcher import embedding_batcher
+
+logger = logging.getLogger(__name__)
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU/TTL cache of query text -> embedding
+    
+    Repeated questions skip the model forward pass. Entries live in a
+    per-process LRU and, when shared is enabled, in the Django cache
+    (Redis) so every worker benefits from a query embedded once.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: int = 3600,
+        shared: bool = False,
+        cache_alias: str = 'default'
+    ):
+        """
+        Args:
+            max_entries: Max queries kept in the local LRU (0 = disabled)
+            ttl_seconds: Seconds before a cached embedding expires
+            shared: Also read/write the Django cache shared by all workers
+            cache_alias: Django cache used when shared is enabled
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self.cache_alias = cache_alias
+        self.embedding_service = embedding_service
+        self.embedding_batcher = embedding_batcher
+        self._entries = OrderedDict()  # key -> (expires_at, embedding)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Collapse whitespace so trivially different spellings share an entry"""
+        return ' '.join(query.split())
+    
+    def key(self, query: str) -> str:
+        """Cache key of a query for the current model"""
+        content = f"{self.embedding_service.model_fingerprint}\0{self.normalize_query(query)}"
+        return 'query-embedding:' + hashlib.sha256(content.encode('utf-8')).hexdigest()
+    
+    def encode(self, query: str) -> np.ndarray:
+        """Embedding of one query, from the cache when possible"""
+        return self.encode_many([query])[0]
+    
+    def encode_many(self, queries: List[str]) -> np.ndarray:
+        """
+        Embeddings of several queries, encoding only the misses in one batch
+        
+        Returns:
+            numpy array of embeddings, one row per query
+        """
+        if not self.max_entries:
+            return self.embedding_batcher.encode(queries)
+        
+        keys = [self.key(query) for query in queries]
+        found = {}
+        
+        for key in keys:
+            if key not in found:
+                embedding = self._get_local(key)
+                if embedding is not None:
+                    found[key] = embedding
+        
+        if self.shared:
+            found.update(self._get_shared(
+                [key for key in dict.fromkeys(keys) if key not in found]
+            ))
+        
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in found and key not in missing:
+                missing[key] = i
+        
+        if missing:
+            # Misses from concurrent requests share one forward pass
+            encoded = self.embedding_batcher.encode(
+                [queries[i] for i in missing.values()]
+            )
+            new_entries = dict(zip(missing, np.asarray(encoded, dtype=np.float32)))
+            for key, embedding in new_entries.items():
+                self._put_local(key, embedding)
+            if self.shared:
+                self._put_shared(new_entries)
+            found.update(new_entries)
+        
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+        
+        return np.stack([found[key] for key in keys])
+    
+    def _get_local(self, key: str) -> Optional[np.ndarray]:
+        """Look up the per-process LRU, dropping expired entries"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            
+            expires_at, embedding = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            return embedding
+    
+    def _put_local(self, key: str, embedding: np.ndarray):
+        """Insert into the per-process LRU, evicting the oldest entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def _get_shared(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look up the shared Django cache, promoting hits into the local LRU"""
+        if not keys:
+            return {}
+        
+        try:
+            from django.core.cache import caches
+            values = caches[self.cache_alias].get_many(keys)
+        except Exception as e:
+            logger.warning(f"Shared query cache unavailable: {e}")
+            return {}
+        
+        found = {}
+        for key, value in values.items():
+            embedding = np.frombuffer(value, dtype=np.float32)
+            self._put_local(key, embedding)
+            found[key] = embedding
+        
+        with self._lock:
+            self.shared_hits += len(found)
+        return found
+    
+    def _put_shared(self, entries: Dict[str, np.ndarray]):
+        """Write new embeddings to the shared Django cache"""
+        try:
+            from django.core.cache import caches
+            caches[self.cache_alias].set_many(
+                {key: embedding.tobytes() for key, embedding in entries.items()},
+                timeout=self.ttl_seconds
+            )
+        except Exception as e:
+            logger.warning(f"Shared query cache unavailable: {e}")
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters of this process"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+    
+    def clear(self):
+        """Drop local entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.shared_hits = 0
+            self.misses = 0
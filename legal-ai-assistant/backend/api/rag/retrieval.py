@@ -1,8 +1,11 @@
 # api/rag/retrieval.py
 from typing import List, Dict, Optional
 import logging
+from django.db.models import Q
 
+from ..models import Chunk
 from .embeddings import embedding_service
+from .query_cache import QueryEmbeddingCache
 from .vector_store import get_vector_store
 
 logger = logging.getLogger(__name__)
@@ -12,12 +15,22 @@ class RetrievalService:
     """Service for retrieving relevant document chunks"""
     
     def __init__(self):
+        from django.conf import settings
+        
         self.embedding_service = embedding_service
         self.vector_store = get_vector_store()
+        
+        rag_config = settings.RAG_CONFIG
+        self.query_cache = QueryEmbeddingCache(
+            max_entries=rag_config.get('query_cache_size', 1024),
+            ttl_seconds=rag_config.get('query_cache_ttl', 3600),
+            shared=rag_config.get('query_cache_shared', False),
+        )
     
     def retrieve(
         self,
         query: str,
+        user_id: int,
         k: int = 10,
         filters: Optional[Dict] = None
     ) -> List[Dict]:
@@ -26,6 +39,7 @@ class RetrievalService:
         
         Args:
             query: Search query
+            user_id: Owner whose documents are searched
             k: Number of results
             filters: Optional filters (jurisdiction, year, keywords)
         
@@ -33,43 +47,147 @@ class RetrievalService:
             List of relevant chunks with metadata and scores
         """
         try:
-            # Generate query embedding
-            query_embedding = self.embedding_service.encode_single(query)
+            # Generate query embedding (repeated questions hit the cache)
+            query_embedding = self.query_cache.encode(query)
             
             # Search vector store
             results = self.vector_store.search(
+                user_id=user_id,
                 query_embedding=query_embedding,
                 k=k,
-                filters=filters
+                filters=self._resolve_keyword_filters(filters, user_id)
             )
             
             logger.info(f"Retrieved {len(results)} chunks for query")
             
-            # Format results for LLM context
+            return self._hydrate(results)
+            
+        except Exception as e:
+            logger.error(f"Retrieval error: {e}", exc_info=True)
+            return []
+    
+    def retrieve_many(
+        self,
+        queries: List[str],
+        user_id: int,
+        k: int = 10,
+        filters: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """
+        Retrieve relevant chunks for several queries in one batch
+        
+        Queries are encoded in a single batch and scored against the index
+        with one matrix-matrix product; chunks are hydrated with one query.
+        
+        Args:
+            queries: Search queries
+            user_id: Owner whose documents are searched
+            k: Number of results per query
+            filters: Optional filters applied to every query
+        
+        Returns:
+            One list of relevant chunks per query
+        """
+        if not queries:
+            return []
+        
+        try:
+            query_embeddings = self.query_cache.encode_many(queries)
+            
+            results = self.vector_store.search_many(
+                user_id=user_id,
+                query_embeddings=query_embeddings,
+                k=k,
+                filters=self._resolve_keyword_filters(filters, user_id)
+            )
+            
+            logger.info(f"Retrieved chunks for {len(queries)} queries")
+            
+            return self._hydrate_many(results)
+            
+        except Exception as e:
+            logger.error(f"Batch retrieval error: {e}", exc_info=True)
+            return [[] for _ in queries]
+    
+    def _resolve_keyword_filters(
+        self,
+        filters: Optional[Dict],
+        user_id: int
+    ) -> Optional[Dict]:
+        """
+        Turn include/exclude keyword filters into chunk id sets
+        
+        Chunk text lives in the database rather than the index, so keyword
+        matching is pushed down to a text lookup on Chunk rows.
+        """
+        if not filters:
+            return filters
+        
+        filters = dict(filters)
+        include = filters.pop('include', None)
+        exclude = filters.pop('exclude', None)
+        
+        if include:
+            query = Q()
+            for keyword in include:
+                query |= Q(text__icontains=keyword)
+            filters['chunk_ids'] = set(
+                Chunk.objects.filter(query, document__user_id=user_id)
+                .values_list('id', flat=True)
+            )
+        
+        if exclude:
+            query = Q()
+            for keyword in exclude:
+                query |= Q(text__icontains=keyword)
+            filters['exclude_chunk_ids'] = set(
+                Chunk.objects.filter(query, document__user_id=user_id)
+                .values_list('id', flat=True)
+            )
+        
+        return filters
+    
+    def _hydrate(self, results: List[Dict]) -> List[Dict]:
+        """Attach chunk text and document fields from the database"""
+        return self._hydrate_many([results])[0]
+    
+    def _hydrate_many(self, result_lists: List[List[Dict]]) -> List[List[Dict]]:
+        """Hydrate several result lists with a single database query"""
+        chunks = Chunk.objects.select_related('document').in_bulk({
+            result['chunk_id'] for results in result_lists for result in results
+        })
+        
+        # Format results for LLM context
+        hydrated = []
+        for results in result_lists:
             formatted_results = []
             for result in results:
+                chunk = chunks.get(result['chunk_id'])
+                if chunk is None:
+                    # Chunk deleted since it was indexed
+                    continue
+                
+                document = chunk.document
                 formatted_results.append({
-                    'chunk_id': result.get('chunk_id'),
-                    'document_id': result.get('document_id'),
-                    'title': result.get('title', 'Untitled'),
-                    'case_name': result.get('title', 'Unknown'),  # For case law
-                    'year': result.get('year', 'n.d.'),
+                    'chunk_id': chunk.id,
+                    'document_id': document.id,
+                    'title': document.title or 'Untitled',
+                    'case_name': document.title or 'Unknown',  # For case law
+                    'year': result.get('year') or 'n.d.',
                     'jurisdiction': result.get('jurisdiction', ''),
-                    'text': result.get('text', ''),
-                    'heading': result.get('heading', ''),
+                    'text': chunk.text,
+                    'heading': chunk.heading,
                     'score': result.get('score', 0.0),
-                    'source': result.get('source', ''),
+                    'source': document.source,
                 })
-            
-            return formatted_results
-            
-        except Exception as e:
-            logger.error(f"Retrieval error: {e}", exc_info=True)
-            return []
+            hydrated.append(formatted_results)
+        
+        return hydrated
     
     def retrieve_for_mode_c(
         self,
         question: str,
+        user_id: int,
         jurisdiction: Optional[str] = None,
         year_from: Optional[int] = None,
         year_to: Optional[int] = None,
@@ -82,6 +200,7 @@ class RetrievalService:
         
         Args:
             question: Legal question
+            user_id: Owner whose documents are searched
             jurisdiction: Filter by jurisdiction
             year_from: Minimum year
             year_to: Maximum year
@@ -105,7 +224,7 @@ class RetrievalService:
         if keywords_exclude:
             filters['exclude'] = keywords_exclude
         
-        return self.retrieve(query=question, k=k, filters=filters)
+        return self.retrieve(query=question, user_id=user_id, k=k, filters=filters)
 
 
 # Global instance
@@ -0,0 +1,287 @@
+# api/rag/text_extraction.py
+import os
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Characters read per block when streaming a .txt or cached text file
+TEXT_BLOCK_SIZE = 1024 * 1024
+
+# Bump when extraction output changes so stale cached text is not served
+EXTRACTION_VERSION = 1
+
+SUPPORTED_EXTENSIONS = ('.txt', '.pdf')
+
+
+def extract_page_range(path: str, start: int, stop: int) -> str:
+    """
+    Extract pages [start, stop) of a PDF
+    
+    Module-level so it can run in a spawned pool worker; each worker opens
+    its own reader.
+    """
+    import PyPDF2
+    
+    with open(path, 'rb') as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        return ''.join([
+            pdf_reader.pages[i].extract_text() + "\n" for i in range(start, stop)
+        ])
+
+
+class TextExtractionService:
+    """
+    Extracts document text once and caches it on disk by content hash
+    
+    PDF text is written to <text_cache_dir>/v<EXTRACTION_VERSION>/<sha256>.txt
+    the first time a document is extracted (viewed, chatted with or
+    ingested), so later reads never re-parse the PDF. Large PDFs are split
+    into page ranges across a process pool; .txt files are read directly.
+    
+    Settings are read on use, not at import, so spawned pool workers can
+    import this module without Django being set up.
+    """
+    
+    def __init__(self):
+        self._executor = None
+        self._executor_workers = 0
+        self._executor_lock = threading.Lock()
+    
+    @property
+    def _config(self) -> Dict:
+        from django.conf import settings
+        return settings.RAG_CONFIG
+    
+    def cache_path(self, sha256: str) -> str:
+        """Path of the cached text for a document hash"""
+        return os.path.join(
+            self._config['text_cache_dir'],
+            f"v{EXTRACTION_VERSION}",
+            sha256[:2],
+            f"{sha256}.txt"
+        )
+    
+    def get_cached(self, sha256: Optional[str]) -> Optional[str]:
+        """Cached text for a document hash, or None"""
+        if not sha256:
+            return None
+        
+        try:
+            with open(self.cache_path(sha256), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    
+    def extract(self, path: str, sha256: Optional[str] = None, parallel: bool = True) -> str:
+        """
+        Extract the full text of a document file (.txt or .pdf)
+        
+        Args:
+            path: Document file path
+            sha256: Content hash; enables the on-disk text cache
+            parallel: Allow splitting a large PDF across the process pool
+        
+        Returns:
+            Document text
+        """
+        file_ext = self._file_type(path)
+        
+        if file_ext == '.txt':
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        
+        cached = self.get_cached(sha256)
+        if cached is not None:
+            return cached
+        
+        text = self._extract_pdf(path, parallel)
+        
+        if sha256:
+            self._write_cache(sha256, [text])
+        
+        return text
+    
+    def extract_document(self, document, parallel: bool = True) -> str:
+        """Extract the text of a Document, using its sha256 as the cache key"""
+        return self.extract(document.path, document.sha256, parallel=parallel)
+    
+    def iter_pages(self, path: str, sha256: Optional[str] = None) -> Iterator[str]:
+        """
+        Yield a document's text page by page (.pdf) or in blocks (.txt)
+        
+        Cached text is streamed in blocks. An uncached PDF is read page by
+        page and written to the cache as it goes, so memory stays flat; the
+        cache file only appears once every page has been read.
+        """
+        file_ext = self._file_type(path)
+        
+        if file_ext == '.txt':
+            yield from self._iter_blocks(path)
+            return
+        
+        if sha256 and os.path.exists(self.cache_path(sha256)):
+            yield from self._iter_blocks(self.cache_path(sha256))
+            return
+        
+        import PyPDF2
+        
+        cache_file = None
+        tmp_path = None
+        if sha256:
+            try:
+                cache_file, tmp_path = self._open_cache_tmp(sha256)
+            except OSError as e:
+                logger.warning(f"Could not cache extracted text for {sha256}: {e}")
+        
+        try:
+            with open(path, 'rb') as pdf_file:
+                pdf_reader = PyPDF2.PdfReader(pdf_file)
+                for page in pdf_reader.pages:
+                    page_text = page.extract_text() + "\n"
+                    if cache_file:
+                        cache_file.write(page_text)
+                    yield page_text
+            
+            if cache_file:
+                cache_file.close()
+                os.replace(tmp_path, self.cache_path(sha256))
+                tmp_path = None
+        finally:
+            # Incomplete (failed or abandoned) extraction is not cached
+            if cache_file and not cache_file.closed:
+                cache_file.close()
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def pdf_info(self, path: str) -> Dict:
+        """Page count and document metadata of a PDF, without extracting text"""
+        import PyPDF2
+        
+        with open(path, 'rb') as pdf_file:
+            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            info = {'page_count': len(pdf_reader.pages)}
+            
+            if pdf_reader.metadata:
+                info['pdf_metadata'] = {
+                    'author': pdf_reader.metadata.get('/Author'),
+                    'creator': pdf_reader.metadata.get('/Creator'),
+                    'producer': pdf_reader.metadata.get('/Producer'),
+                    'subject': pdf_reader.metadata.get('/Subject'),
+                }
+        return info
+    
+    def discard(self, sha256: Optional[str]):
+        """Remove cached text for a document hash"""
+        if not sha256:
+            return
+        
+        try:
+            os.remove(self.cache_path(sha256))
+        except FileNotFoundError:
+            pass
+    
+    def _file_type(self, path: str) -> str:
+        file_ext = os.path.splitext(path)[1].lower()
+        if file_ext not in SUPPORTED_EXTENSIONS:
+            raise ValueError(f"Unsupported file type: {file_ext}")
+        return file_ext
+    
+    def _iter_blocks(self, path: str) -> Iterator[str]:
+        with open(path, 'r', encoding='utf-8') as f:
+            while True:
+                block = f.read(TEXT_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+    
+    def _extract_pdf(self, path: str, parallel: bool) -> str:
+        """Extract a whole PDF, splitting page ranges across the pool if large"""
+        import PyPDF2
+        
+        with open(path, 'rb') as pdf_file:
+            page_count = len(PyPDF2.PdfReader(pdf_file).pages)
+        
+        workers = self._workers() if parallel else 1
+        
+        if workers > 1 and page_count >= self._config['extraction_parallel_min_pages']:
+            ranges = self._page_ranges(page_count, workers)
+            try:
+                executor = self._get_executor(workers)
+                parts = list(executor.map(
+                    extract_page_range,
+                    [path] * len(ranges),
+                    [start for start, _ in ranges],
+                    [stop for _, stop in ranges],
+                ))
+                return ''.join(parts)
+            except BrokenProcessPool as e:
+                logger.error(f"Text extraction pool failed, extracting sequentially: {e}")
+                self._reset_executor()
+        
+        return extract_page_range(path, 0, page_count)
+    
+    def _workers(self) -> int:
+        """Pool size from RAG_CONFIG['extraction_workers'] (0 = one per core)"""
+        workers = self._config.get('extraction_workers', 0) or os.cpu_count() or 1
+        
+        # Daemonic processes (e.g. Celery prefork workers) cannot have children
+        if workers > 1 and multiprocessing.current_process().daemon:
+            return 1
+        return workers
+    
+    @staticmethod
+    def _page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+        """Split pages into a few ranges per worker, so slow pages even out"""
+        step = max(8, -(-page_count // (workers * 4)))
+        return [
+            (start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ]
+    
+    def _get_executor(self, workers: int) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None or self._executor_workers != workers:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._executor_workers = workers
+            return self._executor
+    
+    def _reset_executor(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    def _open_cache_tmp(self, sha256: str):
+        """Open a temporary file next to the cache entry (renamed when complete)"""
+        final_path = self.cache_path(sha256)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        tmp_path = f"{final_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        return open(tmp_path, 'w', encoding='utf-8'), tmp_path
+    
+    def _write_cache(self, sha256: str, parts: List[str]):
+        """Atomically write cached text; failures only cost a re-parse later"""
+        tmp_path = None
+        try:
+            cache_file, tmp_path = self._open_cache_tmp(sha256)
+            with cache_file:
+                cache_file.writelines(parts)
+            os.replace(tmp_path, self.cache_path(sha256))
+        except OSError as e:
+            logger.warning(f"Could not cache extracted text for {sha256}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+# Global instance
+text_extraction_service = TextExtractionService()
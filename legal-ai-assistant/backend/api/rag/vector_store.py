@@ -2,6 +2,16 @@
 # Replace the entire file with a redirect to the NumPy version
 
 from .vector_store_numpy import NumpyVectorStore as VectorStore
-from .vector_store_numpy import get_vector_store
+from .vector_store_ivf import IVFVectorStore
+from .partitioned_store import PartitionedVectorStore
+from .partitioned_store import get_vector_store
+from .partitioned_store import save_vector_store, warm_up_vector_store
 
-__all__ = ['VectorStore', 'get_vector_store']
\ No newline at end of file
+__all__ = [
+    'VectorStore',
+    'IVFVectorStore',
+    'PartitionedVectorStore',
+    'get_vector_store',
+    'save_vector_store',
+    'warm_up_vector_store',
+]
\ No newline at end of file
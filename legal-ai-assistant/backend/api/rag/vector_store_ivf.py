@@ -0,0 +1,286 @@
+# api/rag/vector_store_ivf.py
+import numpy as np
+import os
+from typing import List, Dict, Optional
+import logging
+
+from .vector_store_numpy import NumpyVectorStore, METADATA_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+class IVFVectorStore(NumpyVectorStore):
+    """
+    Approximate nearest-neighbour store using an inverted file (IVF) index
+    
+    Vectors are clustered with spherical k-means into nlist cells. A query
+    only scores the rows of its nprobe closest cells, trading a little
+    recall for a large cut in scanned rows. Small stores (below
+    min_train_size) and untrained stores fall back to exact search.
+    """
+    
+    BACKEND = 'ivf'
+    
+    COLUMNS = {
+        **METADATA_COLUMNS,
+        'assignments': np.int32,  # IVF cell of each row, -1 = unassigned
+    }
+    
+    def __init__(
+        self,
+        embedding_dim: int = 384,
+        nlist: int = 0,
+        nprobe: int = 8,
+        min_train_size: int = 20000,
+        kmeans_iterations: int = 10,
+        train_sample_size: int = 100000,
+        **kwargs
+    ):
+        """
+        Args:
+            embedding_dim: Dimension of embeddings
+            nlist: Number of IVF cells (0 = about 4 * sqrt(n) at training time)
+            nprobe: Cells scanned per query (higher = better recall, slower)
+            min_train_size: Below this many vectors, search stays exact
+            kmeans_iterations: Lloyd iterations when training the quantiser
+            train_sample_size: Max vectors sampled to train the quantiser
+            **kwargs: NumpyVectorStore options (quantization, rerank_factor)
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.train_sample_size = train_sample_size
+        self.centroids = None
+        self._trained_size = 0
+        self._lists = None
+        super().__init__(embedding_dim=embedding_dim, **kwargs)
+    
+    @property
+    def is_trained(self) -> bool:
+        """Whether the coarse quantiser has been trained"""
+        return self.centroids is not None
+    
+    @property
+    def assignments(self) -> np.ndarray:
+        """IVF cell of each live row"""
+        return self._buffers['assignments'][:self._size]
+    
+    def _derived_columns(self, start: int, end: int) -> Dict[str, np.ndarray]:
+        """Assign new rows to their closest cell"""
+        return {'assignments': self._assign(self._vector_rows(start, end))}
+    
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Closest centroid of each (normalized) vector, -1 if untrained"""
+        if self.centroids is None:
+            return np.full(len(vectors), -1, dtype=np.int32)
+        return self._nearest(vectors, self.centroids)
+    
+    @staticmethod
+    def _nearest(
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+        block_size: int = 8192
+    ) -> np.ndarray:
+        """Index of the most similar centroid per vector, in bounded-memory blocks"""
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            block = vectors[start:start + block_size]
+            labels[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+    
+    def train(self, seed: int = 0):
+        """
+        Train the coarse quantiser with spherical k-means and assign every row
+        
+        Args:
+            seed: Random seed for sampling and initialization
+        """
+        with self._write_lock:
+            n = self.size
+            nlist = self.nlist or int(4 * np.sqrt(n))
+            nlist = max(1, min(nlist, n // 39 or 1))
+            
+            rng = np.random.default_rng(seed)
+            sample_size = min(n, nlist * 64, max(self.train_sample_size, nlist * 39))
+            sample = self.vectors[np.sort(rng.choice(n, sample_size, replace=False))]
+            sample = np.ascontiguousarray(sample, dtype=np.float32)
+            
+            centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+            
+            for _ in range(self.kmeans_iterations):
+                labels = self._nearest(sample, centroids)
+                counts = np.bincount(labels, minlength=nlist)
+                
+                # Per-cell sums via one sort + segmented reduction
+                order = np.argsort(labels, kind='stable')
+                starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+                nonempty = counts > 0
+                sums = np.zeros_like(centroids)
+                sums[nonempty] = np.add.reduceat(
+                    sample[order], starts[nonempty], axis=0
+                )
+                
+                # Re-seed empty cells from random sample points
+                empty = counts == 0
+                if empty.any():
+                    sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+                
+                centroids = self._normalize(sums)
+            
+            self.centroids = centroids.astype(np.float32)
+            self._trained_size = n
+            
+            self.reserve(self._size)
+            self._buffers['assignments'][:n] = self._assign(self.vectors)
+            self._lists = None
+        
+        logger.info(f"Trained IVF quantiser with {nlist} cells on {sample_size} vectors")
+    
+    def maybe_train(self):
+        """(Re)train once the store is large enough or has grown 4x since training"""
+        if self.size < self.min_train_size:
+            return
+        
+        if not self.is_trained or self.size >= 4 * self._trained_size:
+            self.train()
+    
+    def _inverted_lists(self):
+        """(row order sorted by cell, cell offsets), rebuilt after appends"""
+        lists = self._lists
+        if lists is not None and lists[0] == self._size:
+            return lists[1], lists[2]
+        
+        assignments = self.assignments
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.searchsorted(
+            assignments[order], np.arange(len(self.centroids) + 1)
+        )
+        self._lists = (len(assignments), order, offsets)
+        return order, offsets
+    
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = 10,
+        filters: Optional[Dict] = None,
+        nprobe: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Search the nprobe closest cells for similar vectors
+        
+        Args:
+            query_embedding: Query vector (1D array)
+            k: Number of results to return
+            filters: Optional filters (see NumpyVectorStore.search)
+            nprobe: Cells to scan, overriding the store default
+        
+        Returns:
+            List of results with compact metadata and scores
+        """
+        if not self.is_trained or self.size < self.min_train_size:
+            return super().search(query_embedding, k=k, filters=filters)
+        
+        if query_embedding.ndim == 2:
+            query_embedding = query_embedding.squeeze()
+        
+        query_embedding = self._normalize(
+            query_embedding.astype(np.float32).reshape(1, -1)
+        ).squeeze()
+        
+        with self._reading():
+            order, offsets = self._inverted_lists()
+            mask = self._filter_mask(filters)
+            
+            nlist = len(self.centroids)
+            nprobe = min(nprobe or self.nprobe, nlist)
+            cell_order = np.argsort(-(self.centroids @ query_embedding))
+            
+            # Widen the probe until enough filtered candidates are found
+            while True:
+                cells = cell_order[:nprobe]
+                rows = np.concatenate(
+                    [order[offsets[cell]:offsets[cell + 1]] for cell in cells]
+                )
+                # Rows appended before training finished have no cell yet
+                rows = np.concatenate([rows, order[:offsets[0]]])
+                
+                if mask is not None:
+                    rows = rows[mask[rows]]
+                
+                if len(rows) >= k or nprobe >= nlist:
+                    break
+                nprobe = min(nprobe * 2, nlist)
+            
+            if len(rows) == 0:
+                return []
+            
+            top_rows, scores = self._scan(query_embedding, rows, k)
+            
+            results = []
+            for idx, score in zip(top_rows, scores):
+                meta = self._row_metadata(idx)
+                meta['score'] = float(score)
+                results.append(meta)
+        
+        return results
+    
+    def search_many(
+        self,
+        query_embeddings: np.ndarray,
+        k: int = 10,
+        filters: Optional[Dict] = None,
+        nprobe: Optional[int] = None
+    ) -> List[List[Dict]]:
+        """
+        Search for several queries at once
+        
+        Each query probes its own cells, so once trained the batch is
+        answered query by query; small or untrained stores use the exact
+        batched scan.
+        """
+        if not self.is_trained or self.size < self.min_train_size:
+            return super().search_many(query_embeddings, k=k, filters=filters)
+        
+        return [
+            self.search(query_embedding, k=k, filters=filters, nprobe=nprobe)
+            for query_embedding in np.atleast_2d(query_embeddings)
+        ]
+    
+    def _save(self, path: str):
+        """Train if needed before writing the snapshot"""
+        self.compact()
+        self.maybe_train()
+        super()._save(path)
+    
+    def _compacted(self):
+        """Row positions changed, so the inverted lists are stale"""
+        self._lists = None
+    
+    def _save_extra(self, generation_dir: str):
+        """Write the trained centroids"""
+        if self.centroids is not None:
+            np.save(os.path.join(generation_dir, 'centroids.npy'), self.centroids)
+    
+    def _manifest_extra(self) -> Dict:
+        """Record training state"""
+        return {
+            'trained': self.is_trained,
+            'trained_size': self._trained_size,
+        }
+    
+    def _load_extra(self, generation_dir: str, manifest: Dict):
+        """Read the trained centroids"""
+        self._lists = None
+        self._trained_size = manifest.get('trained_size', 0)
+        if manifest.get('trained'):
+            self.centroids = np.load(os.path.join(generation_dir, 'centroids.npy'))
+        else:
+            self.centroids = None
+    
+    def clear(self):
+        """Clear the store and its quantiser"""
+        self.centroids = None
+        self._trained_size = 0
+        self._lists = None
+        super().clear()
@@ -1,26 +1,302 @@
 # api/rag/vector_store_numpy.py
 import numpy as np
-import pickle
+import json
+import mmap
 import os
-from typing import List, Dict, Optional
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+# On-disk layout version, bumped whenever the column set changes
+INDEX_FORMAT_VERSION = 2
+
+# Compact metadata columns kept next to the vectors (text stays in the DB)
+METADATA_COLUMNS = {
+    'chunk_ids': np.int64,
+    'document_ids': np.int64,
+    'years': np.int32,          # 0 = unknown year
+    'jurisdictions': np.int32,  # code into jurisdiction_table, 0 = none
+}
+
+# Compact representations of the vectors used for the scan stage
+QUANTIZED_DTYPES = {
+    'int8': np.int8,        # per-dimension scale, 4x smaller than float32
+    'float16': np.float16,  # 2x smaller, near-lossless (slow to widen in NumPy)
+}
+
+
+class _FloatRows:
+    """
+    Float32 vectors of a quantized store, kept off the heap
+    
+    Rows of the last snapshot stay memory-mapped from its vectors.npy, so
+    only the pages a re-rank reads are ever loaded (and the OS can drop
+    them again); rows appended since live in a heap tail until the next
+    save maps them too. After a compaction, index maps each row to where
+    it is stored. Indexes like an array: len(), slices and integer arrays.
+    """
+    
+    dtype = np.dtype(np.float32)
+    
+    # Smallest heap tail allocated on the first append
+    MIN_CAPACITY = 1024
+    
+    def __init__(self, embedding_dim: int, base: Optional[np.ndarray] = None):
+        if base is None:
+            base = np.empty((0, embedding_dim), dtype=np.float32)
+        
+        # Re-ranks read scattered rows; without this hint each page fault
+        # on a cold file reads ahead far more than the row it needs
+        mapping = getattr(base, '_mmap', None)
+        if mapping is not None and hasattr(mmap, 'MADV_RANDOM'):
+            mapping.madvise(mmap.MADV_RANDOM)
+        self.base = base
+        self.tail = np.empty((0, embedding_dim), dtype=np.float32)
+        self.tail_size = 0
+        self.index = None   # row -> stored position (None = identity)
+        self.size = len(base)
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.size, self.base.shape[1]
+    
+    @property
+    def nbytes(self) -> int:
+        """Heap bytes held (the mapped snapshot rows are not counted)"""
+        index_bytes = self.index.nbytes if self.index is not None else 0
+        return self.tail.nbytes + index_bytes
+    
+    def __getitem__(self, key) -> np.ndarray:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if self.index is None and step == 1:
+                return self._stored_range(start, max(start, stop))
+            key = np.arange(start, stop, step)
+        
+        rows = np.asarray(key)
+        if self.index is not None:
+            rows = self.index[rows]
+        
+        n_base = len(self.base)
+        out = np.empty(rows.shape + (self.shape[1],), dtype=np.float32)
+        in_base = rows < n_base
+        out[in_base] = self.base[rows[in_base]]
+        out[~in_base] = self.tail[rows[~in_base] - n_base]
+        return out
+    
+    def _stored_range(self, start: int, stop: int) -> np.ndarray:
+        """Stored rows [start, stop) without a row index"""
+        n_base = len(self.base)
+        if stop <= n_base:
+            return self.base[start:stop]
+        if start >= n_base:
+            return self.tail[start - n_base:stop - n_base]
+        return np.concatenate([self.base[start:], self.tail[:stop - n_base]])
+    
+    def append(self, vectors: np.ndarray):
+        """Store rows after the current ones, growing the tail geometrically"""
+        end = self.tail_size + len(vectors)
+        if end > len(self.tail):
+            capacity = max(end, 2 * len(self.tail), self.MIN_CAPACITY)
+            tail = np.empty((capacity, self.shape[1]), dtype=np.float32)
+            tail[:self.tail_size] = self.tail[:self.tail_size]
+            self.tail = tail
+        self.tail[self.tail_size:end] = vectors
+        
+        if self.index is not None:
+            first = len(self.base) + self.tail_size
+            self.index = np.concatenate([
+                self.index, np.arange(first, first + len(vectors), dtype=np.int64)
+            ])
+        self.tail_size = end
+        self.size += len(vectors)
+    
+    def select(self, rows: np.ndarray) -> '_FloatRows':
+        """The given rows only, sharing this storage"""
+        selected = _FloatRows(self.shape[1], self.base)
+        selected.tail = self.tail
+        selected.tail_size = self.tail_size
+        selected.index = (
+            self.index[rows] if self.index is not None else rows.astype(np.int64)
+        )
+        selected.size = len(rows)
+        return selected
+    
+    def write(self, path: str, block_size: int = 8192):
+        """Save as a .npy file, one block at a time"""
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=self.shape)
+        for start in range(0, self.size, block_size):
+            out[start:start + block_size] = self[start:start + block_size]
+        out.flush()
+        del out
+
+
 class NumpyVectorStore:
     """NumPy-based vector store for similarity search (CPU-friendly)"""
     
-    def __init__(self, embedding_dim: int = 384):
+    # Backend name recorded in snapshot manifests
+    BACKEND = 'numpy'
+    
+    # Per-row columns stored next to the vectors
+    COLUMNS = METADATA_COLUMNS
+    
+    # Smallest buffer allocated on the first append
+    MIN_CAPACITY = 1024
+    
+    # Rows converted to float32 at a time when scanning quantized codes
+    SCAN_BLOCK_SIZE = 2048
+    
+    def __init__(
+        self,
+        embedding_dim: int = 384,
+        quantization: Optional[str] = None,
+        rerank_factor: int = 4,
+        compaction_threshold: float = 0.2,
+        model_fingerprint: Optional[str] = None
+    ):
         """
         Args:
             embedding_dim: Dimension of embeddings
+            quantization: Scan representation ('int8', 'float16' or None
+                for plain float32)
+            rerank_factor: With quantization, rerank_factor * k candidates
+                from the scan are re-scored exactly in float32
+            compaction_threshold: Fraction of deleted rows that triggers a
+                background compaction
+            model_fingerprint: Embedding model the vectors come from; stamped
+                on snapshots, and snapshots of another model are refused
         """
+        if quantization is not None and quantization not in QUANTIZED_DTYPES:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        
         self.embedding_dim = embedding_dim
-        self.vectors = None  # Will be numpy array
-        self.metadata = []
+        self.quantization = quantization
+        self.rerank_factor = max(1, rerank_factor)
+        self.compaction_threshold = compaction_threshold
+        self.model_fingerprint = model_fingerprint
+        self.jurisdiction_table = ['']
+        self._write_lock = threading.RLock()
+        self._readers = 0
+        self._swapping = False
+        self._readers_idle = threading.Condition(threading.Lock())
+        self._compaction_thread = None
+        self._reset_columns()
         logger.info(f"Initialized NumPy vector store with dimension {embedding_dim}")
     
+    def _reset_columns(self):
+        """Reset vectors and metadata columns to empty buffers"""
+        self._size = 0
+        self._buffers = self._allocate(0)
+        # Float32 vectors of a quantized store (re-rank only)
+        self._float_rows = _FloatRows(self.embedding_dim) if self.quantization else None
+        self._scales = None
+        self._stale_scales = False
+        self._deleted_count = 0
+        self._doc_rows = None
+        self._snapshot = None  # (generation dir, rows) of the last save/load
+        self.generation = 0    # Snapshot generation last saved or loaded (0 = none)
+    
+    def _allocate(self, capacity: int) -> Dict[str, np.ndarray]:
+        """
+        Allocate empty buffers for vectors and metadata columns
+        
+        A quantized store only holds its codes here; its float32 vectors
+        are kept in _FloatRows.
+        """
+        buffers = {}
+        if self.quantization:
+            buffers['codes'] = np.empty(
+                (capacity, self.embedding_dim),
+                dtype=QUANTIZED_DTYPES[self.quantization]
+            )
+        else:
+            buffers['vectors'] = np.empty((capacity, self.embedding_dim), dtype=np.float32)
+        for column, dtype in self.COLUMNS.items():
+            buffers[column] = np.empty(capacity, dtype=dtype)
+        buffers['deleted'] = np.empty(capacity, dtype=np.bool_)
+        return buffers
+    
+    @property
+    def capacity(self) -> int:
+        """Number of rows the current buffers can hold"""
+        return len(self._buffers['deleted'])
+    
+    def reserve(self, capacity: int):
+        """
+        Ensure the buffers can hold at least capacity rows
+        
+        Capacity grows geometrically (doubling), so appending n rows one
+        batch at a time costs O(n) copying overall instead of O(n^2).
+        Memory-mapped (read-only) buffers are copied to the heap here.
+        """
+        writable = all(buf.flags.writeable for buf in self._buffers.values())
+        if capacity <= self.capacity and writable:
+            return
+        
+        new_capacity = max(capacity, 2 * self.capacity, self.MIN_CAPACITY)
+        buffers = self._allocate(new_capacity)
+        for name, buf in self._buffers.items():
+            buffers[name][:self._size] = buf[:self._size]
+        self._buffers = buffers
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """
+        Live rows of the (normalized) vector matrix
+        
+        For a quantized store this is a _FloatRows, which reads rows from
+        the mapped snapshot on indexing.
+        """
+        if self.quantization:
+            return self._float_rows
+        return self._buffers['vectors'][:self._size]
+    
+    def _vector_rows(self, start: int, end: int) -> np.ndarray:
+        """Float32 rows [start, end), including rows not yet published"""
+        if self.quantization:
+            return self._float_rows[start:end]
+        return self._buffers['vectors'][start:end]
+    
+    @property
+    def chunk_ids(self) -> np.ndarray:
+        """Chunk id of each live row"""
+        return self._buffers['chunk_ids'][:self._size]
+    
+    @property
+    def document_ids(self) -> np.ndarray:
+        """Document id of each live row"""
+        return self._buffers['document_ids'][:self._size]
+    
+    @property
+    def years(self) -> np.ndarray:
+        """Year of each live row (0 = unknown)"""
+        return self._buffers['years'][:self._size]
+    
+    @property
+    def jurisdictions(self) -> np.ndarray:
+        """Jurisdiction code of each live row (0 = none)"""
+        return self._buffers['jurisdictions'][:self._size]
+    
+    @property
+    def deleted(self) -> np.ndarray:
+        """Tombstone of each live row (True = removed, skipped by search)"""
+        return self._buffers['deleted'][:self._size]
+    
+    @property
+    def codes(self) -> Optional[np.ndarray]:
+        """Quantized copy of the live rows scanned by search (None if unquantized)"""
+        if not self.quantization:
+            return None
+        return self._buffers['codes'][:self._size]
+    
     def add_vectors(
         self,
         embeddings: np.ndarray,
@@ -31,26 +307,261 @@ class NumpyVectorStore:
         
         Args:
             embeddings: numpy array of shape (n, embedding_dim)
-            metadata: List of metadata dicts for each vector
+            metadata: List of metadata dicts for each vector (chunk_id,
+                document_id, year, jurisdiction are kept; text is not)
         """
-        if embeddings.shape[1] != self.embedding_dim:
-            raise ValueError(
-                f"Embedding dimension mismatch: expected {self.embedding_dim}, "
-                f"got {embeddings.shape[1]}"
-            )
+        self.add_vectors_bulk([(embeddings, metadata)])
+    
+    def add_vectors_bulk(
+        self,
+        batches: List[Tuple[np.ndarray, List[Dict]]]
+    ):
+        """
+        Append many documents' vectors in place with a single reservation
         
-        # Normalize vectors for cosine similarity
-        embeddings = self._normalize(embeddings)
+        Args:
+            batches: List of (embeddings, metadata) pairs, one per document
+        """
+        total = 0
+        for embeddings, metadata in batches:
+            if embeddings.shape[1] != self.embedding_dim:
+                raise ValueError(
+                    f"Embedding dimension mismatch: expected {self.embedding_dim}, "
+                    f"got {embeddings.shape[1]}"
+                )
+            if len(embeddings) != len(metadata):
+                raise ValueError(
+                    f"Got {len(embeddings)} embeddings but {len(metadata)} metadata entries"
+                )
+            total += len(embeddings)
         
-        # Add to store
-        if self.vectors is None:
-            self.vectors = embeddings
-        else:
-            self.vectors = np.vstack([self.vectors, embeddings])
+        with self._write_lock:
+            self._append(batches, total)
+        
+        logger.info(f"Added {total} vectors. Total: {self.size}")
+    
+    def _append(self, batches: List[Tuple[np.ndarray, List[Dict]]], total: int):
+        """Write batches into the buffers after the current live rows"""
+        self.reserve(self._size + total)
+        
+        start = self._size
+        for embeddings, metadata in batches:
+            end = start + len(embeddings)
+            
+            # Normalize vectors for cosine similarity
+            vectors = self._normalize(embeddings.astype(np.float32, copy=False))
+            if self.quantization:
+                self._float_rows.append(vectors)
+                self._buffers['codes'][start:end] = self._quantize(vectors)
+            else:
+                self._buffers['vectors'][start:end] = vectors
+            self._buffers['chunk_ids'][start:end] = [
+                meta.get('chunk_id') or 0 for meta in metadata
+            ]
+            self._buffers['document_ids'][start:end] = [
+                meta.get('document_id') or 0 for meta in metadata
+            ]
+            self._buffers['years'][start:end] = [
+                meta.get('year') or 0 for meta in metadata
+            ]
+            self._buffers['jurisdictions'][start:end] = [
+                self._jurisdiction_code(meta.get('jurisdiction')) for meta in metadata
+            ]
+            self._buffers['deleted'][start:end] = False
+            if self._doc_rows is not None:
+                self._index_document_rows(start, end)
+            for column, values in self._derived_columns(start, end).items():
+                self._buffers[column][start:end] = values
+            start = end
+        
+        # Publish the new rows only once they are fully written
+        self._size = start
+    
+    def _derived_columns(self, start: int, end: int) -> Dict[str, np.ndarray]:
+        """Extra column values computed from newly written rows (for subclasses)"""
+        return {}
+    
+    def remove_document(self, document_id: int) -> int:
+        """
+        Tombstone every row of a document
+        
+        Cost is O(rows of the document): rows are only flagged, and are
+        dropped by the next compaction or save.
+        
+        Args:
+            document_id: Document whose vectors should disappear from search
+        
+        Returns:
+            Number of rows removed
+        """
+        with self._write_lock:
+            if self._doc_rows is None:
+                self._doc_rows = {}
+                self._index_document_rows(0, self._size)
+            
+            rows = self._doc_rows.pop(int(document_id), None)
+            if not rows:
+                return 0
+            
+            rows = np.concatenate(rows)
+            self._buffers['deleted'][rows] = True
+            self._deleted_count += len(rows)
+        
+        logger.info(f"Removed {len(rows)} vectors of document {document_id}")
+        return len(rows)
+    
+    def _index_document_rows(self, start: int, end: int):
+        """Add the live rows in [start, end) to the document -> rows map used for deletes"""
+        rows = start + np.flatnonzero(~self._buffers['deleted'][start:end])
+        document_ids = self._buffers['document_ids'][rows]
+        order = np.argsort(document_ids, kind='stable')
+        doc_ids, offsets = np.unique(document_ids[order], return_index=True)
+        for doc_id, doc_rows in zip(doc_ids, np.split(rows[order], offsets[1:])):
+            self._doc_rows.setdefault(int(doc_id), []).append(doc_rows)
+    
+    def maybe_compact(self, path: Optional[str] = None) -> bool:
+        """
+        Start a background compaction once enough rows are tombstoned
+        
+        Args:
+            path: If given, the compacted store is saved there afterwards
+        
+        Returns:
+            Whether a compaction was started
+        """
+        if self._size == 0 or self._deleted_count < self.compaction_threshold * self._size:
+            return False
+        
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return False
+        
+        self._compaction_thread = threading.Thread(
+            target=self._compact_and_save,
+            args=(path,),
+            name='vector-store-compaction',
+            daemon=True,
+        )
+        self._compaction_thread.start()
+        return True
+    
+    def _compact_and_save(self, path: Optional[str]):
+        """Background compaction job"""
+        try:
+            with self._write_lock:
+                self.compact()
+                if not path:
+                    return
+                
+                # A snapshot saved by another process since this store was
+                # loaded holds rows this one lacks: never overwrite it
+                manifest = self._read_manifest(path)
+                if manifest is not None and manifest.get('generation') != self.generation:
+                    logger.info(
+                        f"Vector store at {path} was replaced by another process, "
+                        f"not saving the compacted store"
+                    )
+                    return
+                self._save(path)
+        except Exception as e:
+            logger.error(f"Vector store compaction failed: {e}", exc_info=True)
+    
+    def compact(self):
+        """
+        Drop tombstoned rows, rewriting the buffers with live rows only
+        
+        The new buffers are built while appends are blocked but searches
+        keep running; the swap itself waits for in-flight searches.
+        """
+        with self._write_lock:
+            if not self._deleted_count:
+                return
+            
+            keep = np.flatnonzero(~self.deleted)
+            buffers = self._allocate(len(keep))
+            for name, buf in buffers.items():
+                buf[:] = self._buffers[name][:self._size][keep]
+            float_rows = self._float_rows.select(keep) if self.quantization else None
+            
+            removed = self._size - len(keep)
+            with self._readers_idle:
+                # Hold off new searches so the swap cannot be starved
+                self._swapping = True
+                self._readers_idle.wait_for(lambda: self._readers == 0)
+                self._buffers = buffers
+                self._float_rows = float_rows
+                self._size = len(keep)
+                self._deleted_count = 0
+                self._doc_rows = None
+                self._snapshot = None
+                self._compacted()
+                self._swapping = False
+                self._readers_idle.notify_all()
+        
+        logger.info(f"Compacted vector store: dropped {removed} rows, {self.size} left")
+    
+    def _compacted(self):
+        """Reset state derived from row positions after a compaction (for subclasses)"""
+    
+    @contextmanager
+    def _reading(self):
+        """Keep compaction from swapping the buffers during a search"""
+        with self._readers_idle:
+            self._readers_idle.wait_for(lambda: not self._swapping)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._readers_idle:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._readers_idle.notify_all()
+    
+    def _quantize(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Encode normalized vectors in the scan representation
         
-        self.metadata.extend(metadata)
+        int8 codes use one scale per dimension (max |value| / 127), taken
+        from the first batch. Later values outside that range are clipped
+        and the scales are refitted on the whole store at the next save.
+        """
+        if self.quantization == 'float16':
+            return vectors.astype(np.float16)
+        
+        peaks = np.abs(vectors).max(axis=0) if len(vectors) else None
+        if self._scales is None:
+            if peaks is None:
+                return np.empty((0, self.embedding_dim), dtype=np.int8)
+            self._scales = np.maximum(peaks, 1e-6).astype(np.float32) / 127
+        elif peaks is not None and (peaks > self._scales * 127).any():
+            self._stale_scales = True
+        
+        codes = np.rint(vectors / self._scales)
+        return np.clip(codes, -127, 127).astype(np.int8)
+    
+    def requantize(self):
+        """Refit the int8 scales on every row and re-encode the codes"""
+        if self.quantization != 'int8':
+            return
+        
+        with self._write_lock:
+            self.reserve(self._size)
+            self._scales = None
+            self._stale_scales = False
+            
+            vectors = self.vectors
+            if len(vectors):
+                peaks = np.zeros(self.embedding_dim, dtype=np.float32)
+                for start in range(0, len(vectors), self.SCAN_BLOCK_SIZE):
+                    block = vectors[start:start + self.SCAN_BLOCK_SIZE]
+                    np.maximum(peaks, np.abs(block).max(axis=0), out=peaks)
+                self._scales = np.maximum(peaks, 1e-6) / 127
+            
+            for start in range(0, len(vectors), self.SCAN_BLOCK_SIZE):
+                end = min(start + self.SCAN_BLOCK_SIZE, len(vectors))
+                self._buffers['codes'][start:end] = self._quantize(vectors[start:end])
+            self._stale_scales = False
         
-        logger.info(f"Added {len(embeddings)} vectors. Total: {self.size}")
+        logger.info(f"Requantized {self.size} vectors to int8")
     
     def search(
         self,
@@ -64,12 +575,14 @@ class NumpyVectorStore:
         Args:
             query_embedding: Query vector (1D array)
             k: Number of results to return
-            filters: Optional filters to apply
+            filters: Optional filters (jurisdiction, year_from, year_to,
+                document_ids, chunk_ids, exclude_chunk_ids)
         
         Returns:
-            List of results with metadata and scores
+            List of results with compact metadata (chunk_id, document_id,
+            year, jurisdiction) and scores
         """
-        if self.vectors is None or self.size == 0:
+        if self.size == 0:
             logger.warning("Vector store is empty")
             return []
         
@@ -78,32 +591,190 @@ class NumpyVectorStore:
             query_embedding = query_embedding.squeeze()
         
         # Normalize query
-        query_embedding = self._normalize(query_embedding.reshape(1, -1)).squeeze()
+        query_embedding = self._normalize(
+            query_embedding.astype(np.float32).reshape(1, -1)
+        ).squeeze()
         
-        # Compute cosine similarity (dot product of normalized vectors)
-        similarities = np.dot(self.vectors, query_embedding)
+        with self._reading():
+            # Restrict to live rows matching the metadata filters
+            mask = self._filter_mask(filters)
+            
+            rows = None if mask is None else np.flatnonzero(mask)
+            if rows is not None and len(rows) == 0:
+                return []
+            
+            top_rows, scores = self._scan(query_embedding, rows, k)
+            
+            # Prepare results
+            results = []
+            for idx, score in zip(top_rows, scores):
+                meta = self._row_metadata(idx)
+                meta['score'] = float(score)
+                results.append(meta)
+        
+        return results
+    
+    def search_many(
+        self,
+        query_embeddings: np.ndarray,
+        k: int = 10,
+        filters: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """
+        Search for several queries at once
+        
+        All queries are scored with one matrix-matrix product, so the cost
+        per query falls as the batch grows instead of paying Python and
+        memory-scan overhead for each one.
+        
+        Args:
+            query_embeddings: Query vectors of shape (m, embedding_dim)
+            k: Number of results per query
+            filters: Optional filters applied to every query
+        
+        Returns:
+            One result list per query, as returned by search
+        """
+        query_embeddings = np.atleast_2d(query_embeddings)
+        if self.size == 0 or len(query_embeddings) == 0:
+            return [[] for _ in query_embeddings]
         
-        # Get top-k indices
-        top_k = min(k * 2, len(similarities))  # Get extra for filtering
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        query_embeddings = self._normalize(query_embeddings.astype(np.float32))
         
-        # Prepare results
-        results = []
-        for idx in top_indices:
-            meta = self.metadata[idx].copy()
+        with self._reading():
+            mask = self._filter_mask(filters)
             
-            # Apply filters
-            if filters:
-                if not self._matches_filters(meta, filters):
-                    continue
+            rows = None if mask is None else np.flatnonzero(mask)
+            if rows is not None and len(rows) == 0:
+                return [[] for _ in query_embeddings]
             
-            meta['score'] = float(similarities[idx])
-            results.append(meta)
+            top_rows, scores = self._scan_many(query_embeddings, rows, k)
             
-            if len(results) >= k:
-                break
+            all_results = []
+            for query_rows, query_scores in zip(top_rows, scores):
+                results = []
+                for idx, score in zip(query_rows, query_scores):
+                    meta = self._row_metadata(idx)
+                    meta['score'] = float(score)
+                    results.append(meta)
+                all_results.append(results)
         
-        return results
+        return all_results
+    
+    def _scan(
+        self,
+        query_embedding: np.ndarray,
+        rows: Optional[np.ndarray],
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top k rows and exact scores for one query (see _scan_many)"""
+        top_rows, scores = self._scan_many(query_embedding.reshape(1, -1), rows, k)
+        return top_rows[0], scores[0]
+    
+    def _scan_many(
+        self,
+        query_embeddings: np.ndarray,
+        rows: Optional[np.ndarray],
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score candidate rows (None = all) against each query and return,
+        per query, the top k rows and their exact cosine similarities
+        
+        With quantization the scan reads the compact codes, then the best
+        rerank_factor * k candidates are re-scored against the float32
+        vectors, so only those rows of the (mapped) matrix are read.
+        """
+        if not self.quantization:
+            # Cosine similarity is the dot product of normalized vectors
+            similarities = self._scores(self.vectors, query_embeddings, rows)
+            top = self._top_k_rows(similarities, k)
+            top_rows = top if rows is None else rows[top]
+            return top_rows, np.take_along_axis(similarities, top, axis=1)
+        
+        weights = query_embeddings
+        if self.quantization == 'int8':
+            weights = query_embeddings * self._scales
+        
+        approx = self._scores(self.codes, weights, rows)
+        candidates = self._top_k_rows(approx, k * self.rerank_factor)
+        if rows is not None:
+            candidates = rows[candidates]
+        
+        # Exact float32 re-rank of the shortlist (sorted for sequential reads)
+        candidates = np.sort(candidates, axis=1)
+        similarities = np.einsum(
+            'qcd,qd->qc', self.vectors[candidates], query_embeddings
+        )
+        top = self._top_k_rows(similarities, k)
+        return (
+            np.take_along_axis(candidates, top, axis=1),
+            np.take_along_axis(similarities, top, axis=1),
+        )
+    
+    def _scores(
+        self,
+        matrix: np.ndarray,
+        query_embeddings: np.ndarray,
+        rows: Optional[np.ndarray]
+    ) -> np.ndarray:
+        """(queries, rows) dot products of the queries with (the selected rows of) matrix"""
+        if rows is not None and len(rows) * 2 < len(matrix):
+            # Selective filter: only score the matching rows
+            return self._dot(matrix[rows], query_embeddings)
+        
+        # Broad filter: a full scan is cheaper than gathering rows
+        scores = self._dot(matrix, query_embeddings)
+        return scores if rows is None else scores[:, rows]
+    
+    def _dot(self, matrix: np.ndarray, query_embeddings: np.ndarray) -> np.ndarray:
+        """queries @ matrix.T, widening non-float32 codes one block at a time"""
+        if matrix.dtype == np.float32:
+            return query_embeddings @ matrix.T
+        
+        scores = np.empty((len(query_embeddings), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), self.SCAN_BLOCK_SIZE):
+            end = start + self.SCAN_BLOCK_SIZE
+            scores[:, start:end] = query_embeddings @ matrix[start:end].astype(np.float32).T
+        return scores
+    
+    @staticmethod
+    def _top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+        """Column indices of the k highest scores of each row, best first"""
+        n = scores.shape[1]
+        k = min(k, n)
+        if k <= 0:
+            return np.empty((len(scores), 0), dtype=np.int64)
+        
+        if k < n:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(n), scores.shape)
+        
+        order = np.argsort(
+            -np.take_along_axis(scores, top, axis=1), axis=1, kind='stable'
+        )
+        return np.take_along_axis(top, order, axis=1)
+    
+    def _row_metadata(self, idx: int) -> Dict:
+        """Rebuild the compact metadata dict for one row"""
+        year = int(self.years[idx])
+        return {
+            'chunk_id': int(self.chunk_ids[idx]),
+            'document_id': int(self.document_ids[idx]),
+            'year': year or None,
+            'jurisdiction': self.jurisdiction_table[self.jurisdictions[idx]],
+        }
+    
+    def _jurisdiction_code(self, jurisdiction: Optional[str]) -> int:
+        """Map a jurisdiction string to its integer code"""
+        if not jurisdiction:
+            return 0
+        try:
+            return self.jurisdiction_table.index(jurisdiction)
+        except ValueError:
+            self.jurisdiction_table.append(jurisdiction)
+            return len(self.jurisdiction_table) - 1
     
     def _normalize(self, vectors: np.ndarray) -> np.ndarray:
         """Normalize vectors to unit length"""
@@ -111,92 +782,312 @@ class NumpyVectorStore:
         norms[norms == 0] = 1  # Avoid division by zero
         return vectors / norms
     
-    def _matches_filters(self, metadata: Dict, filters: Dict) -> bool:
-        """Check if metadata matches filters"""
+    def _filter_mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """
+        Build a boolean row mask from metadata filters
+        
+        Rows with no jurisdiction or year recorded are kept by the
+        jurisdiction and year filters; tombstoned rows are always dropped.
+        Returns None when nothing filters.
+        """
+        mask = None
+        
+        def combine(condition):
+            nonlocal mask
+            mask = condition if mask is None else mask & condition
+        
+        if self._deleted_count:
+            combine(~self.deleted)
+        
+        if not filters:
+            return mask
+        
         # Jurisdiction filter
-        if 'jurisdiction' in filters and filters['jurisdiction']:
-            doc_jurisdiction = metadata.get('jurisdiction', '')
-            if doc_jurisdiction and doc_jurisdiction != filters['jurisdiction']:
-                return False
+        if filters.get('jurisdiction'):
+            codes = self.jurisdictions
+            try:
+                code = self.jurisdiction_table.index(filters['jurisdiction'])
+                combine((codes == code) | (codes == 0))
+            except ValueError:
+                combine(codes == 0)
         
         # Year range filter
-        if 'year_from' in filters and filters['year_from']:
-            doc_year = metadata.get('year')
-            if doc_year and doc_year < filters['year_from']:
-                return False
+        if filters.get('year_from'):
+            years = self.years
+            combine((years == 0) | (years >= int(filters['year_from'])))
         
-        if 'year_to' in filters and filters['year_to']:
-            doc_year = metadata.get('year')
-            if doc_year and doc_year > filters['year_to']:
-                return False
+        if filters.get('year_to'):
+            years = self.years
+            combine((years == 0) | (years <= int(filters['year_to'])))
         
-        # Keyword include filter
-        if 'include' in filters and filters['include']:
-            text = metadata.get('text', '').lower()
-            if not any(keyword.lower() in text for keyword in filters['include']):
-                return False
+        # Document filter
+        if filters.get('document_ids') is not None:
+            combine(np.isin(
+                self.document_ids,
+                np.fromiter(filters['document_ids'], dtype=np.int64)
+            ))
         
-        # Keyword exclude filter
-        if 'exclude' in filters and filters['exclude']:
-            text = metadata.get('text', '').lower()
-            if any(keyword.lower() in text for keyword in filters['exclude']):
-                return False
+        # Chunk allow/deny lists (keyword filters resolved against the DB)
+        if filters.get('chunk_ids') is not None:
+            combine(np.isin(
+                self.chunk_ids,
+                np.fromiter(filters['chunk_ids'], dtype=np.int64)
+            ))
         
-        return True
+        if filters.get('exclude_chunk_ids'):
+            combine(~np.isin(
+                self.chunk_ids,
+                np.fromiter(filters['exclude_chunk_ids'], dtype=np.int64)
+            ))
+        
+        return mask
     
     def save(self, path: str):
-        """Save store to disk"""
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        
-        # Save as single pickle file
-        data = {
-            'vectors': self.vectors,
-            'metadata': self.metadata,
-            'embedding_dim': self.embedding_dim
+        """
+        Save store to disk as a directory of raw .npy columns
+        
+        Each save writes a new generation directory and then atomically
+        swaps manifest.json, so readers never see a partial snapshot.
+        """
+        with self._write_lock:
+            self._save(path)
+    
+    def _save(self, path: str):
+        """Write a new snapshot generation and swap the manifest"""
+        # Snapshots only ever hold live rows
+        self.compact()
+        
+        if self._stale_scales:
+            self.requantize()
+        
+        os.makedirs(path, exist_ok=True)
+        
+        manifest = self._read_manifest(path)
+        generation = (manifest or {}).get('generation', 0) + 1
+        generation_dir = os.path.join(path, f"gen-{generation}")
+        
+        if os.path.exists(generation_dir):
+            shutil.rmtree(generation_dir)
+        os.makedirs(generation_dir)
+        
+        vectors_path = os.path.join(generation_dir, 'vectors.npy')
+        if self.quantization:
+            self._float_rows.write(vectors_path)
+        else:
+            np.save(vectors_path, self.vectors)
+        for column, dtype in self.COLUMNS.items():
+            np.save(
+                os.path.join(generation_dir, f"{column}.npy"),
+                self._buffers[column][:self._size].astype(dtype, copy=False)
+            )
+        if self.quantization:
+            np.save(os.path.join(generation_dir, 'codes.npy'), self.codes)
+        if self._scales is not None:
+            np.save(os.path.join(generation_dir, 'scales.npy'), self._scales)
+        self._save_extra(generation_dir)
+        
+        chunk_count, max_chunk_id = self.chunk_stats()
+        manifest = {
+            'format_version': INDEX_FORMAT_VERSION,
+            'backend': self.BACKEND,
+            'generation': generation,
+            'embedding_dim': self.embedding_dim,
+            'model_fingerprint': self.model_fingerprint,
+            'quantization': self.quantization,
+            'size': self.size,
+            'jurisdiction_table': self.jurisdiction_table,
+            'chunk_count': chunk_count,
+            'max_chunk_id': max_chunk_id,
+            **self._manifest_extra(),
         }
         
-        with open(f"{path}.pkl", 'wb') as f:
-            pickle.dump(data, f)
+        tmp_path = os.path.join(path, 'manifest.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(path, 'manifest.json'))
         
-        logger.info(f"Saved vector store to {path}.pkl")
+        # Older generations may still be mapped by other workers; unlinking
+        # is safe on POSIX since their mappings stay valid until closed.
+        for name in os.listdir(path):
+            if name.startswith('gen-') and name != f"gen-{generation}":
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        
+        self._snapshot = (generation_dir, self._size)
+        self.generation = generation
+        if self.quantization:
+            # Re-rank from the snapshot just written, freeing the heap tail
+            self._float_rows = _FloatRows(
+                self.embedding_dim, np.load(vectors_path, mmap_mode='r')
+            )
+        logger.info(f"Saved vector store to {generation_dir}")
+    
+    def save_tombstones(self) -> bool:
+        """
+        Persist deletions against the last snapshot without rewriting it
+        
+        The tombstones of the snapshot rows are written as a packed bitmap
+        next to the snapshot, so a restart does not resurrect removed rows.
+        
+        Returns:
+            False when there is no current snapshot to update (never saved,
+            compacted since, or replaced by another process's save), in
+            which case the store must be saved in full
+        """
+        with self._write_lock:
+            if self._snapshot is None:
+                return False
+            
+            generation_dir, rows = self._snapshot
+            manifest = self._read_manifest(os.path.dirname(generation_dir))
+            if manifest is None or manifest.get('generation') != self.generation:
+                return False
+            
+            tmp_path = os.path.join(generation_dir, 'deleted.npy.tmp')
+            try:
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, np.packbits(self._buffers['deleted'][:rows]))
+                os.replace(tmp_path, os.path.join(generation_dir, 'deleted.npy'))
+            except FileNotFoundError:
+                # Generation removed by a concurrent save
+                return False
+            return True
     
     def load(self, path: str):
-        """Load store from disk"""
-        with open(f"{path}.pkl", 'rb') as f:
-            data = pickle.load(f)
+        """
+        Load store from disk
+        
+        Columns are memory-mapped read-only, so loading is O(1) and every
+        worker process shares the same page-cache copy of the index.
+        """
+        manifest = self._read_manifest(path)
+        if manifest is None:
+            raise FileNotFoundError(f"No vector store manifest in {path}")
+        
+        if manifest.get('format_version') != INDEX_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported index format {manifest.get('format_version')}"
+            )
+        
+        if manifest.get('backend') != self.BACKEND:
+            raise ValueError(
+                f"Snapshot was written by the {manifest.get('backend')} backend, "
+                f"expected {self.BACKEND}"
+            )
         
-        self.vectors = data['vectors']
-        self.metadata = data['metadata']
-        self.embedding_dim = data['embedding_dim']
+        if (
+            self.model_fingerprint is not None
+            and manifest.get('model_fingerprint') != self.model_fingerprint
+        ):
+            raise ValueError(
+                f"Snapshot was built with embedding model "
+                f"{manifest.get('model_fingerprint')}, expected {self.model_fingerprint}"
+            )
+        
+        if manifest.get('quantization') != self.quantization:
+            raise ValueError(
+                f"Snapshot uses quantization {manifest.get('quantization')}, "
+                f"expected {self.quantization}"
+            )
+        
+        generation_dir = os.path.join(path, f"gen-{manifest['generation']}")
+        
+        self.embedding_dim = manifest['embedding_dim']
+        self.jurisdiction_table = manifest['jurisdiction_table']
+        names = ['vectors', *self.COLUMNS]
+        if self.quantization:
+            names.append('codes')
+        
+        buffers = {}
+        for name in names:
+            buffers[name] = np.load(
+                os.path.join(generation_dir, f"{name}.npy"), mmap_mode='r'
+            )
+        self._size = manifest['size']
+        self._float_rows = (
+            _FloatRows(self.embedding_dim, buffers.pop('vectors'))
+            if self.quantization else None
+        )
+        
+        deleted_path = os.path.join(generation_dir, 'deleted.npy')
+        if os.path.exists(deleted_path):
+            buffers['deleted'] = np.unpackbits(
+                np.load(deleted_path), count=self._size
+            ).astype(np.bool_)
+        else:
+            buffers['deleted'] = np.zeros(self._size, dtype=np.bool_)
+        self._buffers = buffers
+        self._deleted_count = int(np.count_nonzero(buffers['deleted']))
+        self._doc_rows = None
+        self._snapshot = (generation_dir, self._size)
+        self.generation = manifest['generation']
+        
+        scales_path = os.path.join(generation_dir, 'scales.npy')
+        self._scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        self._stale_scales = False
+        self._load_extra(generation_dir, manifest)
         
         logger.info(
-            f"Loaded vector store from {path}.pkl. "
+            f"Loaded vector store from {generation_dir}. "
             f"Total vectors: {self.size}"
         )
+        return manifest
+    
+    def _save_extra(self, generation_dir: str):
+        """Write backend-specific files into a snapshot (for subclasses)"""
+    
+    def _manifest_extra(self) -> Dict:
+        """Backend-specific manifest entries (for subclasses)"""
+        return {}
+    
+    def _load_extra(self, generation_dir: str, manifest: Dict):
+        """Read backend-specific files from a snapshot (for subclasses)"""
+    
+    @staticmethod
+    def _read_manifest(path: str) -> Optional[Dict]:
+        """Read manifest.json from an index directory, if present"""
+        manifest_path = os.path.join(path, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            return json.load(f)
     
     def clear(self):
         """Clear the store"""
-        self.vectors = None
-        self.metadata = []
+        self.jurisdiction_table = ['']
+        self._reset_columns()
         logger.info("Cleared vector store")
     
     @property
     def size(self) -> int:
-        """Get number of vectors in store"""
-        return len(self.metadata) if self.metadata else 0
-
-
-# Global instance (lazy initialization)
-_global_vector_store = None
-
-def get_vector_store() -> NumpyVectorStore:
-    """Get or create global vector store"""
-    global _global_vector_store
-    
-    if _global_vector_store is None:
-        from .embeddings import embedding_service
-        _global_vector_store = NumpyVectorStore(
-            embedding_dim=embedding_service.embedding_dim
-        )
+        """Get number of vectors in store (including tombstoned rows)"""
+        return self._size
+    
+    @property
+    def live_size(self) -> int:
+        """Number of vectors visible to search"""
+        return self._size - self._deleted_count
     
-    return _global_vector_store
\ No newline at end of file
+    def chunk_stats(self) -> Tuple[int, Optional[int]]:
+        """(count, max chunk id) of the live rows, to compare with the database"""
+        chunk_ids = self.chunk_ids
+        if self._deleted_count:
+            chunk_ids = chunk_ids[~self.deleted]
+        chunk_ids = chunk_ids[chunk_ids != 0]
+        return len(chunk_ids), int(chunk_ids.max()) if len(chunk_ids) else None
+    
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held by the vector and metadata buffers
+        
+        The float32 snapshot rows a quantized store keeps mapped for
+        re-ranking are not counted: only the candidate rows are read.
+        """
+        float_bytes = self._float_rows.nbytes if self._float_rows is not None else 0
+        return sum(buf.nbytes for buf in self._buffers.values()) + float_bytes
+    
+    @property
+    def scan_nbytes(self) -> int:
+        """Bytes of vector data read by an unfiltered exact scan"""
+        matrix = self.codes if self.quantization else self.vectors
+        return matrix.nbytes
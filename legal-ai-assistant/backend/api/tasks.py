@@ -32,6 +32,9 @@ def ingest_document_task(document_id: int, reindex: bool = False):
 def ingest_user_documents_task(user_id: int, reindex: bool = False):
     """
     Celery task to ingest all documents for a user
+    
+    Extraction and embedding fan out over RAG_CONFIG['ingestion_workers']
+    processes.
     """
     try:
         user = User.objects.get(id=user_id)
@@ -47,4 +50,20 @@ def ingest_user_documents_task(user_id: int, reindex: bool = False):
         return {'success': False, 'error': 'User not found'}
     except Exception as e:
         logger.error(f"Async ingestion failed for user {user_id}: {e}")
-        return {'success': False, 'error': str(e)}
\ No newline at end of file
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task
+def reembed_chunks_task(user_id: int = None):
+    """
+    Celery task to re-embed chunks stored by a different embedding model
+    """
+    try:
+        total = ingestion_service.reembed_stale_chunks(user_id=user_id)
+        
+        logger.info(f"Re-embedded {total} chunks")
+        return {'success': True, 'reembedded': total}
+        
+    except Exception as e:
+        logger.error(f"Re-embedding failed: {e}")
+        return {'success': False, 'error': str(e)}
@@ -1,3 +1,672 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .inference.batch_engine import batched_llm_engine
+from .inference.llm_engine import llm_engine
+from .inference.prompts import SectionSummaryPrompt
+from .inference.scheduler import InferenceScheduler, QueueFullError, QueueTimeoutError
+from .inference.service import InferenceService
+from .inference.summarizer import MapReduceSummarizer
+from .inference.worker_pool import RemoteLLMEngine
+from .models import Chunk, Document, EmbeddingCacheEntry
+from .rag.chunker import DocumentChunker
+from .rag.embedding_cache import EmbeddingCache
+from .rag.ingestion import ingestion_service
+from .rag.text_extraction import text_extraction_service
+from .rag.vector_store_ivf import IVFVectorStore
+from .rag.vector_store_numpy import NumpyVectorStore
+
+
+def _random_rows(rng, n, dim=16, first_chunk_id=1):
+    """Random embeddings with compact metadata for NumpyVectorStore"""
+    embeddings = rng.normal(size=(n, dim)).astype(np.float32)
+    metadata = [
+        {
+            'chunk_id': first_chunk_id + i,
+            'document_id': 1 + (first_chunk_id + i) % 7,
+            'year': int(rng.choice([0, 1995, 2005, 2015, 2022])) or None,
+            'jurisdiction': rng.choice(['', 'US', 'UK', 'EU']) or None,
+        }
+        for i in range(n)
+    ]
+    return embeddings, metadata
+
+
+class VectorStoreBufferTests(SimpleTestCase):
+    """Geometric buffer growth gives the same rows as stacking every batch"""
+    
+    def test_appends_match_vstack(self):
+        rng = np.random.default_rng(0)
+        store = NumpyVectorStore(embedding_dim=16)
+        batches = [
+            _random_rows(rng, n, first_chunk_id=1 + 2000 * i)
+            for i, n in enumerate([1, 7, 300, 1024, 5])
+        ]
+        
+        capacities = []
+        for embeddings, metadata in batches:
+            store.add_vectors(embeddings, metadata)
+            capacities.append(store.capacity)
+        
+        stacked = np.vstack([embeddings for embeddings, _ in batches])
+        stacked /= np.linalg.norm(stacked, axis=1, keepdims=True)
+        np.testing.assert_allclose(store.vectors, stacked, rtol=1e-6)
+        self.assertEqual(
+            store.chunk_ids.tolist(),
+            [meta['chunk_id'] for _, metadata in batches for meta in metadata]
+        )
+        self.assertEqual(store.size, len(stacked))
+        
+        # Capacity only grows, at least doubling each time
+        self.assertEqual(capacities[0], NumpyVectorStore.MIN_CAPACITY)
+        for before, after in zip(capacities, capacities[1:]):
+            self.assertTrue(after == before or after >= 2 * before)
+    
+    def test_append_after_load_copies_to_heap(self):
+        rng = np.random.default_rng(1)
+        store = NumpyVectorStore(embedding_dim=16)
+        store.add_vectors(*_random_rows(rng, 50))
+        
+        with tempfile.TemporaryDirectory() as path:
+            store.save(path)
+            loaded = NumpyVectorStore(embedding_dim=16)
+            loaded.load(path)
+            self.assertFalse(loaded.vectors.flags.writeable)
+            
+            loaded.add_vectors(*_random_rows(rng, 10, first_chunk_id=51))
+            self.assertEqual(loaded.size, 60)
+            np.testing.assert_array_equal(loaded.vectors[:50], store.vectors)
+            self.assertEqual(loaded.chunk_ids.tolist(), list(range(1, 61)))
+
+
+class BruteForceTestCase(SimpleTestCase):
+    """A small store and the exact row-by-row search it must agree with"""
+    
+    FILTERS = [
+        None,
+        {'jurisdiction': 'US'},
+        {'jurisdiction': 'FR'},
+        {'year_from': 2000, 'year_to': 2016},
+        {'document_ids': [2, 5]},
+        {'chunk_ids': list(range(1, 400, 3))},
+        {'exclude_chunk_ids': list(range(1, 400, 2)), 'jurisdiction': 'UK'},
+    ]
+    
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.embeddings, self.metadata = _random_rows(rng, 400)
+        self.queries = rng.normal(size=(3, 16)).astype(np.float32)
+        self.store = NumpyVectorStore(embedding_dim=16)
+        self.store.add_vectors(self.embeddings, self.metadata)
+    
+    def _brute_force(self, query, k, filters, deleted_chunks=()):
+        """The pre-vectorisation search: score, filter and sort row by row"""
+        query = query / np.linalg.norm(query)
+        filters = filters or {}
+        results = []
+        for embedding, meta in zip(self.embeddings, self.metadata):
+            if meta['chunk_id'] in deleted_chunks:
+                continue
+            if filters.get('jurisdiction') and meta['jurisdiction'] not in (None, filters['jurisdiction']):
+                continue
+            if filters.get('year_from') and meta['year'] and meta['year'] < filters['year_from']:
+                continue
+            if filters.get('year_to') and meta['year'] and meta['year'] > filters['year_to']:
+                continue
+            if 'document_ids' in filters and meta['document_id'] not in filters['document_ids']:
+                continue
+            if 'chunk_ids' in filters and meta['chunk_id'] not in filters['chunk_ids']:
+                continue
+            if meta['chunk_id'] in filters.get('exclude_chunk_ids', ()):
+                continue
+            score = float(embedding @ query / np.linalg.norm(embedding))
+            results.append((score, meta['chunk_id']))
+        results.sort(reverse=True)
+        return results[:k]
+    
+    def assertMatches(self, results, expected):
+        self.assertEqual([r['chunk_id'] for r in results], [chunk_id for _, chunk_id in expected])
+        np.testing.assert_allclose(
+            [r['score'] for r in results], [score for score, _ in expected], rtol=1e-5
+        )
+
+
+class VectorStoreSearchTests(BruteForceTestCase):
+    """Vectorised filters and argpartition top-k match an exact Python loop"""
+    
+    def test_search_matches_brute_force(self):
+        for filters in self.FILTERS:
+            for k in (1, 10, 500):
+                with self.subTest(filters=filters, k=k):
+                    self.assertMatches(
+                        self.store.search(self.queries[0], k=k, filters=filters),
+                        self._brute_force(self.queries[0], k, filters)
+                    )
+    
+    def test_search_many_matches_search(self):
+        for filters in self.FILTERS:
+            with self.subTest(filters=filters):
+                batched = self.store.search_many(self.queries, k=10, filters=filters)
+                for query, results in zip(self.queries, batched):
+                    self.assertMatches(results, self._brute_force(query, 10, filters))
+    
+    def test_quantized_rerank_from_mapped_snapshot(self):
+        for quantization in ('int8', 'float16'):
+            with self.subTest(quantization=quantization), tempfile.TemporaryDirectory() as path:
+                # A shortlist of every row makes the re-rank exhaustive
+                options = {'embedding_dim': 16, 'quantization': quantization, 'rerank_factor': 100}
+                store = NumpyVectorStore(**options)
+                store.add_vectors(self.embeddings[:300], self.metadata[:300])
+                store.save(path)
+                
+                # Snapshot rows mapped, later rows in the heap tail
+                store = NumpyVectorStore(**options)
+                store.load(path)
+                removed = store.remove_document(3)
+                deleted = {m['chunk_id'] for m in self.metadata[:300] if m['document_id'] == 3}
+                self.assertEqual(removed, len(deleted))
+                store.compact()
+                store.add_vectors(self.embeddings[300:], self.metadata[300:])
+                
+                for filters in self.FILTERS:
+                    self.assertMatches(
+                        store.search(self.queries[0], k=10, filters=filters),
+                        self._brute_force(self.queries[0], 10, filters, deleted)
+                    )
+                
+                store.save(path)
+                reloaded = NumpyVectorStore(**options)
+                reloaded.load(path)
+                self.assertMatches(
+                    reloaded.search(self.queries[1], k=10),
+                    self._brute_force(self.queries[1], 10, None, deleted)
+                )
+                
+                # Saving maps the float32 rows instead of keeping them on the heap
+                self.assertEqual(store.vectors.nbytes, 0)
+                self.assertLess(reloaded.nbytes, reloaded.size * 16 * 4)
+    
+    def test_quantized_search_recall(self):
+        for quantization in ('int8', 'float16'):
+            store = NumpyVectorStore(embedding_dim=16, quantization=quantization)
+            store.add_vectors(self.embeddings, self.metadata)
+            for filters in self.FILTERS:
+                with self.subTest(quantization=quantization, filters=filters):
+                    expected = self._brute_force(self.queries[1], 5, filters)
+                    results = store.search(self.queries[1], k=5, filters=filters)
+                    # Re-ranked scores are exact; the shortlist may rarely miss one
+                    found = {r['chunk_id'] for r in results} & {c for _, c in expected}
+                    self.assertGreaterEqual(len(found), len(expected) - 1)
+
+
+class IVFSearchTests(BruteForceTestCase):
+    """Probing every cell is exact; a selective filter widens the probe"""
+    
+    def setUp(self):
+        super().setUp()
+        self.store = IVFVectorStore(embedding_dim=16, nlist=8, nprobe=1, min_train_size=100)
+        self.store.add_vectors(self.embeddings, self.metadata)
+        self.store.train()
+    
+    def test_full_probe_matches_brute_force(self):
+        self.assertEqual(len(self.store.centroids), 8)
+        for filters in self.FILTERS:
+            for query in self.queries:
+                with self.subTest(filters=filters):
+                    self.assertMatches(
+                        self.store.search(query, k=10, filters=filters, nprobe=8),
+                        self._brute_force(query, 10, filters)
+                    )
+    
+    def test_selective_filter_widens_probe(self):
+        filters = {'document_ids': [2]}
+        matching = sum(1 for meta in self.metadata if meta['document_id'] == 2)
+        for i, query in enumerate(self.queries):
+            with self.subTest(query=i):
+                results = self.store.search(query, k=30, filters=filters)
+                # One cell holds far fewer than 30 rows of document 2
+                self.assertEqual(len(results), min(30, matching))
+                self.assertTrue(all(r['document_id'] == 2 for r in results))
+                scores = [r['score'] for r in results]
+                self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+class VectorStoreTombstoneTests(BruteForceTestCase):
+    """Removed documents disappear from search, snapshots and compaction"""
+    
+    def _deleted_chunks(self, *document_ids):
+        return {m['chunk_id'] for m in self.metadata if m['document_id'] in document_ids}
+    
+    def test_removed_rows_are_not_found(self):
+        deleted = self._deleted_chunks(2)
+        self.assertEqual(self.store.remove_document(2), len(deleted))
+        self.assertEqual(self.store.remove_document(2), 0)
+        self.assertEqual(self.store.live_size, 400 - len(deleted))
+        
+        for filters in self.FILTERS:
+            with self.subTest(filters=filters):
+                self.assertMatches(
+                    self.store.search(self.queries[0], k=10, filters=filters),
+                    self._brute_force(self.queries[0], 10, filters, deleted)
+                )
+    
+    def test_tombstones_survive_reload(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.store.save(path)
+            self.store.remove_document(4)
+            self.assertTrue(self.store.save_tombstones())
+            
+            reloaded = NumpyVectorStore(embedding_dim=16)
+            reloaded.load(path)
+            self.assertEqual(reloaded.live_size, self.store.live_size)
+            self.assertMatches(
+                reloaded.search(self.queries[1], k=10),
+                self._brute_force(self.queries[1], 10, None, self._deleted_chunks(4))
+            )
+    
+    def test_tombstones_need_a_current_snapshot(self):
+        self.store.remove_document(4)
+        self.assertFalse(self.store.save_tombstones())
+        
+        with tempfile.TemporaryDirectory() as path:
+            self.store.save(path)
+            other = NumpyVectorStore(embedding_dim=16)
+            other.load(path)
+            other.save(path)
+            
+            # The snapshot this store saved was replaced (and removed)
+            self.store.remove_document(5)
+            self.assertFalse(self.store.save_tombstones())
+    
+    def test_compaction_keeps_live_rows(self):
+        self.store.remove_document(1)
+        self.store.remove_document(6)
+        self.assertFalse(NumpyVectorStore(embedding_dim=16).maybe_compact())
+        
+        live = self.store.live_size
+        self.store.compact()
+        self.assertEqual(self.store.size, live)
+        self.assertEqual(self.store.live_size, live)
+        
+        # Deleting after a compaction uses the new row positions
+        self.store.remove_document(3)
+        deleted = self._deleted_chunks(1, 6, 3)
+        self.assertEqual(self.store.chunk_stats()[0], 400 - len(deleted))
+        for filters in self.FILTERS:
+            with self.subTest(filters=filters):
+                self.assertMatches(
+                    self.store.search(self.queries[2], k=10, filters=filters),
+                    self._brute_force(self.queries[2], 10, filters, deleted)
+                )
+    
+    def test_background_compaction(self):
+        self.store.compaction_threshold = 0.25
+        self.store.remove_document(1)
+        self.assertFalse(self.store.maybe_compact())
+        self.store.remove_document(2)
+        
+        with tempfile.TemporaryDirectory() as path:
+            self.assertTrue(self.store.maybe_compact(path))
+            self.store._compaction_thread.join()
+            
+            reloaded = NumpyVectorStore(embedding_dim=16)
+            reloaded.load(path)
+            self.assertEqual(reloaded.size, 400 - len(self._deleted_chunks(1, 2)))
+    
+    def test_background_compaction_keeps_newer_snapshot(self):
+        self.store.compaction_threshold = 0.25
+        
+        with tempfile.TemporaryDirectory() as path:
+            self.store.save(path)
+            other = NumpyVectorStore(embedding_dim=16)
+            other.load(path)
+            other.add_vectors(*_random_rows(np.random.default_rng(3), 5, first_chunk_id=401))
+            other.save(path)
+            
+            # This store's view is stale: compacting it must not replace
+            # the other process's snapshot
+            self.store.remove_document(1)
+            self.store.remove_document(2)
+            self.assertTrue(self.store.maybe_compact(path))
+            self.store._compaction_thread.join()
+            
+            reloaded = NumpyVectorStore(embedding_dim=16)
+            reloaded.load(path)
+            self.assertEqual(reloaded.size, 405)
+            self.assertEqual(reloaded.generation, other.generation)
+
+
+class EmbeddingCacheTests(TestCase):
+    """Cached chunk texts are served from the table without the encoder"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.vectors = {}
+        
+        def encode(texts, batch_size=32):
+            for text in texts:
+                self.vectors.setdefault(text, rng.normal(size=16).astype(np.float32))
+            return np.stack([self.vectors[text] for text in texts])
+        
+        self.encoder = mock.Mock(side_effect=encode)
+        self.cache = EmbeddingCache(max_entries=100)
+        self.cache.embedding_service = SimpleNamespace(
+            model_fingerprint='test-model', embedding_dim=16, encode=self.encoder
+        )
+    
+    def test_hit_skips_encoder(self):
+        texts = ['The tenant pays rent.', 'Notice is  due\nmonthly.', 'The tenant pays rent.']
+        first = self.cache.encode(texts)
+        # Each distinct text is encoded once and stored
+        self.encoder.assert_called_once_with(texts[:2], batch_size=32)
+        self.assertEqual(EmbeddingCacheEntry.objects.count(), 2)
+        
+        self.encoder.reset_mock()
+        # Whitespace differences map to the same entry
+        second = self.cache.encode(['Notice is due monthly.', 'The tenant pays rent.'])
+        self.encoder.assert_not_called()
+        np.testing.assert_array_equal(second, first[[1, 0]])
+        
+        self.cache.encode(['The tenant pays rent.', 'The landlord repairs.'])
+        self.encoder.assert_called_once_with(['The landlord repairs.'], batch_size=32)
+    
+    def test_pending_entries_are_stored_later(self):
+        self.cache.encode(['The tenant pays rent.'])
+        pending_entries, pending_hits = {}, set()
+        
+        self.cache.encode(
+            ['The tenant pays rent.', 'The landlord repairs.'],
+            pending_entries=pending_entries, pending_hits=pending_hits
+        )
+        self.assertEqual(set(pending_entries), {self.cache.key('The landlord repairs.')})
+        self.assertEqual(pending_hits, {self.cache.key('The tenant pays rent.')})
+        self.assertEqual(EmbeddingCacheEntry.objects.count(), 1)
+        
+        self.cache.store(pending_entries)
+        self.encoder.reset_mock()
+        self.cache.encode(['The landlord repairs.'])
+        self.encoder.assert_not_called()
+
+
+class ChunkerStreamTests(SimpleTestCase):
+    """iter_chunks over pages agrees with chunk_text and stays bounded"""
+    
+    def setUp(self):
+        self.chunker = DocumentChunker(chunk_size=500, chunk_overlap=100)
+    
+    def test_pages_match_joined_text(self):
+        sentences = [f"Clause {i} binds the tenant for {i % 12 + 1} months." for i in range(300)]
+        text = ' '.join(sentences)
+        pages = [text[start:start + 700] for start in range(0, len(text), 700)]
+        
+        streamed = [chunk['text'] for chunk in self.chunker.iter_chunks(pages)]
+        self.assertEqual(streamed, [chunk['text'] for chunk in self.chunker.chunk_text(text)])
+    
+    def test_pages_without_sentence_boundaries(self):
+        page = 'lorem ipsum dolor sit amet consectetur ' * 50
+        pages = [page] * 3000
+        
+        chunks = list(self.chunker.iter_chunks(iter(pages)))
+        self.assertEqual([chunk['ord'] for chunk in chunks], list(range(len(chunks))))
+        # Nothing is carried for more than about one page
+        self.assertLessEqual(
+            max(len(chunk['text']) for chunk in chunks),
+            2 * len(page) + self.chunker.chunk_overlap
+        )
+        self.assertGreaterEqual(
+            sum(len(chunk['text'].split()) for chunk in chunks),
+            len(page.split()) * len(pages)
+        )
+
+
+class InferenceSchedulerTests(SimpleTestCase):
+    """Admission order, rejection and expiry of the inference queue"""
+    
+    def _wait_all(self, scheduler, tickets, started):
+        """Wait on each ticket in its own thread, recording the start order"""
+        def run(ticket):
+            scheduler.wait(ticket)
+            started.append(ticket)
+            scheduler.release(ticket)
+        
+        threads = [threading.Thread(target=run, args=(ticket,)) for ticket in tickets]
+        for thread in threads:
+            thread.start()
+        while not all(ticket.waiting for ticket in tickets):
+            time.sleep(0.001)
+        return threads
+    
+    def test_priority_then_arrival_order(self):
+        scheduler = InferenceScheduler(slots=1, max_queue=8, timeout=10)
+        holder = scheduler.submit()
+        scheduler.wait(holder)
+        
+        tickets = [scheduler.submit(priority=priority) for priority in (1, 0, 1, 0)]
+        self.assertEqual([ticket.position for ticket in tickets], [0, 0, 2, 1])
+        
+        started = []
+        threads = self._wait_all(scheduler, tickets, started)
+        scheduler.release(holder)
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(started, [tickets[1], tickets[3], tickets[0], tickets[2]])
+        self.assertEqual(scheduler.stats()['completed'], 5)
+    
+    def test_full_queue_rejects(self):
+        scheduler = InferenceScheduler(slots=1, max_queue=2, timeout=10)
+        scheduler.wait(scheduler.submit())
+        queued = [scheduler.submit(), scheduler.submit()]
+        
+        with self.assertRaises(QueueFullError):
+            scheduler.submit()
+        self.assertEqual(scheduler.stats()['rejected'], 1)
+        
+        # Withdrawing a queued ticket makes room again
+        scheduler.release(queued[0])
+        scheduler.submit()
+        self.assertEqual(scheduler.stats()['queued'], 2)
+    
+    def test_deadline_expires(self):
+        scheduler = InferenceScheduler(slots=1, max_queue=4, timeout=10)
+        scheduler.wait(scheduler.submit())
+        ticket = scheduler.submit(timeout=0.05)
+        
+        with self.assertRaises(QueueTimeoutError):
+            scheduler.wait(ticket)
+        stats = scheduler.stats()
+        self.assertEqual((stats['timed_out'], stats['queued'], stats['running']), (1, 0, 1))
+    
+    def test_abandoned_ticket_does_not_block(self):
+        scheduler = InferenceScheduler(slots=1, max_queue=4, timeout=2)
+        abandoned = scheduler.submit()
+        ticket = scheduler.submit()
+        
+        # Only the second ticket is waited on; it gets the free slot at once
+        begin = time.monotonic()
+        scheduler.wait(ticket)
+        self.assertLess(time.monotonic() - begin, 1)
+        self.assertEqual(scheduler.stats()['running'], 1)
+        scheduler.release(ticket)
+        
+        # The abandoned ticket still queues until it is released (or expires)
+        self.assertEqual(scheduler.stats()['queued'], 1)
+        scheduler.release(abandoned)
+        self.assertEqual(scheduler.stats()['queued'], 0)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'summaries'}
+})
+class MapReduceSummarizerTests(SimpleTestCase):
+    """Long documents are summarised by section and the notes are reused"""
+    
+    def setUp(self):
+        self.engine = mock.Mock()
+        self.engine.count_tokens.side_effect = lambda text: len(text) // 4
+        self.engine.generate.side_effect = lambda prompt, **kwargs: {
+            'text': f"```\n- Note {len(prompt)}\n```"
+        }
+        self.summarizer = MapReduceSummarizer(
+            self.engine, InferenceScheduler(slots=2), n_ctx=1024, note_tokens=128
+        )
+        sentence = 'The tenant shall pay the rent on the first day of each month. '
+        self.text = sentence * 200
+    
+    def test_sections_fit_and_notes_are_cached(self):
+        job = self.summarizer.job(self.text, 'Lease', sha256='abc')
+        self.assertGreater(len(job.sections), 2)
+        for index, section in enumerate(job.sections):
+            section_prompt = SectionSummaryPrompt.build(section, 'Lease', index + 1, len(job.sections))
+            self.assertLessEqual(self.engine.count_tokens(section_prompt) + 128, 1024)
+        
+        prompt = job.run()
+        self.assertEqual(job.cached_sections, 0)
+        self.assertEqual(self.engine.generate.call_count, len(job.sections))
+        # Fences around each note are dropped before they are merged
+        self.assertEqual(prompt.count('- Note'), len(job.sections))
+        self.assertNotIn('```\n- Note', prompt)
+        self.assertLessEqual(self.engine.count_tokens(prompt), 1024 - 256)
+        
+        # A re-run reuses every section note and only rebuilds the final prompt
+        self.engine.generate.reset_mock()
+        again = self.summarizer.job(self.text, 'Lease', sha256='abc')
+        self.assertEqual(again.run(), prompt)
+        self.assertEqual(again.cached_sections, len(job.sections))
+        self.engine.generate.assert_not_called()
+        
+        # Without a document hash nothing is cached
+        self.assertEqual(self.summarizer.job(self.text, 'Lease').run(), prompt)
+        self.assertEqual(self.engine.generate.call_count, len(job.sections))
+
+
+class InferenceServiceEngineTests(SimpleTestCase):
+    """Document token counts use the engine the service generates with"""
+    
+    def _document_text(self, **model_config):
+        with override_settings(MODEL_CONFIG=dict(settings.MODEL_CONFIG, **model_config)):
+            service = InferenceService()
+        
+        document = SimpleNamespace(id=1, sha256=None)
+        with mock.patch.object(
+            text_extraction_service, 'extract_document', return_value='Clause 1.  Rent is due.'
+        ), mock.patch.object(
+            llm_engine, 'count_tokens', side_effect=AssertionError("local model used")
+        ):
+            return service, service.document_text(document)
+    
+    def test_worker_pool_counts_document_tokens(self):
+        with tempfile.TemporaryDirectory() as socket_dir, mock.patch.object(
+            RemoteLLMEngine, 'count_tokens', return_value=7
+        ) as count_tokens:
+            service, document = self._document_text(worker_socket_dir=socket_dir, workers=2)
+        
+        self.assertIsInstance(service.document_cache.engine, RemoteLLMEngine)
+        self.assertEqual(document, {'text': 'Clause 1. Rent is due.', 'tokens': 7})
+        count_tokens.assert_called_once_with('Clause 1. Rent is due.')
+    
+    def test_batched_engine_counts_document_tokens(self):
+        with mock.patch.object(batched_llm_engine, 'count_tokens', return_value=9) as count_tokens:
+            service, document = self._document_text(parallel_sequences=4)
+        
+        self.assertIs(service.document_cache.engine, batched_llm_engine)
+        self.assertEqual(document['tokens'], 9)
+        count_tokens.assert_called_once_with('Clause 1. Rent is due.')
+
+
+class WorkerAffinityTests(SimpleTestCase):
+    """Requests go back to the worker that holds their prompt prefixes"""
+    
+    def setUp(self):
+        self.engine = RemoteLLMEngine(socket_dir='/nonexistent', workers=3, claim_timeout=0)
+        self.idle = {0, 1, 2}
+        for name, patched in (
+            ('_try_lock', lambda index: index if index in self.idle else None),
+            ('_connect', lambda index: None),
+        ):
+            patcher = mock.patch.object(self.engine, name, side_effect=patched)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def claim(self, *cache_prefixes):
+        return self.engine._claim(cache_prefixes)[0]
+    
+    def test_prefix_returns_to_its_worker(self):
+        document = self.claim('system', 'system document')
+        for _ in range(4):
+            self.claim()
+            self.assertEqual(self.claim('system', 'system document'), document)
+        
+        # A request follows the longest of its prefixes seen before
+        self.idle.discard(document)
+        other = self.claim('other system')
+        self.idle.add(document)
+        self.assertEqual(self.claim('other system', 'other system document'), other)
+        self.assertEqual(self.claim('system', 'system second document'), document)
+    
+    def test_busy_worker_falls_back(self):
+        document = self.claim('system', 'system document')
+        self.idle.discard(document)
+        
+        fallback = self.claim('system', 'system document')
+        self.assertIn(fallback, self.idle)
+        self.assertEqual(self.claim('system', 'system document'), fallback)
+        
+        self.idle.clear()
+        with self.assertRaises(RuntimeError):
+            self.claim('system')
+
+
+class SearchBatchViewTests(TestCase):
+    """/search/batch rejects malformed query lists before searching"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('searcher'))
+    
+    def test_rejects_non_string_queries(self):
+        with mock.patch('api.views.rag_views.retrieval_service') as retrieval:
+            for queries in ([], 'lease', ['lease', 3], ['lease', None], [{'q': 'lease'}], ['lease', '  ']):
+                with self.subTest(queries=queries):
+                    response = self.client.post('/api/v1/search/batch', {'queries': queries}, format='json')
+                    self.assertEqual(response.status_code, 400)
+            retrieval.retrieve_many.assert_not_called()
+            
+            retrieval.retrieve_many.return_value = [[], []]
+            response = self.client.post('/api/v1/search/batch', {'queries': ['lease', 'rent']}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['data']['queries_count'], 2)
+
+
+class StreamingIngestionTests(TestCase):
+    """Documents too short to index are rejected before anything is embedded"""
+    
+    def _document(self, text):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False)
+        with handle:
+            handle.write(text)
+        self.addCleanup(os.remove, handle.name)
+        user, _ = User.objects.get_or_create(username='ingest')
+        return Document.objects.create(
+            user=user, title='Lease', doctype='contract', path=handle.name, sha256=''
+        )
+    
+    def test_short_document_is_not_embedded(self):
+        document = self._document('  Rent is due.  \n\n' + ' ' * 500)
+        with mock.patch.object(ingestion_service.embedding_cache, 'encode') as encode:
+            result = ingestion_service.ingest_document(document, save_index=False)
+        
+        self.assertFalse(result['success'])
+        self.assertIn('too short', result['error'])
+        encode.assert_not_called()
+        self.assertFalse(Chunk.objects.filter(document=document).exists())
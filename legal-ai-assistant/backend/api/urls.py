@@ -37,6 +37,7 @@ urlpatterns = [
     path('ingest', rag_views.ingest_document, name='ingest-document'),
     path('ingest/batch', rag_views.ingest_batch, name='ingest-batch'),
     path('search', rag_views.search, name='search'),
+    path('search/batch', rag_views.search_batch, name='search-batch'),
     path('rag/stats', rag_views.vector_store_stats, name='rag-stats'),
 ]
 
@@ -71,15 +71,17 @@ def chat(request):
     # Get document if needed
     document = None
     document_text = None
+    document_tokens = None
     document_title = None
     
     if mode in ['A', 'B']:
         try:
             document = Document.objects.get(id=doc_id, user=request.user)
             
-            # Load document text from file
-            with open(document.path, 'r', encoding='utf-8') as f:
-                document_text = f.read()
+            # Normalised text and token count, cached by document sha256
+            document_data = inference_service.document_text(document)
+            document_text = document_data['text']
+            document_tokens = document_data['tokens']
             
             document_title = document.title
             
@@ -104,6 +106,7 @@ def chat(request):
             
             context_passages = retrieval_service.retrieve_for_mode_c(
                 question=message,
+                user_id=request.user.id,
                 jurisdiction=filters.get('jurisdiction'),
                 year_from=filters.get('year_from'),
                 year_to=filters.get('year_to'),
@@ -137,7 +140,8 @@ def chat(request):
     if stream:
         return handle_streaming_chat(
             request, mode, message, document, document_text, 
-            document_title, context_passages, filters, user_settings
+            document_title, context_passages, filters, user_settings,
+            document_tokens
         )
     
     # Non-streaming response
@@ -148,6 +152,8 @@ def chat(request):
             message=message,
             document_text=document_text,
             document_title=document_title,
+            document_tokens=document_tokens,
+            document_sha256=document.sha256 if document else None,
             context_passages=context_passages,
             filters=filters,
             settings_override=user_settings,
@@ -155,10 +161,7 @@ def chat(request):
         )
         
         if not result.get('success'):
-            return Response({
-                'success': False,
-                'error': result.get('error', 'Unknown error')
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return inference_error_response(result)
         
         # Extract citations from processed response
         citations = []
@@ -214,24 +217,54 @@ def chat(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def inference_error_response(result):
+    """Error response for a failed inference call (429/503 when the queue rejects it)"""
+    error_code = result.get('error_code')
+    
+    if error_code == 'queue_full':
+        response_status = status.HTTP_429_TOO_MANY_REQUESTS
+    elif error_code == 'queue_timeout':
+        response_status = status.HTTP_503_SERVICE_UNAVAILABLE
+    else:
+        response_status = status.HTTP_500_INTERNAL_SERVER_ERROR
+    
+    response = Response({
+        'success': False,
+        'error': result.get('error', 'Unknown error'),
+        'error_code': error_code,
+    }, status=response_status)
+    
+    if result.get('retry_after'):
+        response['Retry-After'] = str(result['retry_after'])
+    
+    return response
+
+
 def handle_streaming_chat(request, mode, message, document, document_text, 
-                          document_title, context_passages, filters, user_settings):
+                          document_title, context_passages, filters, user_settings,
+                          document_tokens=None):
     """Handle streaming chat response"""
     
+    # Queue the request before the response starts, so a full queue can
+    # still be answered with a 429
+    stream = inference_service.chat(
+        mode=mode,
+        message=message,
+        document_text=document_text,
+        document_title=document_title,
+        document_tokens=document_tokens,
+        document_sha256=document.sha256 if document else None,
+        context_passages=context_passages,
+        filters=filters,
+        settings_override=user_settings,
+        stream=True,
+    )
+    
+    if isinstance(stream, dict):
+        return inference_error_response(stream)
+    
     def event_stream():
         try:
-            # Get streaming generator
-            stream = inference_service.chat(
-                mode=mode,
-                message=message,
-                document_text=document_text,
-                document_title=document_title,
-                context_passages=context_passages,
-                filters=filters,
-                settings_override=user_settings,
-                stream=True,
-            )
-            
             accumulated_text = ""
             tokens_in = 0
             
@@ -263,6 +296,10 @@ def handle_streaming_chat(request, mode, message, document, document_text,
                     chunk['chat_log_id'] = chat_log.id
                     yield f"data: {json.dumps(chunk)}\n\n"
                 
+                elif chunk['type'] == 'progress':
+                    # Section progress of a long Mode A document
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                
                 elif chunk['type'] == 'error':
                     yield f"data: {json.dumps(chunk)}\n\n"
         
@@ -6,12 +6,13 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from django.core.files.storage import default_storage
 from django.conf import settings
+from django.db import transaction
 import os
 import hashlib
-import PyPDF2
 
 from ..serializers import DocumentSerializer
 from ..models import Document, AuditLog
+from ..rag.text_extraction import text_extraction_service
 from ..utils.helpers import get_client_ip, get_user_agent
 
 import logging
@@ -150,18 +151,11 @@ def document_upload(request):
         
         if file_ext == '.pdf':
             try:
-                with open(file_path, 'rb') as pdf_file:
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-                    page_count = len(pdf_reader.pages)
-                    
-                    # Extract metadata
-                    if pdf_reader.metadata:
-                        meta_json['pdf_metadata'] = {
-                            'author': pdf_reader.metadata.get('/Author'),
-                            'creator': pdf_reader.metadata.get('/Creator'),
-                            'producer': pdf_reader.metadata.get('/Producer'),
-                            'subject': pdf_reader.metadata.get('/Subject'),
-                        }
+                pdf_info = text_extraction_service.pdf_info(file_path)
+                page_count = pdf_info['page_count']
+                
+                if 'pdf_metadata' in pdf_info:
+                    meta_json['pdf_metadata'] = pdf_info['pdf_metadata']
             except Exception as e:
                 logger.warning(f"Could not extract PDF metadata: {e}")
         
@@ -221,8 +215,22 @@ def document_delete(request, doc_id):
         if os.path.exists(document.path):
             os.remove(document.path)
         
+        # Load the partition while it still matches the database (so it
+        # is not rebuilt), and drop the vectors once the delete commits
+        from ..rag.vector_store import get_vector_store
+        vector_store = get_vector_store()
+        vector_store.partition(request.user.id)
+        
         # Delete database record (cascades to chunks)
-        document.delete()
+        with transaction.atomic():
+            transaction.on_commit(
+                lambda: vector_store.remove_document(request.user.id, doc_id)
+            )
+            document.delete()
+        
+        # Cached text is shared by identical uploads, keep it while one remains
+        if not Document.objects.filter(sha256=document.sha256).exists():
+            text_extraction_service.discard(document.sha256)
         
         # Audit log
         AuditLog.objects.create(
@@ -264,26 +272,17 @@ def document_content(request, doc_id):
     try:
         document = Document.objects.get(id=doc_id, user=request.user)
         
-        # Read file content
+        # Read file content (PDF text is extracted once, then cached)
         file_ext = os.path.splitext(document.path)[1].lower()
         
-        if file_ext == '.txt':
-            with open(document.path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        
-        elif file_ext == '.pdf':
-            content = ""
-            with open(document.path, 'rb') as pdf_file:
-                pdf_reader = PyPDF2.PdfReader(pdf_file)
-                for page in pdf_reader.pages:
-                    content += page.extract_text() + "\n"
-        
-        else:
+        if file_ext not in ('.txt', '.pdf'):
             return Response({
                 'success': False,
                 'error': 'Unsupported file type'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        content = text_extraction_service.extract_document(document)
+        
         return Response({
             'success': True,
             'data': {
@@ -13,6 +13,9 @@ from ..models import AuditLog
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on queries accepted by /search/batch
+MAX_BATCH_QUERIES = 64
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -127,6 +130,7 @@ def search(request):
             "jurisdiction": "US",
             "year_from": 2015,
             "year_to": 2024,
+            "document_ids": [1, 2],
             "include": ["keyword1"],
             "exclude": ["keyword2"]
         }
@@ -146,6 +150,7 @@ def search(request):
         # Retrieve relevant chunks
         results = retrieval_service.retrieve(
             query=query,
+            user_id=request.user.id,
             k=k,
             filters=filters
         )
@@ -167,6 +172,72 @@ def search(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def search_batch(request):
+    """
+    Search for several queries in one request
+    POST /api/v1/search/batch
+    Body: {
+        "queries": ["...", "..."],
+        "k": 10,
+        "filters": { ... same as /search, applied to every query ... }
+    }
+    """
+    queries = request.data.get('queries')
+    k = request.data.get('k', 10)
+    filters = request.data.get('filters', {})
+    
+    if not queries or not isinstance(queries, list):
+        return Response({
+            'success': False,
+            'error': 'queries must be a non-empty list'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if len(queries) > MAX_BATCH_QUERIES:
+        return Response({
+            'success': False,
+            'error': f'At most {MAX_BATCH_QUERIES} queries per request'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+        return Response({
+            'success': False,
+            'error': 'every query must be a non-empty string'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Encode and score all queries together
+        results = retrieval_service.retrieve_many(
+            queries=queries,
+            user_id=request.user.id,
+            k=k,
+            filters=filters
+        )
+        
+        return Response({
+            'success': True,
+            'data': {
+                'queries_count': len(queries),
+                'results': [
+                    {
+                        'query': query,
+                        'results_count': len(query_results),
+                        'results': query_results
+                    }
+                    for query, query_results in zip(queries, results)
+                ]
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"Batch search endpoint error: {e}", exc_info=True)
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def vector_store_stats(request):
@@ -188,9 +259,13 @@ def vector_store_stats(request):
         return Response({
             'success': True,
             'data': {
-                'total_vectors': vector_store.size,
+                'total_vectors': vector_store.partition_size(request.user.id),
                 'user_chunks': user_chunks,
                 'embedding_dimension': vector_store.embedding_dim,
+                'loaded_partitions': vector_store.loaded_partitions,
+                'index_memory_bytes': vector_store.nbytes,
+                'query_cache': retrieval_service.query_cache.stats(),
+                'embedding_batches': retrieval_service.query_cache.embedding_batcher.stats(),
             }
         })
         
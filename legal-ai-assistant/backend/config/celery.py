@@ -1,6 +1,7 @@
 # config/celery.py
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 # Set default Django settings
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -15,6 +16,15 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def warm_up_worker(**kwargs):
+    """Load the persisted RAG index (and the embedding model, if enabled) at worker boot"""
+    from api.rag.vector_store import warm_up_vector_store
+    from api.rag.embeddings import warm_up_embedding_model
+    warm_up_vector_store()
+    warm_up_embedding_model('worker_warm_load')
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
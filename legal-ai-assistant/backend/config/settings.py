@@ -137,6 +137,91 @@ MODEL_CONFIG = {
     'top_p': float(os.getenv('TOP_P', 0.9)),
     'top_k': int(os.getenv('TOP_K', 50)),
     'max_tokens': int(os.getenv('MAX_TOKENS', 256)),
+    # Mode A/B document text + token count cache (per-process LRU, optionally
+    # shared via CACHES), keyed by document sha256
+    'document_cache_size': int(os.getenv('DOCUMENT_CACHE_SIZE', 32)),
+    'document_cache_ttl': int(os.getenv('DOCUMENT_CACHE_TTL', 86400)),
+    'document_cache_shared': os.getenv('DOCUMENT_CACHE_SHARED', 'True') == 'True',
+    # KV state snapshots of repeated prompt prefixes (mode system blocks,
+    # Mode A/B documents); 0 = disabled. A prefix is snapshotted once it
+    # has been requested prefix_cache_min_uses times
+    'prefix_cache_mb': int(os.getenv('PREFIX_CACHE_MB', 1024)),
+    'prefix_cache_min_uses': int(os.getenv('PREFIX_CACHE_MIN_USES', 2)),
+    # Requests waiting for the engine beyond this are rejected (HTTP 429);
+    # a request not started within queue_timeout seconds gets HTTP 503
+    'queue_max_size': int(os.getenv('INFERENCE_QUEUE_MAX_SIZE', 16)),
+    'queue_timeout': float(os.getenv('INFERENCE_QUEUE_TIMEOUT', 60)),
+    # LLM worker pool (manage.py run_llm_workers): when worker_socket_dir is
+    # set, web processes generate on the workers instead of loading the
+    # model themselves. Each worker owns one model copy and worker_threads cores
+    'worker_socket_dir': os.getenv('LLM_WORKER_SOCKET_DIR', ''),
+    'workers': int(os.getenv('LLM_WORKERS', 1)),
+    'worker_threads': int(os.getenv('LLM_WORKER_THREADS', 0)),  # 0 = cores / workers
+    # Continuous batching: above 1, this process decodes up to
+    # parallel_sequences requests together in one context of batch_n_ctx
+    # KV cells (0 = n_ctx for each sequence)
+    'parallel_sequences': int(os.getenv('LLM_PARALLEL_SEQUENCES', 1)),
+    'batch_n_ctx': int(os.getenv('LLM_BATCH_CTX', 0)),
+    # Mode A documents longer than n_ctx are summarised section by section
+    # (up to summary_note_tokens of notes each) and the notes merged; notes
+    # are cached by document sha256 for summary_cache_ttl seconds
+    'summary_note_tokens': int(os.getenv('SUMMARY_NOTE_TOKENS', 384)),
+    'summary_cache_ttl': int(os.getenv('SUMMARY_CACHE_TTL', 7 * 86400)),
+}
+
+# Embedding model settings
+EMBEDDING_CONFIG = {
+    # sentence-transformers model directory (falls back to the hub by its name)
+    'model_path': os.getenv(
+        'EMBEDDING_MODEL_PATH',
+        str(BASE_DIR / 'api' / 'rag' / 'local_models' / 'all-MiniLM-L6-v2')
+    ),
+    # 'torch' (sentence-transformers) or 'onnx' (ONNX Runtime, no torch import)
+    'backend': os.getenv('EMBEDDING_BACKEND', 'torch'),
+    # Exported model relative to the model directory; use
+    # onnx/model_qint8.onnx for the int8-quantised export
+    'onnx_file': os.getenv('EMBEDDING_ONNX_FILE', 'onnx/model.onnx'),
+    'onnx_threads': int(os.getenv('EMBEDDING_ONNX_THREADS', 0)),  # 0 = ONNX Runtime default
+    # Load the model at web server boot instead of on first encode, and
+    # likewise in Celery workers (off: most tasks never embed)
+    'warm_load': os.getenv('EMBEDDING_WARM_LOAD', 'True') == 'True',
+    'worker_warm_load': os.getenv('EMBEDDING_WORKER_WARM_LOAD', 'False') == 'True',
+}
+
+# RAG settings
+RAG_CONFIG = {
+    'index_dir': os.getenv('RAG_INDEX_DIR', str(BASE_DIR.parent / 'data' / 'index')),
+    'warm_load': os.getenv('RAG_WARM_LOAD', 'True') == 'True',
+    # Loaded per-user index partitions beyond this are evicted (LRU)
+    'partition_budget_mb': int(os.getenv('RAG_PARTITION_BUDGET_MB', 1024)),
+    # Index backend: 'numpy' (exact brute force) or 'ivf' (approximate)
+    'backend': os.getenv('RAG_INDEX_BACKEND', 'numpy'),
+    'ivf_nlist': int(os.getenv('RAG_IVF_NLIST', 0)),  # 0 = ~4*sqrt(n)
+    'ivf_nprobe': int(os.getenv('RAG_IVF_NPROBE', 8)),
+    'ivf_min_train_size': int(os.getenv('RAG_IVF_MIN_TRAIN_SIZE', 20000)),
+    # Scan representation: '' (float32), 'int8' or 'float16'; the top
+    # rerank_factor * k candidates are re-scored exactly in float32
+    'quantization': os.getenv('RAG_QUANTIZATION', '') or None,
+    'rerank_factor': int(os.getenv('RAG_RERANK_FACTOR', 4)),
+    # Compact a partition in the background once this fraction is deleted
+    'compaction_threshold': float(os.getenv('RAG_COMPACTION_THRESHOLD', 0.2)),
+    # Max chunk embeddings kept in the embedding cache table (0 = disabled)
+    'embedding_cache_size': int(os.getenv('RAG_EMBEDDING_CACHE_SIZE', 200000)),
+    # Query embedding cache (per-process LRU, optionally shared via CACHES)
+    'query_cache_size': int(os.getenv('RAG_QUERY_CACHE_SIZE', 1024)),
+    'query_cache_ttl': int(os.getenv('RAG_QUERY_CACHE_TTL', 3600)),
+    'query_cache_shared': os.getenv('RAG_QUERY_CACHE_SHARED', 'False') == 'True',
+    # Concurrent query encodes are gathered into one forward pass
+    'embedding_batch_size': int(os.getenv('RAG_EMBEDDING_BATCH_SIZE', 64)),
+    'embedding_batch_wait_ms': float(os.getenv('RAG_EMBEDDING_BATCH_WAIT_MS', 2)),
+    # Processes for bulk ingestion (extract/chunk/embed); 0 = one per core
+    'ingestion_workers': int(os.getenv('RAG_INGESTION_WORKERS', 1)),
+    # Extracted PDF text, cached on disk by document sha256
+    'text_cache_dir': os.getenv('RAG_TEXT_CACHE_DIR', str(BASE_DIR.parent / 'data' / 'text_cache')),
+    # Processes for extracting one large PDF (0 = one per core), and the
+    # page count from which extraction is split across them
+    'extraction_workers': int(os.getenv('RAG_EXTRACTION_WORKERS', 0)),
+    'extraction_parallel_min_pages': int(os.getenv('RAG_EXTRACTION_PARALLEL_MIN_PAGES', 32)),
 }
 
 # Logging
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Load the persisted RAG index and embedding model before the first request arrives
+from api.rag.vector_store import warm_up_vector_store  # noqa: E402
+from api.rag.embeddings import warm_up_embedding_model  # noqa: E402
+
+warm_up_vector_store()
+warm_up_embedding_model()
@@ -48,7 +48,7 @@ def test_rag():
     if chunk_count > 0:
         sample_chunk = Chunk.objects.filter(document=document).first()
         print(f"   Sample chunk text: {sample_chunk.text[:100]}...")
-        print(f"   Has embedding: {sample_chunk.embedding_json is not None}\n")
+        print(f"   Has embedding: {sample_chunk.embedding is not None}\n")
     
     # 4. Test Retrieval
     print("4. Testing Retrieval")
@@ -60,7 +60,7 @@ def test_rag():
     
     for query in queries:
         print(f"\n   Query: '{query}'")
-        results = retrieval_service.retrieve(query, k=3)
+        results = retrieval_service.retrieve(query, document.user_id, k=3)
         
         if results:
             print(f"   Found {len(results)} results:")
@@ -76,6 +76,7 @@ def test_rag():
     
     context_passages = retrieval_service.retrieve_for_mode_c(
         question=question,
+        user_id=document.user_id,
         k=3
     )
     
@@ -92,7 +93,7 @@ def test_rag():
     from api.rag.vector_store import get_vector_store
     vector_store = get_vector_store()
     
-    print(f"   Total vectors: {vector_store.size}")
+    print(f"   Total vectors: {vector_store.partition_size(document.user_id)}")
     print(f"   Embedding dimension: {vector_store.embedding_dim}")
     
     print("\n" + "="*60)